@@ -1,10 +1,30 @@
 #!/usr/bin/env python3
 import os
+import sys
 import tarfile
 import subprocess
 import shutil
 import csv
 import time
+import argparse
+import resource
+import signal
+import tempfile
+import hashlib
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import Hash_calculator
+import battle_cache
+import battle_engine
+import battle_scheduler
+import grading_metrics
+import results_store
+import run_journal
+import stage_trace
+import warrior_cache
+import warrior_similarity
 
 TARBALLS_DIR = 'tarballs'
 SUBMISSIONS_DIR = 'submissions'
@@ -12,12 +32,53 @@ BASIC_DIR = 'basic_warriors'
 CORE_DIR = 'core'
 INDIVIDUAL_SCORE_DIR = os.path.join(CORE_DIR, 'individual_scores')
 FINAL_RESULTS_CSV = 'final_results.csv'
+MANIFEST_FILE = os.path.join(CORE_DIR, 'first_eval_manifest.json')
+# Students graded by the current run; folded into MANIFEST_FILE when it ends.
+RUN_JOURNAL = os.path.join(CORE_DIR, 'first_eval.journal')
 MAPPING_CSV = 'Env_variables.csv'  
 
 BASIC_WARRIORS = ['basic1.red', 'basic2.red', 'basic3.red']
 TIMEOUT_SECONDS = 30
+# Per-process limits for every make and whatever it starts.
+BUILD_LIMITS = {
+    resource.RLIMIT_CPU: TIMEOUT_SECONDS,
+    resource.RLIMIT_AS: 2 * 1024 ** 3,
+    resource.RLIMIT_NOFILE: 256,
+    resource.RLIMIT_FSIZE: 64 * 1024 ** 2,
+}
+# RLIMIT_NPROC counts every process of the user, so it is set relative to
+# what is already running when grading starts.
+BUILD_MAX_PROCESSES = 256
+_nproc_limit = None
+_nproc_lock = threading.Lock()
+# Sets the rlimits given as resource/value pairs, then execs the command
+# after '--'. preexec_fn is not safe while other threads are running
+# (make threads, the scheduler loop), so the limits are applied here.
+_LIMITED_EXEC = '''import os, sys, resource
+args = sys.argv[1:]
+split = args.index('--')
+for i in range(0, split, 2):
+    value = int(args[i + 1])
+    resource.setrlimit(int(args[i]), (value, value))
+os.execvp(args[split + 1], args[split + 1:])
+'''
+# Hash_calculator's manifest, filled in as students are recorded so that it
+# does not have to read the warriors again.
+warrior_hashes = None
+# The results database, opened by main.
+store = None
+# Builds and basic-warrior battles of the student being graded, for the
+# results database: {'builds': [(warrior, ok, usage)], 'battles': [(warrior, basic, result)]}.
+_grading_facts = None
+ENGINE = 'pmars'
+EARLY_STOP = None
+SCHEDULER = None
 
 def extract_tarball(tarball_path, student_folder):
+    with stage_trace.span('extract', tarball=tarball_path):
+        _extract_tarball(tarball_path, student_folder)
+
+def _extract_tarball(tarball_path, student_folder):
     try:
         mode = 'r:gz' if tarball_path.endswith(('.tar.gz', '.tgz')) else 'r'
         with tarfile.open(tarball_path, mode) as tar:
@@ -26,29 +87,96 @@ def extract_tarball(tarball_path, student_folder):
     except Exception as e:
         print(f"Error extracting {tarball_path}: {e}")
 
-def run_make(student_folder, target=None, timeout=TIMEOUT_SECONDS):
-    cmd = ['make'] + ([target] if target else [])
+def _user_process_count():
     try:
-        proc = subprocess.run(cmd, cwd=student_folder,
-                              capture_output=True, text=True, timeout=timeout)
-        return True, proc.stdout.strip().splitlines()
-    except subprocess.TimeoutExpired:
-        print(f"Make command timed out after {timeout} seconds in {student_folder}")
-        return False, []
+        uid = os.getuid()
+        return sum(1 for p in os.listdir('/proc') if p.isdigit() and os.stat(f'/proc/{p}').st_uid == uid)
+    except OSError:
+        return 0
+
+def limited_command(cmd):
+    """cmd wrapped so that it runs under BUILD_LIMITS and the process limit."""
+    global _nproc_limit
+    with _nproc_lock:
+        if _nproc_limit is None:
+            _nproc_limit = _user_process_count() + BUILD_MAX_PROCESSES
+        nproc = _nproc_limit
+    args = []
+    for res, value in list(BUILD_LIMITS.items()) + [(resource.RLIMIT_NPROC, nproc)]:
+        hard = resource.getrlimit(res)[1]
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        args += [str(res), str(value)]
+    return [sys.executable, '-I', '-c', _LIMITED_EXEC] + args + ['--'] + cmd
+
+def describe_usage(usage):
+    if not usage:
+        return "no resource usage recorded"
+    return f"{usage['cpu']:.2f}s CPU, {usage['maxrss_kb'] // 1024} MiB max RSS"
+
+def run_make(student_folder, target=None, timeout=None, env=None):
+    """Run make in its own session under BUILD_LIMITS.
+
+    Returns (finished in time, output lines, resource usage). On timeout the
+    whole process group is killed, and anything the build left running in
+    the background is killed once make exits.
+    """
+    timeout = timeout or TIMEOUT_SECONDS
+    cmd = limited_command(['make'] + ([target] if target else []))
+    start = time.time()
+    grading_metrics.gauge_add('grading_builds_in_flight', 1)
+    try:
+        out = tempfile.TemporaryFile()
+        proc = subprocess.Popen(cmd, cwd=student_folder, env=env, stdin=subprocess.DEVNULL,
+                                stdout=out, stderr=subprocess.STDOUT,
+                                start_new_session=True)
     except Exception as e:
         print(f"Error running make in {student_folder}: {e}")
-        return True, []
+        grading_metrics.gauge_add('grading_builds_in_flight', -1)
+        return True, [], None
+
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    while True:
+        pid, status, ru = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            break
+        if time.monotonic() >= deadline:
+            timed_out = True
+            os.killpg(proc.pid, signal.SIGKILL)
+            pid, status, ru = os.wait4(proc.pid, 0)
+            break
+        time.sleep(0.05)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    usage = {'cpu': ru.ru_utime + ru.ru_stime, 'maxrss_kb': ru.ru_maxrss}
+    stage_trace.record('make', start, time.time() - start, folder=student_folder, timed_out=timed_out,
+                       cpu=usage['cpu'], child_maxrss_kb=usage['maxrss_kb'])
+    grading_metrics.gauge_add('grading_builds_in_flight', -1)
+    grading_metrics.build_finished(time.time() - start, timed_out)
+    out.seek(0)
+    lines = out.read().decode(errors='replace').strip().splitlines()
+    out.close()
+    if timed_out:
+        print(f"Make command timed out after {timeout} seconds in {student_folder}")
+        return False, [], usage
+    return True, lines, usage
 
 def run_corewar_against_basic(warrior_file, basic_warrior):
     basic_wrior_path = os.path.join(BASIC_DIR, basic_warrior)
-    cmd = ['pmars', '-r', '500', '-f', warrior_file, basic_wrior_path]
-    try:
-        proc = subprocess.run(cmd, capture_output=True, text=True)
-        lines = proc.stdout.strip().splitlines()
-        return lines[-1] if lines else ""
-    except Exception as e:
-        print(f"Error running pmars against basic warrior: {e}")
-        return ""
+    return battle_engine.run_battle(warrior_file, basic_wrior_path, 500, ENGINE, EARLY_STOP)
+
+def run_corewar_against_basics(warrior_file):
+    """Fight all basic warriors at once; return {basic warrior: result line}."""
+    jobs = [(warrior_file, os.path.join(BASIC_DIR, b), 500, ENGINE, EARLY_STOP) for b in BASIC_WARRIORS]
+    results = {}
+    for i, result in battle_engine.battles_as_completed(jobs):
+        results[BASIC_WARRIORS[i]] = result
+        print(f"{warrior_file} vs {BASIC_WARRIORS[i]} finished: {result or 'Invalid'}")
+    return results
 
 def parse_result(result_line):
     try:
@@ -61,17 +189,10 @@ def parse_result(result_line):
 
 def validate_warrior(student_folder, warrior_filename):
     warrior_path = os.path.join(student_folder, warrior_filename)
-    try:
-        proc = subprocess.run(['pmars', warrior_path], capture_output=True, text=True)
-        output = proc.stdout.strip().splitlines()
-    except Exception as e:
-        print(f"Error running pmars for validation: {e}")
-        return False, []
-    
-    valid = bool(output and "scores" in output[-1].lower())
-    return valid, output
+    with stage_trace.span('validate', warrior=warrior_path):
+        return battle_engine.validate(warrior_path, ENGINE)
 
-def evaluate_warrior(student_folder, warrior_filename, student_name):
+def evaluate_warrior(student_folder, warrior_filename, student_name, warrior=None):
     valid, validation_output = validate_warrior(student_folder, warrior_filename)
     details = []
     if validation_output:
@@ -85,8 +206,11 @@ def evaluate_warrior(student_folder, warrior_filename, student_name):
     score = 20
     details.append(f"Validation passed for {warrior_filename}: +20 points")
     warrior_path = os.path.join(student_folder, warrior_filename)
+    results = run_corewar_against_basics(warrior_path)
     for basic in BASIC_WARRIORS:
-        result = run_corewar_against_basic(warrior_path, basic)
+        result = results[basic]
+        if _grading_facts is not None:
+            _grading_facts['battles'].append((warrior, basic, result))
         parsed = parse_result(result)
         if parsed and parsed[0] > parsed[1]:
             score += 10
@@ -95,6 +219,21 @@ def evaluate_warrior(student_folder, warrior_filename, student_name):
             details.append(f"Battle vs {basic}: {result or 'Invalid'} -> +0")
     return score, "\n".join(details)
 
+def add_similarity_notes(threshold=warrior_similarity.THRESHOLD):
+    """Append identical and near-identical warriors, within a student and
+    across the class, to the individual score files."""
+    pairs = warrior_similarity.find_similar(warrior_similarity.submission_warriors(), threshold)
+    for student, notes in warrior_similarity.student_notes(pairs).items():
+        path = os.path.join(INDIVIDUAL_SCORE_DIR, f"{student}_Score.txt")
+        if not os.path.exists(path):
+            continue
+        with open(path, 'a') as f:
+            f.write("\nSimilar warriors:\n")
+            f.writelines(n + "\n" for n in notes)
+        if store:
+            store.record_notes(student, notes)
+    print(f"Similarity check: {len(pairs)} similar warrior pairs")
+
 def update_individual_score(student_name, score, details=""):
     path = os.path.join(INDIVIDUAL_SCORE_DIR, f"{student_name}_Score.txt")
     try:
@@ -107,56 +246,92 @@ def update_individual_score(student_name, score, details=""):
     except Exception as e:
         print(f"Error updating score for {student_name}: {e}")
 
-def process_student_submission(tarball, house_num, env_var):
+def build_env(env_var, enabled):
+    env = {k: v for k, v in os.environ.items() if k != env_var}
+    if enabled:
+        env[env_var] = '1'
+    return env
+
+def clone_tree(src, dst):
+    """Copy src to dst, sharing file blocks (reflink) where the filesystem allows.
+
+    Hardlinks are not used: a Makefile that truncates or appends to a file it
+    shipped with would change it in both copies.
+    """
+    try:
+        subprocess.run(['cp', '-a', '--reflink=auto', src, dst], check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError):
+        shutil.rmtree(dst, ignore_errors=True)
+        shutil.copytree(src, dst, symlinks=True)
+
+def build_both_warriors(student_folder, env_var):
+    """Run make without and with the secret variable at the same time, each in
+    its own copy of the extracted tree. Returns the two (success, usage, build dir)."""
+    parent, name = os.path.split(student_folder)
+    build_dirs = [os.path.join(parent, f".{name}.build{i}") for i in (1, 2)]
+    for d in build_dirs:
+        shutil.rmtree(d, ignore_errors=True)
+        clone_tree(student_folder, d)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        builds = [pool.submit(run_make, d, env=build_env(env_var, enabled))
+                  for d, enabled in zip(build_dirs, (False, True))]
+        return [(b.result()[0], b.result()[2], d) for b, d in zip(builds, build_dirs)]
+
+def grade_student(tarball, house_num, env_var):
+    global _grading_facts
+    _grading_facts = {'builds': [], 'battles': []}
+    stage_trace.set_student(tarball.split('.', 1)[0])
+    with stage_trace.span(stage_trace.STUDENT_STAGE, house=str(house_num)):
+        return _grade_student(tarball, house_num, env_var)
+
+def _grade_student(tarball, house_num, env_var):
     student_name = tarball.split('.', 1)[0]
     house_folder = os.path.join(SUBMISSIONS_DIR, f"House_{house_num}")
     student_folder = os.path.join(house_folder, f"{student_name}")
     os.makedirs(student_folder, exist_ok=True)
 
-
-    with open(os.path.join(house_folder, "submissions.txt"), "a") as f:
-        f.write(f"{student_name}\n")
-
     extract_tarball(os.path.join(TARBALLS_DIR, tarball), student_folder)
 
-    warrior1_path = os.path.join(student_folder, 'chooseyourfighter.red')
+    print(f"Generating warrior1 and, with {env_var}=1, warrior2 for {student_name}")
+    (success1, usage1, build1), (success2, usage2, build2) = build_both_warriors(student_folder, env_var)
+    _grading_facts['builds'] = [(1, success1, usage1), (2, success2, usage2)]
+    # The student folder ends up as the warrior2 build, as if make had run
+    # there with the variable set.
+    shutil.rmtree(student_folder)
+    os.replace(build2, student_folder)
+
+    warrior1_path = os.path.join(build1, 'chooseyourfighter.red')
     warrior1_copy_path = os.path.join(student_folder, 'warrior1.red')
-    print(f"Generating warrior1 for {student_name}")
-    
-    success1, _ = run_make(student_folder)
+    warrior2_path = os.path.join(student_folder, 'chooseyourfighter.red')
+
     if not success1:
         print(f"Make timed out for {student_name}'s warrior1.")
         score1 = 0
-        det1 = "Warrior1 build timed out after 30 seconds.\n"
+        det1 = f"Warrior1 build timed out after {TIMEOUT_SECONDS} seconds.\n"
         open(warrior1_copy_path, 'w').close()
     elif not os.path.exists(warrior1_path) or os.path.getsize(warrior1_path) == 0:
-        print("Path exists?... " + str(os.path.exists(warrior1_path)))
-        print("Path size... " + str(os.path.getsize(warrior1_path)))
-        print("Warrior path is... " + str(warrior1_path))
         print(f"Warrior1 missing/empty for {student_name}.")
         score1 = 0
         det1 = "Warrior1 was missing or empty after build.\n"
-        open(warrior1_path, 'w').close()
     else:
         shutil.copy(warrior1_path, warrior1_copy_path)
-        score1, det1 = evaluate_warrior(student_folder, 'chooseyourfighter.red', student_name)
+        score1, det1 = evaluate_warrior(build1, 'chooseyourfighter.red', student_name, 1)
+    shutil.rmtree(build1, ignore_errors=True)
 
     total = score1
-    details = f"Warrior1 Evaluation:\n{det1}\n"
+    details = f"Warrior1 Evaluation:\nBuild: {describe_usage(usage1)}\n{det1}\n"
+    details += f"\nWarrior2 build: {describe_usage(usage2)}\n"
 
-    os.environ[env_var] = '1'
-    print(f"Env var {env_var}=1 for {student_name}, generating warrior2")
-    success2, _ = run_make(student_folder)
     if not success2:
         print(f"Make timed out for {student_name}'s warrior2.")
         score2 = 0
-        details += "Warrior2 build timed out after 30 seconds, skipping evaluation.\n"
-        open(warrior1_path, 'w').close()
+        details += f"Warrior2 build timed out after {TIMEOUT_SECONDS} seconds, skipping evaluation.\n"
+        open(warrior2_path, 'w').close()
         invalid2 = os.path.join(student_folder, 'Invalid.txt')
         with open(invalid2, 'w') as f:
-            f.write("Warrior2 build timed out. Took more than 30 seconds.\n")
+            f.write(f"Warrior2 build timed out. Took more than {TIMEOUT_SECONDS} seconds.\n")
         print(f"Created Invalid.txt for {student_name} due to warrior2 timeout")
-    elif not os.path.exists(warrior1_path) or os.path.getsize(warrior1_path) == 0:
+    elif not os.path.exists(warrior2_path) or os.path.getsize(warrior2_path) == 0:
         print(f"Warrior2 missing/empty for {student_name}.")
         score2 = 0
         details += "Warrior2 was missing or empty after build.\n"
@@ -165,34 +340,250 @@ def process_student_submission(tarball, house_num, env_var):
             f.write("Warrior2 was missing or empty after build.\n")
         print(f"Created Invalid.txt for {student_name} due to warrior2 missing")
     else:
-        score2, det2 = evaluate_warrior(student_folder, 'chooseyourfighter.red', student_name)
+        score2, det2 = evaluate_warrior(student_folder, 'chooseyourfighter.red', student_name, 2)
         total += score2
         details += f"\nWarrior2 Evaluation:\n{det2}\n"
         if os.path.exists(warrior1_copy_path):
-            with open(warrior1_copy_path, 'r') as f1, open(warrior1_path, 'r') as f2:
-                if f1.read() == f2.read():
-                    total //= 2
-                    details += "\nWarrior1 and Warrior2 are identical. Total score halved.\n"
-                else:
-                    details += "\nWarrior1 and Warrior2 are different. Full score retained.\n"
-
-    del os.environ[env_var]
-    time.sleep(2)
+            with open(warrior1_copy_path) as f1, open(warrior2_path) as f2:
+                identical = f1.read() == f2.read()
+            # The similarity after assembly is only reported, it does not
+            # change the score.
+            score = warrior_similarity.similarity(warrior1_copy_path, warrior2_path)
+            if identical:
+                total //= 2
+                details += "\nWarrior1 and Warrior2 are identical. Total score halved.\n"
+            else:
+                details += "\nWarrior1 and Warrior2 are different. Full score retained.\n"
+            details += f"Warrior1/Warrior2 similarity: {score:.2f}\n"
+
+    return student_name, total, details
+
+def add_submission_line(house_num, student_name):
+    sf = os.path.join(SUBMISSIONS_DIR, f"House_{house_num}", "submissions.txt")
+    with open(sf, 'a') as f:
+        f.write(student_name + "\n")
+
+def write_results_csv(rows):
+    # Replaced whole, so a crash never leaves a half-written row behind.
+    tmp = FINAL_RESULTS_CSV + ".tmp"
+    with open(tmp, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+    os.replace(tmp, FINAL_RESULTS_CSV)
+
+def append_result_row(house_num, tarball, total):
+    with open(FINAL_RESULTS_CSV, 'a', newline='') as f:
+        csv.writer(f).writerow([str(house_num), tarball, str(total)])
+
+def compact_outputs():
+    """Rows and names are only appended while grading; once at the end, keep
+    one row per tarball in final_results.csv (where it first appeared, with
+    its latest grade) and list each student once, in its latest house's
+    submissions.txt only."""
+    with open(FINAL_RESULTS_CSV, newline='') as f:
+        rows = list(csv.reader(f))
+    latest = {}
+    for r in rows[1:]:
+        if len(r) >= 2:
+            latest[r[1]] = r
+    compact, seen = rows[:1], set()
+    for r in rows[1:]:
+        if len(r) < 2:
+            compact.append(r)
+        elif r[1] not in seen:
+            seen.add(r[1])
+            compact.append(latest[r[1]])
+    if compact != rows:
+        write_results_csv(compact)
+
+    house_of = {tb.split('.', 1)[0]: r[0] for tb, r in latest.items()}
+    for i in range(1, 5):
+        sf = os.path.join(SUBMISSIONS_DIR, f"House_{i}", "submissions.txt")
+        if not os.path.exists(sf):
+            continue
+        with open(sf) as f:
+            lines = f.read().splitlines()
+        keep = [l for l in dict.fromkeys(lines) if house_of.get(l, str(i)) == str(i)]
+        if keep != lines:
+            with open(sf, 'w') as f:
+                f.writelines(l + "\n" for l in keep)
+
+def record_student_result(tarball, house_num, student_name, total, details, facts=None):
+    add_submission_line(house_num, student_name)
     update_individual_score(student_name, total, details)
+    append_result_row(house_num, tarball, total)
+    grading_metrics.work_done()
+    if store:
+        store.record_student(tarball, student_name, house_num, total, details)
+        if facts:
+            store.record_grading(tarball, student_name, facts)
+        # Committed per student: a crash loses at most the one being recorded.
+        store.commit()
+    if warrior_hashes is not None:
+        student_folder = os.path.join(SUBMISSIONS_DIR, f"House_{house_num}", student_name)
+        warrior2 = os.path.join(student_folder, 'chooseyourfighter.red')
+        if os.path.exists(warrior2) and not os.path.exists(os.path.join(student_folder, 'Invalid.txt')):
+            with stage_trace.span('hash', student=student_name):
+                Hash_calculator.cached_sha256(warrior2, warrior_hashes)
+
+def grading_context():
+    """Everything besides the tarball itself that a stored grade depends on."""
+    return {
+        'basic_warriors': {b: battle_cache.file_sha256(os.path.join(BASIC_DIR, b)) for b in BASIC_WARRIORS},
+        'engine': battle_engine.engine_identity(ENGINE),
+        'early_stop': list(EARLY_STOP) if EARLY_STOP else None,
+        'battle_timeout': SCHEDULER[1] if SCHEDULER else None,
+        'timeout': TIMEOUT_SECONDS,
+        'identical': 'text',
+        # Lists, not tuples, so the context compares equal after a JSON round trip.
+        'limits': [list(kv) for kv in sorted(BUILD_LIMITS.items())] + [BUILD_MAX_PROCESSES],
+    }
+
+def submission_fingerprint(tarball, house_num, env_var, context):
+    return dict(context,
+                tarball=battle_cache.file_sha256(os.path.join(TARBALLS_DIR, tarball)),
+                # Only a digest of the secret variable name is kept on disk.
+                env_var=hashlib.sha256(env_var.encode()).hexdigest(),
+                house=str(house_num))
 
-    with open(FINAL_RESULTS_CSV, 'a', newline='') as frc:
-        writer = csv.writer(frc)
-        writer.writerow([house_num, tarball, total])
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    try:
+        with open(MANIFEST_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest {MANIFEST_FILE}: {e}")
+        return {}
+
+def save_manifest(manifest):
+    tmp = MANIFEST_FILE + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, MANIFEST_FILE)
+
+def stored_result(manifest, tarball, fingerprint):
+    """Return the (student_name, total, details) graded last time if nothing it
+    depends on has changed and its submission folder is still there."""
+    entry = manifest.get(tarball)
+    if not entry or entry['fingerprint'] != fingerprint:
+        return None
+    student_folder = os.path.join(SUBMISSIONS_DIR, f"House_{fingerprint['house']}", entry['student_name'])
+    if not os.path.isdir(student_folder):
+        return None
+    return entry['student_name'], entry['total'], entry['details']
+
+def clear_student_folder(tarball):
+    """Remove what an earlier grading of this tarball left behind, e.g. Invalid.txt."""
+    for i in range(1, 5):
+        student_folder = os.path.join(SUBMISSIONS_DIR, f"House_{i}", tarball.split('.', 1)[0])
+        if os.path.isdir(student_folder):
+            shutil.rmtree(student_folder)
+
+def manifest_entry(fingerprint, result):
+    student_name, total, details = result
+    return {'fingerprint': fingerprint, 'student_name': student_name, 'total': total, 'details': details}
+
+def journal_graded_student(journal, tarball, fingerprint, result, facts):
+    """Note a finished grade before any output file is changed for it."""
+    journal.append(dict(manifest_entry(fingerprint, result), tarball=tarball, facts=facts))
+
+def record_graded_student(manifest, tarball, house_num, fingerprint, result, facts):
+    record_student_result(tarball, house_num, *result, facts)
+    manifest[tarball] = manifest_entry(fingerprint, result)
+
+def open_run_journal(context, resume):
+    """Start this run's journal; with resume, continue an interrupted run's
+    journal and return {tarball: manifest entry} for the students it graded."""
+    header = {'run': 'First_evaluation', 'context': context}
+    old, entries, keep = run_journal.load(RUN_JOURNAL)
+    if resume and run_journal.same_run(old, header):
+        print(f"Resuming from {RUN_JOURNAL}: {len(entries)} students already graded.")
+        graded = {e['tarball']: {k: v for k, v in e.items() if k != 'tarball'} for e in entries}
+        return run_journal.RunJournal(RUN_JOURNAL, header, keep), graded
+    if old is not None:
+        if resume:
+            print(f"{RUN_JOURNAL} was written with different settings, starting over.")
+        else:
+            print(f"Starting over; use --resume to keep the grades in {RUN_JOURNAL} from an interrupted run.")
+    elif resume:
+        print(f"No interrupted run in {RUN_JOURNAL}, starting from the beginning.")
+    return run_journal.RunJournal(RUN_JOURNAL, header), {}
+
+def grade_student_with_stats(tarball, house_num, env_var):
+    before = battle_engine.cache_stats()
+    result = grade_student(tarball, house_num, env_var)
+    return result, battle_engine.cache_stats_since(before), _grading_facts
+
+def set_build_timeout(seconds):
+    global TIMEOUT_SECONDS
+    TIMEOUT_SECONDS = seconds
+    BUILD_LIMITS[resource.RLIMIT_CPU] = seconds
+
+def init_worker(engine, early_stop, scheduler, build_timeout):
+    configure_battles(engine, early_stop, scheduler)
+    set_build_timeout(build_timeout)
+
+def configure_battles(engine, early_stop, scheduler=None):
+    global ENGINE, EARLY_STOP, SCHEDULER
+    ENGINE, EARLY_STOP, SCHEDULER = engine, early_stop, scheduler
+    if scheduler:
+        battle_scheduler.configure(*scheduler)
+
+def process_submissions_parallel(work, jobs, manifest, journal):
+    # Students are graded concurrently and journaled as soon as each one
+    # finishes, but every shared output file is written here, in submission
+    # order, so the result matches a serial run.
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(ENGINE, EARLY_STOP, SCHEDULER, TIMEOUT_SECONDS)) as pool:
+        futures = {pool.submit(grade_student_with_stats, tb, house, envv): k
+                   for k, (tb, house, envv, _) in enumerate(work)}
+        finished, next_k = {}, 0
+        for fut in as_completed(futures):
+            k = futures[fut]
+            result, delta, facts = fut.result()
+            battle_engine.add_cache_stats(delta)
+            journal_graded_student(journal, work[k][0], work[k][3], result, facts)
+            finished[k] = result, facts
+            while next_k in finished:
+                tb, house, _, fp = work[next_k]
+                record_graded_student(manifest, tb, house, fp, *finished.pop(next_k))
+                next_k += 1
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Grade every tarball against the basic warriors.")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="number of students to grade at the same time (default: 1)")
+    parser.add_argument('--engine', choices=battle_engine.ENGINES, default='pmars',
+                        help="MARS used for validation and battles (default: pmars)")
+    parser.add_argument('--force', action='store_true',
+                        help="regrade every tarball, even ones unchanged since the last run")
+    parser.add_argument('--build-timeout', type=int, default=TIMEOUT_SECONDS,
+                        help=f"seconds (wall and CPU) each make may take (default: {TIMEOUT_SECONDS})")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted run, keeping the students it already graded")
+    parser.add_argument('--db', default=results_store.DB_FILE,
+                        help=f"results database to record grades in (default: {results_store.DB_FILE})")
+    battle_engine.add_battle_args(parser)
+    stage_trace.add_trace_args(parser)
+    grading_metrics.add_metrics_args(parser)
+    return parser.parse_args()
 
 def main():
+    global warrior_hashes, store
+    args = parse_args()
+    stage_trace.configure(args.trace)
+    grading_metrics.configure(args.metrics_port, args.status)
+    set_build_timeout(args.build_timeout)
+    args.jobs = battle_engine.worker_jobs(args)
+    configure_battles(args.engine, battle_engine.early_stop_setting(args),
+                      battle_engine.scheduler_setting(args, args.jobs))
     for d in [INDIVIDUAL_SCORE_DIR]:
         os.makedirs(d, exist_ok=True)
     for i in range(1, 5):
         os.makedirs(os.path.join(SUBMISSIONS_DIR, f"House_{i}"), exist_ok=True)
 
     if not os.path.exists(FINAL_RESULTS_CSV):
-        with open(FINAL_RESULTS_CSV, 'w', newline='') as f:
-            csv.writer(f).writerow(['House number', 'tarfilename', 'Total Score'])
+        write_results_csv([['House number', 'tarfilename', 'Total Score']])
 
     mapping = {}
     with open(MAPPING_CSV) as mcf:
@@ -201,6 +592,14 @@ def main():
             if len(row) >= 3:
                 mapping[row[1]] = (row[0], row[2])
 
+    store = results_store.open_store(args.db)
+    manifest = load_manifest()
+    warrior_hashes = Hash_calculator.load_manifest()
+    context = grading_context()
+    journal, resumed = open_run_journal(context, args.resume)
+    work = []
+    grading_metrics.set_work(sum(1 for tb in os.listdir(TARBALLS_DIR)
+                                 if tb.endswith(('.tar.gz', '.tgz')) and tb in mapping), 'students')
     for tb in os.listdir(TARBALLS_DIR):
         if tb.endswith(('.tar.gz', '.tgz')):
             print(f"\nProcessing {tb} ...")
@@ -208,7 +607,37 @@ def main():
             if not house:
                 print(f"No mapping entry for {tb}, skipping.")
                 continue
-            process_student_submission(tb, house, envv)
+            fp = submission_fingerprint(tb, house, envv, context)
+            stored = stored_result(resumed, tb, fp)
+            if stored:
+                print(f"{tb} was graded before the run was interrupted, reusing its grade.")
+                record_graded_student(manifest, tb, house, fp, stored, resumed[tb].get('facts'))
+                continue
+            stored = None if args.force else stored_result(manifest, tb, fp)
+            if stored:
+                print(f"{tb} is unchanged since the last run, reusing its grade.")
+                record_student_result(tb, house, *stored)
+                continue
+            clear_student_folder(tb)
+            if args.jobs > 1:
+                work.append((tb, house, envv, fp))
+            else:
+                result = grade_student(tb, house, envv)
+                journal_graded_student(journal, tb, fp, result, _grading_facts)
+                record_graded_student(manifest, tb, house, fp, result, _grading_facts)
+
+    if work:
+        process_submissions_parallel(work, args.jobs, manifest, journal)
+    save_manifest(manifest)
+    Hash_calculator.save_manifest(warrior_hashes)
+    compact_outputs()
+    add_similarity_notes()
+    if store:
+        store.close()
+    journal.remove()
+    battle_cache.report()
+    warrior_cache.report()
+    stage_trace.report()
 
     for i in range(1, 5):
         hf = os.path.join(SUBMISSIONS_DIR, f"House_{i}")
@@ -2,21 +2,78 @@
 import os
 import hashlib
 import csv
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import results_store
+import stage_trace
 
 SUBMISSIONS_DIR = 'submissions'
 MAPPING_CSV = 'Env_variables.csv'
 OUTPUT_CSV = 'calculated_sha256.csv'
+MANIFEST_FILE = os.path.join('core', 'hash_manifest.json')
+CHUNK_SIZE = 1024 * 1024
+HASH_WORKERS = min(8, (os.cpu_count() or 1) * 2)
 
 def calculate_sha256(file_path):
-    """Calculate SHA256 hash of a file."""
+    """Calculate SHA256 hash of a file, reading it in chunks."""
     try:
+        h = hashlib.sha256()
         with open(file_path, 'rb') as f:
-            file_hash = hashlib.sha256(f.read()).hexdigest()
-        return file_hash
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+        return h.hexdigest()
     except Exception as e:
         print(f"Error calculating hash for {file_path}: {e}")
         return "ERROR"
 
+def load_manifest():
+    """Return {path: {'size', 'mtime_ns', 'sha256'}} from earlier runs."""
+    try:
+        with open(MANIFEST_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest):
+    os.makedirs(os.path.dirname(MANIFEST_FILE), exist_ok=True)
+    tmp = MANIFEST_FILE + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, MANIFEST_FILE)
+
+def cached_sha256(file_path, manifest):
+    """Hash file_path unless the manifest has it at the same size and mtime."""
+    try:
+        st = os.stat(file_path)
+    except OSError as e:
+        print(f"Error calculating hash for {file_path}: {e}")
+        return "ERROR"
+    entry = manifest.get(file_path)
+    if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+        return entry['sha256']
+    digest = calculate_sha256(file_path)
+    if digest != "ERROR":
+        manifest[file_path] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+    return digest
+
+def hash_student(house_num, tarfile, manifest):
+    """Return the calculated_sha256.csv row for one student and a message about it."""
+    student_name = tarfile.split('.', 1)[0]
+    student_folder = os.path.join(SUBMISSIONS_DIR, f"House_{house_num}", student_name)
+    warrior_path = os.path.join(student_folder, 'chooseyourfighter.red')
+    invalid_path = os.path.join(student_folder, 'Invalid.txt')
+
+    if os.path.exists(invalid_path):
+        return [house_num, tarfile, "NOT_A_VALID_WARRIOR"], f"Invalid warrior for {student_name} (Invalid.txt found)"
+    elif os.path.exists(warrior_path):
+        with stage_trace.span('hash', student=student_name):
+            sha256_hash = cached_sha256(warrior_path, manifest)
+        return [house_num, tarfile, sha256_hash], f"Calculated hash for {student_name}: {sha256_hash[:8]}..."
+    else:
+        return ([house_num, tarfile, "FILE_NOT_FOUND"],
+                f"Warning: Warrior file not found for {student_name} in House {house_num}")
+
 def main():
     mapping_data = []
     try:
@@ -29,23 +86,14 @@ def main():
         print(f"Error reading mapping file: {e}")
         return
 
+    manifest = load_manifest()
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+        hashed = list(pool.map(lambda row: hash_student(row[0], row[1], manifest), mapping_data))
     results = []
-    for house_num, tarfile in mapping_data:
-        student_name = tarfile.split('.', 1)[0]
-        student_folder = os.path.join(SUBMISSIONS_DIR, f"House_{house_num}", student_name)
-        warrior_path = os.path.join(student_folder, 'chooseyourfighter.red')
-        invalid_path = os.path.join(student_folder, 'Invalid.txt')
-        
-        if os.path.exists(invalid_path):
-            results.append([house_num, tarfile, "NOT_A_VALID_WARRIOR"])
-            print(f"Invalid warrior for {student_name} (Invalid.txt found)")
-        elif os.path.exists(warrior_path):
-            sha256_hash = calculate_sha256(warrior_path)
-            results.append([house_num, tarfile, sha256_hash])
-            print(f"Calculated hash for {student_name}: {sha256_hash[:8]}...")
-        else:
-            print(f"Warning: Warrior file not found for {student_name} in House {house_num}")
-            results.append([house_num, tarfile, "FILE_NOT_FOUND"])
+    for row, message in hashed:
+        results.append(row)
+        print(message)
+    save_manifest(manifest)
 
     try:
         with open(OUTPUT_CSV, 'w', newline='') as f:
@@ -56,5 +104,10 @@ def main():
     except Exception as e:
         print(f"Error writing output file: {e}")
 
+    store = results_store.open_store()
+    if store:
+        store.record_warriors(results)
+        store.close()
+
 if __name__ == "__main__":
     main()
@@ -1,18 +1,38 @@
 #!/usr/bin/env python3
 import os
-import subprocess
 import random
 import math
-import shutil
+import io
 import csv
+import json
+import argparse
 from functools import reduce
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import battle_cache
+import battle_engine
+import battle_scheduler
+import grading_metrics
+import results_store
+import run_journal
+import stage_trace
+import warrior_cache
 
 SUBMISSIONS_DIR    = "submissions"
 CORE_DIR           = "core"
 ROUND2_FILE        = os.path.join(CORE_DIR, "Round2_Results.txt")
+JOURNAL_FILE       = os.path.join(CORE_DIR, "Round2_Results.journal")
+JOURNAL_SYNC_EVERY = 32
+TRACKER_STATE      = os.path.join(CORE_DIR, "Round2_tracker.json")
+RUN_JOURNAL        = os.path.join(CORE_DIR, "Round2_run.journal")
+SWISS_RESULTS_FILE = os.path.join(CORE_DIR, "Round2_Swiss_Results.txt")
 BATTLE_RESULTS_DIR = "Battle_Results"
-TMP_DIR            = "round2_tmp"
 MAPPING_CSV        = "Env_variables.csv"  
+ENGINE             = "pmars"
+EARLY_STOP         = None
+SCHEDULER          = None
+# The results database, opened by main.
+store              = None
 
 student_to_house = {}
 with open(MAPPING_CSV) as f:
@@ -20,59 +40,216 @@ with open(MAPPING_CSV) as f:
         student = tarfile.split('.',1)[0].rsplit('_',1)[0]
         student_to_house[student] = int(house)
 
+# Round 2 house totals; points are journaled as they are awarded and written
+# back to ROUND2_FILE at the end of every group.
+house_points = {}
+_journal = None
+_journal_pending = 0
+
+# Per-house samplers that replace draining Part_2_tracker.txt line by line.
+samplers = {}
+tracker_rng = random.Random()
+tracker_seed = None
+tracker_draws = 0
+
 def gcd(a,b): return math.gcd(a,b)
 def lcm(a,b): return a*b//gcd(a,b)
 def lcm_list(nums): return reduce(lcm, nums)
 
-def normalize_tracker_files():
-    counts = {}
-    for h in range(1,5):
-        tf = os.path.join(SUBMISSIONS_DIR, f"House_{h}", "Part_2_tracker.txt")
-        if not os.path.exists(tf): continue
-        lines = [l.strip() for l in open(tf) if l.strip()]
-        if lines:
-            counts[h] = len(lines)
+class WeightedSampler:
+    """Draw entries with probability proportional to their remaining count.
+
+    A Fenwick tree over the counts gives O(log n) draws without replacement
+    of a single copy. Entries keep the order of the tracker file, so a draw of
+    rng.randrange(total) lands on the same student the old line-per-copy
+    tracker would have picked.
+    """
+    def __init__(self, entries):
+        self.names = [name for name, _ in entries]
+        self.tree = [0] * (len(entries) + 1)
+        self.total = 0
+        for i, (_, cnt) in enumerate(entries):
+            self._add(i, cnt)
+
+    def _add(self, i, delta):
+        self.total += delta
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def draw(self, rng):
+        if self.total <= 0:
+            return None
+        r = rng.randrange(self.total)
+        pos, step = 0, 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self.tree) and self.tree[nxt] <= r:
+                pos = nxt
+                r -= self.tree[nxt]
+            step >>= 1
+        self._add(pos, -1)
+        return self.names[pos]
+
+def tracker_path(house):
+    return os.path.join(SUBMISSIONS_DIR, f"House_{house}", "Part_2_tracker.txt")
+
+def read_tracker(house):
+    """Return the tracker as [(student, copies)] runs, in file order."""
+    entries = []
+    tf = tracker_path(house)
+    if not os.path.exists(tf):
+        return entries
+    for l in open(tf):
+        l = l.strip()
+        if not l:
+            continue
+        if entries and entries[-1][0] == l:
+            entries[-1] = (l, entries[-1][1] + 1)
+        else:
+            entries.append((l, 1))
+    return entries
+
+def tracker_signature():
+    return {str(h): battle_cache.file_sha256(tracker_path(h)) if os.path.exists(tracker_path(h)) else None
+            for h in range(1,5)}
+
+def build_samplers():
+    """Give every house a sampler whose counts are scaled to the LCM of the house sizes."""
+    trackers = {h: read_tracker(h) for h in range(1,5)}
+    counts = {h: sum(c for _, c in e) for h, e in trackers.items() if e}
     if len(counts) < 4:
         print("Cannot normalize: missing data.")
-        return
-    L = lcm_list(counts.values())
-    for h, c in counts.items():
-        tf = os.path.join(SUBMISSIONS_DIR, f"House_{h}", "Part_2_tracker.txt")
-        lines = [l.strip() for l in open(tf) if l.strip()]
-        factor = L // c
-        with open(tf, 'w') as f:
-            for l in lines:
-                f.write((l + "\n") * factor)
+        factors = {h: 1 for h in trackers}
+    else:
+        L = lcm_list(counts.values())
+        factors = {h: L // c for h, c in counts.items()}
+    return {h: WeightedSampler([(name, c * factors[h]) for name, c in e]) for h, e in trackers.items()}
+
+def load_tracker_state(seed=None):
+    """Set up the samplers, resuming from the checkpoint if the trackers are unchanged.
+
+    The checkpoint only records the seed, the number of draws made and the
+    tracker file hashes; resuming replays the draws, which are always made
+    house 1 to 4 in turn.
+    """
+    sig = tracker_signature()
+    state = None
+    if os.path.exists(TRACKER_STATE):
+        try:
+            with open(TRACKER_STATE) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable {TRACKER_STATE}: {e}")
+        if state and (state.get('trackers') != sig or (seed is not None and state.get('seed') != seed)):
+            state = None
+    if state:
+        start_draws(state['seed'], state['draws'])
+        print(f"Resumed Round 2 draws from {TRACKER_STATE} ({tracker_draws} draws, seed {tracker_seed}).")
+    else:
+        start_draws(seed if seed is not None else random.randrange(2**32), 0)
+
+def start_draws(seed, draws):
+    """Set up the samplers for seed and replay its first draws."""
+    global samplers, tracker_rng, tracker_seed, tracker_draws
+    samplers = build_samplers()
+    tracker_seed = seed
+    tracker_rng = random.Random(seed)
+    tracker_draws = 0
+    while tracker_draws < draws:
+        if get_next_student(tracker_draws % 4 + 1) is None:
+            break
+
+def save_tracker_state():
+    tmp = TRACKER_STATE + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump({'seed': tracker_seed, 'draws': tracker_draws, 'trackers': tracker_signature()}, f)
+    os.replace(tmp, TRACKER_STATE)
+
+def house_has_students(house):
+    return samplers[house].total > 0
 
 def get_next_student(house):
-    tf = os.path.join(SUBMISSIONS_DIR, f"House_{house}", "Part_2_tracker.txt")
-    if not os.path.exists(tf):
-        return None
-    lines = open(tf).readlines()
-    if not lines:
-        return None
-    idx = random.randrange(len(lines))
-    student = lines[idx].strip()
-    open(tf, 'w').writelines(lines[:idx] + lines[idx+1:])
+    global tracker_draws
+    student = samplers[house].draw(tracker_rng)
+    if student is not None:
+        tracker_draws += 1
     return student
 
-def update_house_points(house, pts):
+def read_house_points(path=ROUND2_FILE):
     pts_map = {}
-    if os.path.exists(ROUND2_FILE):
-        for ln in open(ROUND2_FILE):
-            k, v = ln.strip().split('-')
-            pts_map[k.strip()] = int(v.strip())
+    if os.path.exists(path):
+        for ln in open(path):
+            # rsplit, so a negative total ("House 1 - -2") still parses.
+            k, v = ln.strip().rsplit(' - ', 1)
+            pts_map[k] = int(v)
     for h in range(1,5):
         pts_map.setdefault(f"House {h}", 0)
-    pts_map[f"House {house}"] += pts
-    with open(ROUND2_FILE, 'w') as f:
-        for k in sorted(pts_map):
-            f.write(f"{k} - {pts_map[k]}\n")
+    return pts_map
+
+def _journal_header(pts_map):
+    return "base " + " ".join(f"{pts_map[f'House {h}']}" for h in range(1,5)) + "\n"
+
+def load_house_points():
+    """Load Round2_Results.txt into memory and replay any journal left by a crash.
+
+    The journal starts with the totals it was opened on top of; it is only
+    replayed if the results file still holds exactly those totals, so a crash
+    between compaction and truncation does not count points twice.
+    """
+    global house_points, _journal, _journal_pending
+    house_points = read_house_points()
+    _journal, _journal_pending = None, 0
+    if not os.path.exists(JOURNAL_FILE):
+        return
+    lines = open(JOURNAL_FILE).read().splitlines()
+    if lines and lines[0] == _journal_header(house_points).strip():
+        for ln in lines[1:]:
+            p = ln.split()
+            if len(p) == 2 and p[0].isdigit() and p[1].lstrip('-').isdigit():
+                house_points[f"House {p[0]}"] += int(p[1])
+        compact_house_points(force=True)
+    os.remove(JOURNAL_FILE)
+
+def update_house_points(house, pts):
+    with stage_trace.span('update_points', house=house):
+        _update_house_points(house, pts)
+
+def _update_house_points(house, pts):
+    global _journal, _journal_pending
+    if _journal is None:
+        _journal = open(JOURNAL_FILE, 'w')
+        _journal.write(_journal_header(house_points))
+    _journal.write(f"{house} {pts}\n")
+    house_points[f"House {house}"] += pts
+    _journal_pending += 1
+    if _journal_pending >= JOURNAL_SYNC_EVERY:
+        _journal.flush()
+        os.fsync(_journal.fileno())
+        _journal_pending = 0
+
+def compact_house_points(force=False):
+    """Write the in-memory totals to Round2_Results.txt and drop the journal."""
+    global _journal, _journal_pending
+    if _journal is None and not force:
+        return
+    tmp = ROUND2_FILE + ".tmp"
+    with open(tmp, 'w') as f:
+        for k in sorted(house_points):
+            f.write(f"{k} - {house_points[k]}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ROUND2_FILE)
+    if store:
+        store.set_house_points('round2', {k.split()[-1]: v for k, v in house_points.items()})
+    if _journal is not None:
+        _journal.close()
+        os.remove(JOURNAL_FILE)
+    _journal, _journal_pending = None, 0
 
 def run_match(w1, w2):
-    out = subprocess.run(['pmars','-r','1000', '-f', w1, w2],
-                         capture_output=True, text=True).stdout.splitlines()
-    return out[-1] if out else ""
+    return battle_engine.run_battle(w1, w2, 1000, ENGINE, EARLY_STOP)
 
 def parse_match(line):
     p = line.split()
@@ -80,17 +257,62 @@ def parse_match(line):
         return None
     return int(p[1]), int(p[2]), int(p[3])
 
-def form_group_and_battle(group_no):
-    if os.path.isdir(TMP_DIR):
-        shutil.rmtree(TMP_DIR)
-    os.makedirs(TMP_DIR)
+def play_pair(A, B, gf):
+    """Fight the second warriors of A and B, logging to gf; return the winner or None."""
+    wA, wB = A['path'], B['path']
+    invalid_A = os.path.exists(os.path.join(A['folder'], 'Invalid.txt'))
+    invalid_B = os.path.exists(os.path.join(B['folder'], 'Invalid.txt'))
+
+    if invalid_A and not invalid_B:
+        gf.write(f"{A['id']} is invalid. Point → {B['id']}\n")
+        return B
+    elif invalid_B and not invalid_A:
+        gf.write(f"{B['id']} is invalid. Point → {A['id']}\n")
+        return A
+    elif invalid_A and invalid_B:
+        gf.write(f"Both {A['id']} and {B['id']} are invalid. No points.\n")
+        return None
+
+    if not os.path.exists(wA) or not os.path.exists(wB):
+        if os.path.exists(wA):
+            gf.write(f"{B['id']} missing, point → {A['id']}\n")
+            return A
+        elif os.path.exists(wB):
+            gf.write(f"{A['id']} missing, point → {B['id']}\n")
+            return B
+        gf.write(f"Both missing for {A['id']} vs {B['id']}\n")
+        return None
+
+    res = run_match(wA, wB)
+    gf.write(f"{A['id']} vs {B['id']}: {res}\n")
+    if res == battle_engine.TIMEOUT_RESULT:
+        gf.write("Timed out, no points\n")
+        return None
+    pr = parse_match(res)
+    if not pr:
+        gf.write("Could not parse\n")
+        return None
+    if pr[0] > pr[1]:
+        gf.write(f"{A['id']} wins\n")
+        return A
+    if pr[1] > pr[0]:
+        gf.write(f"{B['id']} wins\n")
+        return B
+    gf.write("Tie\n")
+    return None
 
+def draw_group():
+    """Draw one student per house; return the group, or None once a house runs out.
+
+    Members refer to their warrior files directly, so groups need no staging
+    directory and can be fought in any order or at the same time.
+    """
     group = []
     for h in range(1,5):
         student = get_next_student(h)
         if not student:
             print(f"House_{h} out of students.")
-            return False
+            return None
 
         house = student_to_house.get(student)
         if house is None:
@@ -103,18 +325,36 @@ def form_group_and_battle(group_no):
             continue
 
         src = os.path.join(subf, 'chooseyourfighter.red')
-        dst = os.path.join(TMP_DIR, f"{student}_{house}.red")
         if not os.path.exists(src):
             print(f"Missing chooseyourfighter.red for {student}, skipping.")
             continue
 
-        shutil.copy(src, dst)
-        group.append({'id': f"{student}_{house}", 'house': house, 'path': dst, 'folder': subf})
+        group.append({'id': f"{student}_{house}", 'house': house, 'path': src, 'folder': subf})
 
+    save_tracker_state()
     if len(group) < 4:
         print("Not enough valid students to form a full group.")
-        return False
+        return None
+    return group
 
+def group_pairs(group):
+    return [(group[i], group[j]) for i in range(len(group)) for j in range(i+1, len(group))]
+
+def pair_outcome(A, B):
+    """play_pair without a log file: return (log text, winner id or None)."""
+    buf = io.StringIO()
+    with stage_trace.span('pair', pair=[A['id'], B['id']]):
+        winner = play_pair(A, B, buf)
+    return buf.getvalue(), winner['id'] if winner else None
+
+def pair_outcome_with_stats(A, B):
+    before = battle_engine.cache_stats()
+    result = pair_outcome(A, B)
+    return result, battle_engine.cache_stats_since(before)
+
+def record_group(group_no, group, outcomes):
+    """Write group_N.txt and award points from the outcomes of group_pairs(group)."""
+    members = {m['id']: m for m in group}
     scores = {1:0, 2:0, 3:0, 4:0}
     logf = os.path.join(BATTLE_RESULTS_DIR, f"group_{group_no}.txt")
     with open(logf, 'w') as gf:
@@ -123,84 +363,361 @@ def form_group_and_battle(group_no):
             gf.write(m['id'] + "\n")
         gf.write("\nMatches (second warrior only):\n")
 
-    n = len(group)
-    for i in range(n):
-        for j in range(i+1, n):
-            A, B = group[i], group[j]
-            wA, wB = A['path'], B['path']
-            with open(logf, 'a') as gf:
-                invalid_A = os.path.exists(os.path.join(A['folder'], 'Invalid.txt'))
-                invalid_B = os.path.exists(os.path.join(B['folder'], 'Invalid.txt'))
-
-                if invalid_A and not invalid_B:
-                    gf.write(f"{A['id']} is invalid. Point → {B['id']}\n")
-                    update_house_points(B['house'], 1)
-                    scores[B['house']] += 1
-                    continue
-                elif invalid_B and not invalid_A:
-                    gf.write(f"{B['id']} is invalid. Point → {A['id']}\n")
-                    update_house_points(A['house'], 1)
-                    scores[A['house']] += 1
-                    continue
-                elif invalid_A and invalid_B:
-                    gf.write(f"Both {A['id']} and {B['id']} are invalid. No points.\n")
-                    continue
-
-                if not os.path.exists(wA) or not os.path.exists(wB):
-                    if os.path.exists(wA):
-                        gf.write(f"{B['id']} missing, point → {A['id']}\n")
-                        update_house_points(A['house'], 1)
-                        scores[A['house']] += 1
-                    elif os.path.exists(wB):
-                        gf.write(f"{A['id']} missing, point → {B['id']}\n")
-                        update_house_points(B['house'], 1)
-                        scores[B['house']] += 1
-                    else:
-                        gf.write(f"Both missing for {A['id']} vs {B['id']}\n")
-                    continue
-
-                res = run_match(wA, wB)
-                gf.write(f"{A['id']} vs {B['id']}: {res}\n")
-                pr = parse_match(res)
-                if pr:
-                    if pr[0] > pr[1]:
-                        gf.write(f"{A['id']} wins\n")
-                        update_house_points(A['house'], 1)
-                        scores[A['house']] += 1
-                    elif pr[1] > pr[0]:
-                        gf.write(f"{B['id']} wins\n")
-                        update_house_points(B['house'], 1)
-                        scores[B['house']] += 1
-                    else:
-                        gf.write("Tie\n")
-                else:
-                    gf.write("Could not parse\n")
-
-    with open(logf, 'a') as gf:
+        for text, winner in outcomes:
+            gf.write(text)
+            if winner:
+                update_house_points(members[winner]['house'], 1)
+                scores[members[winner]['house']] += 1
+
         gf.write("\nGroup Scores:\n")
         for h in range(1,5):
             gf.write(f"House {h}: {scores[h]}\n")
 
-    shutil.rmtree(TMP_DIR)
+    if store:
+        store.record_group('groups', group_no, [(m['id'], m['house']) for m in group],
+                           [(A['id'], B['id'], text, winner)
+                            for (A, B), (text, winner) in zip(group_pairs(group), outcomes)])
+    compact_house_points()
     print(f"Group {group_no} complete → {logf}")
-    return True
 
-def main():
-    os.makedirs(BATTLE_RESULTS_DIR, exist_ok=True)
-    normalize_tracker_files()
-    grp = 1
+def configure_battles(engine, early_stop, scheduler=None):
+    global ENGINE, EARLY_STOP, SCHEDULER
+    ENGINE, EARLY_STOP, SCHEDULER = engine, early_stop, scheduler
+    if scheduler:
+        battle_scheduler.configure(*scheduler)
+
+def collect_outcomes(futures):
+    outcomes = []
+    for fut in futures:
+        outcome, delta = fut.result()
+        battle_engine.add_cache_stats(delta)
+        outcomes.append(outcome)
+    return outcomes
+
+def journal_match(journal, unit, i, outcome):
+    journal.append({'match': [unit, i], 'text': outcome[0], 'winner': outcome[1]})
+    grading_metrics.work_done()
+
+def play_pairs(pairs, journal, unit, done=None, pool=None):
+    """pair_outcome for every pair, on the pool when there is one.
+
+    Outcomes already in done ({pair index: outcome}) are not played again;
+    new ones are journaled under unit as they finish."""
+    outcomes = dict(done or {})
+    todo = [i for i in range(len(pairs)) if i not in outcomes]
+    if pool is None:
+        for i in todo:
+            outcomes[i] = pair_outcome(*pairs[i])
+            journal_match(journal, unit, i, outcomes[i])
+    else:
+        futures = {pool.submit(pair_outcome_with_stats, *pairs[i]): i for i in todo}
+        for fut in as_completed(futures):
+            i = futures[fut]
+            outcomes[i] = collect_outcomes([fut])[0]
+            journal_match(journal, unit, i, outcomes[i])
+    return [outcomes[i] for i in range(len(pairs))]
+
+def finish_group(journal, group_no, group, outcomes):
+    record_group(group_no, group, outcomes)
+    journal.append({'recorded': group_no})
+
+def run_groups_parallel(groups, jobs, journal):
+    # Every unplayed pairing of every (group_no, group, done) goes to the
+    # pool at once and is journaled when it finishes; groups are recorded
+    # here in order, so the files match a serial run.
+    with ProcessPoolExecutor(max_workers=jobs, initializer=configure_battles,
+                             initargs=(ENGINE, EARLY_STOP, SCHEDULER)) as pool:
+        outcomes = {no: dict(done) for no, _, done in groups}
+        futures = {}
+        for no, group, done in groups:
+            for i, (A, B) in enumerate(group_pairs(group)):
+                if i not in done:
+                    futures[pool.submit(pair_outcome_with_stats, A, B)] = (no, i)
+        next_k = 0
+        def record_ready():
+            nonlocal next_k
+            while next_k < len(groups):
+                no, group, _ = groups[next_k]
+                if len(outcomes[no]) < len(group_pairs(group)):
+                    return
+                finish_group(journal, no, group, [outcomes[no][i] for i in range(len(outcomes[no]))])
+                next_k += 1
+        record_ready()
+        for fut in as_completed(futures):
+            no, i = futures[fut]
+            outcomes[no][i] = collect_outcomes([fut])[0]
+            journal_match(journal, no, i, outcomes[no][i])
+            record_ready()
+
+def battle_settings():
+    return [ENGINE, list(EARLY_STOP) if EARLY_STOP else None]
+
+def start_groups_run(seed, resume):
+    """Open the run journal and set up the draws and house points.
+
+    A journal left by an interrupted run (same trackers and seed) means the
+    run is repeated from the state it started in: its points and draws are
+    put back. With resume, its entries are returned as well so the groups
+    and matches it finished are not played again. Returns (journal, entries).
+    """
+    global house_points
+    old, entries, keep = run_journal.load(RUN_JOURNAL)
+    interrupted = (old is not None and old.get('run') == 'groups' and old['trackers'] == tracker_signature()
+                   and (seed is None or old['seed'] == seed))
+    if not interrupted:
+        if old is not None:
+            print(f"Ignoring {RUN_JOURNAL}: it is from a different run.")
+        elif resume:
+            print(f"No interrupted run in {RUN_JOURNAL}, starting from the beginning.")
+        load_house_points()
+        load_tracker_state(seed)
+        header = {'run': 'groups', 'seed': tracker_seed, 'draws': tracker_draws,
+                  'trackers': tracker_signature(), 'base': house_points, 'battles': battle_settings()}
+        return run_journal.RunJournal(RUN_JOURNAL, header), []
+
+    # Whatever the interrupted run wrote to the points file is redone.
+    if os.path.exists(JOURNAL_FILE):
+        os.remove(JOURNAL_FILE)
+    house_points = dict(old['base'])
+    compact_house_points(force=True)
+    start_draws(old['seed'], old['draws'])
+    if resume and old['battles'] == battle_settings():
+        print(f"Resuming from {RUN_JOURNAL} ({len(entries)} completed steps).")
+        return run_journal.RunJournal(RUN_JOURNAL, old, keep), entries
+    if resume:
+        print(f"{RUN_JOURNAL} was written with other battle settings, starting over.")
+    else:
+        print(f"Starting over; use --resume to continue the interrupted run in {RUN_JOURNAL}.")
+    return run_journal.RunJournal(RUN_JOURNAL, old), []
+
+def replay_groups(entries):
+    """Apply the journal of an interrupted run: redo its draws, count the
+    points of the groups it recorded and return [(group_no, group, done)]
+    for the groups it drew but did not finish, plus the next group number."""
+    groups, done, recorded = {}, {}, set()
+    draws = tracker_draws
+    for e in entries:
+        if 'group' in e:
+            groups[e['group']] = e['members']
+            done[e['group']] = {}
+            draws = e['draws']
+        elif 'match' in e:
+            no, i = e['match']
+            done[no][i] = (e['text'], e['winner'])
+        elif 'recorded' in e:
+            recorded.add(e['recorded'])
+    start_draws(tracker_seed, draws)
+    for no in sorted(recorded):
+        members = {m['id']: m for m in groups[no]}
+        for _, winner in done[no].values():
+            if winner:
+                house_points[f"House {members[winner]['house']}"] += 1
+    compact_house_points(force=True)
+    pending = [(no, groups[no], done[no]) for no in sorted(groups) if no not in recorded]
+    return pending, max(groups, default=0) + 1
+
+def groups_run(seed, jobs, resume):
+    journal, entries = start_groups_run(seed, resume)
+    pending, grp = replay_groups(entries)
+    # At most one group per student left in the smallest house.
+    grading_metrics.set_work(6 * min(samplers[h].total for h in range(1,5))
+                             + sum(len(group_pairs(g)) - len(done) for _, g, done in pending), 'matches')
+    if jobs <= 1:
+        for no, group, done in pending:
+            finish_group(journal, no, group, play_pairs(group_pairs(group), journal, no, done))
+        pending = []
     while True:
-        if any(
-            not os.path.exists(os.path.join(SUBMISSIONS_DIR, f"House_{h}", "Part_2_tracker.txt")) or
-            not open(os.path.join(SUBMISSIONS_DIR, f"House_{h}", "Part_2_tracker.txt")).readline().strip()
-            for h in range(1,5)
-        ):
+        if not all(house_has_students(h) for h in range(1,5)):
             print("No more full groups.")
             break
 
-        if not form_group_and_battle(grp):
+        group = draw_group()
+        if group is None:
             break
+        journal.append({'group': grp, 'draws': tracker_draws, 'members': group})
+        if jobs > 1:
+            pending.append((grp, group, {}))
+        else:
+            finish_group(journal, grp, group, play_pairs(group_pairs(group), journal, grp))
         grp += 1
+    if pending:
+        run_groups_parallel(pending, jobs, journal)
+    save_tracker_state()
+    compact_house_points()
+    journal.remove()
+
+def swiss_players():
+    """Every student in the trackers with a second warrior, as play_pair members."""
+    players, seen = [], set()
+    for h in range(1,5):
+        for student, _ in read_tracker(h):
+            if student in seen:
+                continue
+            seen.add(student)
+            house = student_to_house.get(student)
+            if house is None:
+                print(f"No mapping for {student}")
+                continue
+            subf = os.path.join(SUBMISSIONS_DIR, f"House_{house}", student)
+            src = os.path.join(subf, 'chooseyourfighter.red')
+            if not os.path.exists(src):
+                print(f"Missing chooseyourfighter.red for {student}, skipping.")
+                continue
+            players.append({'id': f"{student}_{house}", 'house': house, 'path': src, 'folder': subf})
+    return players
+
+def swiss_pairings(players, score, played, had_bye, rng):
+    """Pair players with equal or nearby scores who have not met yet.
+
+    Returns (pairs, bye); a rematch is only allowed when nobody else is left.
+    """
+    order = sorted(players, key=lambda p: (-score[p['id']], rng.random()))
+    bye = None
+    if len(order) % 2:
+        bye = ([p for p in order if not had_bye.get(p['id'])] or order)[-1]
+        order.remove(bye)
+    pairs = []
+    while order:
+        A = order.pop(0)
+        B = next((p for p in order if p['id'] not in played[A['id']]), order[0])
+        order.remove(B)
+        pairs.append((A, B))
+    return pairs, bye
+
+def swiss_tournament(seed=None, rounds=None, jobs=1, resume=False):
+    """Rank all second warriors with a Swiss system instead of random groups.
+
+    Every round pairs players on the same score, so about log2(n) rounds
+    separate the field; that is O(n log n) battles instead of the n(n-1)/2 of
+    a round robin. The standings (score, then Buchholz) give each student
+    one point for every player ranked below them, and a house gets the
+    average over its students, written to SWISS_RESULTS_FILE.
+    """
+    players = swiss_players()
+    n = len(players)
+    if n < 2:
+        print("Not enough students for a Swiss tournament.")
+        return
+    old, entries, keep = run_journal.load(RUN_JOURNAL)
+    if resume and old is not None and old.get('run') == 'swiss':
+        # An unseeded run is resumed with the seed it drew.
+        seed = old['seed'] if seed is None else seed
+        rounds = rounds or old['rounds']
+    seed = seed if seed is not None else random.randrange(2**32)
+    rng = random.Random(seed)
+    rounds = rounds or math.ceil(math.log2(n)) + 1
+    header = {'run': 'swiss', 'seed': seed, 'rounds': rounds,
+              'players': [p['path'] for p in players], 'battles': battle_settings()}
+    done = {}
+    if resume and run_journal.same_run(old, header):
+        print(f"Resuming from {RUN_JOURNAL} ({len(entries)} matches already played).")
+        journal = run_journal.RunJournal(RUN_JOURNAL, header, keep)
+        for e in entries:
+            r, i = e['match']
+            done.setdefault(r, {})[i] = (e['text'], e['winner'])
+    else:
+        if resume:
+            print(f"No matching Swiss run in {RUN_JOURNAL}, starting from the beginning.")
+        journal = run_journal.RunJournal(RUN_JOURNAL, header)
+    grading_metrics.set_work(rounds * (n // 2) - sum(len(d) for d in done.values()), 'matches')
+    score = {p['id']: 0 for p in players}
+    played = {p['id']: set() for p in players}
+    had_bye = {}
+    matches = 0
+
+    pool = ProcessPoolExecutor(max_workers=jobs, initializer=configure_battles,
+                               initargs=(ENGINE, EARLY_STOP, SCHEDULER)) if jobs > 1 else None
+    for r in range(1, rounds + 1):
+        pairs, bye = swiss_pairings(players, score, played, had_bye, rng)
+        outcomes = play_pairs(pairs, journal, r, done.get(r), pool)
+        logf = os.path.join(BATTLE_RESULTS_DIR, f"swiss_round_{r}.txt")
+        with open(logf, 'w') as gf:
+            gf.write(f"Swiss round {r}:\n")
+            for (A, B), (text, winner) in zip(pairs, outcomes):
+                played[A['id']].add(B['id'])
+                played[B['id']].add(A['id'])
+                gf.write(text)
+                matches += 1
+                if winner:
+                    score[winner] += 1
+            if bye:
+                had_bye[bye['id']] = True
+                score[bye['id']] += 1
+                gf.write(f"{bye['id']} has a bye. Point → {bye['id']}\n")
+        if store:
+            store.record_group('swiss', r, [], [(A['id'], B['id'], text, winner)
+                                                for (A, B), (text, winner) in zip(pairs, outcomes)])
+            store.commit()
+        print(f"Swiss round {r} complete → {logf}")
+    if pool:
+        pool.shutdown()
+
+    buchholz = {pid: sum(score[o] for o in played[pid]) for pid in score}
+    ranking = sorted(players, key=lambda p: (-score[p['id']], -buchholz[p['id']], p['id']))
+    borda = {p['id']: n - 1 - i for i, p in enumerate(ranking)}
+    members = {h: [p for p in players if p['house'] == h] for h in range(1,5)}
+    swiss_points = {f"House {h}": round(sum(borda[p['id']] for p in m) / len(m)) if m else 0
+                    for h, m in members.items()}
+    full = n * (n - 1) // 2
+
+    standings = os.path.join(BATTLE_RESULTS_DIR, "swiss_standings.txt")
+    with open(standings, 'w') as f:
+        f.write("Rank, player, score, buchholz\n")
+        for i, p in enumerate(ranking, 1):
+            f.write(f"{i}. {p['id']} - {score[p['id']]} ({buchholz[p['id']]})\n")
+        f.write(f"\n{matches} matches in {rounds} rounds; a round robin needs {full}, "
+                f"{full - matches} saved.\n")
+    tmp = SWISS_RESULTS_FILE + ".tmp"
+    with open(tmp, 'w') as f:
+        for k in sorted(swiss_points):
+            f.write(f"{k} - {swiss_points[k]}\n")
+    os.replace(tmp, SWISS_RESULTS_FILE)
+    if store:
+        store.set_house_points('swiss', {k.split()[-1]: v for k, v in swiss_points.items()})
+    journal.remove()
+    print(f"Swiss standings → {standings}, house points → {SWISS_RESULTS_FILE}")
+    print(f"{matches} matches instead of {full} for a round robin ({full - matches} saved).")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Battle random groups of second warriors.")
+    parser.add_argument('--engine', choices=battle_engine.ENGINES, default='pmars',
+                        help="MARS used for the battles (default: pmars)")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="seed for drawing the groups, to make a run reproducible")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="battles to run at the same time (default: 1)")
+    parser.add_argument('--mode', choices=['groups', 'swiss'], default='groups',
+                        help="random groups of four (default), or a Swiss tournament over all students")
+    parser.add_argument('--rounds', type=int, default=None,
+                        help="Swiss rounds to play (default: ceil(log2(students)) + 1)")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted run without replaying the groups and matches it finished")
+    parser.add_argument('--db', default=results_store.DB_FILE,
+                        help=f"results database to record battles and points in (default: {results_store.DB_FILE})")
+    battle_engine.add_battle_args(parser)
+    stage_trace.add_trace_args(parser)
+    grading_metrics.add_metrics_args(parser)
+    return parser.parse_args()
+
+def main():
+    global store
+    args = parse_args()
+    stage_trace.configure(args.trace)
+    grading_metrics.configure(args.metrics_port, args.status)
+    store = results_store.open_store(args.db)
+    args.jobs = battle_engine.worker_jobs(args)
+    configure_battles(args.engine, battle_engine.early_stop_setting(args),
+                      battle_engine.scheduler_setting(args, args.jobs))
+    os.makedirs(BATTLE_RESULTS_DIR, exist_ok=True)
+    if args.mode == 'swiss':
+        swiss_tournament(args.seed, args.rounds, args.jobs, args.resume)
+    else:
+        groups_run(args.seed, args.jobs, args.resume)
+    if store:
+        store.close()
+    battle_cache.report()
+    warrior_cache.report()
+    stage_trace.report()
 
 if __name__ == "__main__":
     main()
@@ -1,94 +1,230 @@
 #!/usr/bin/env python3
 import os
+import re
+import sys
 import csv
+import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
-CALCULATED_CSV = '../calculated_sha256.csv'
-RESULTS_FILE = 'Part3_Points.txt'
+# Paths are relative to this folder and the project root above it, so the
+# script can be run from anywhere (pipeline.py runs it from the root).
+THIRD_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(THIRD_DIR)
+sys.path.insert(0, PROJECT_DIR)
+import results_store
+
+CALCULATED_CSV = os.path.join(PROJECT_DIR, 'calculated_sha256.csv')
+RESULTS_DB = os.path.join(PROJECT_DIR, results_store.DB_FILE)
+RESULTS_FILE = os.path.join(THIRD_DIR, 'Part3_Points.txt')
+DETAILS_DIR = os.path.join(THIRD_DIR, 'Part3_Details')
 CORE_DIR = 'core'
 
-def load_calculated_hashes():
-    """Load the calculated SHA256 hashes."""
-    calculated = {}
+# Status of a calculated entry.
+HASHED, NO_WARRIOR, OTHER, BLANK = 0, 1, 2, 3
+NO_WARRIOR_STATUSES = ["FILE_NOT_FOUND", "NOT_A_VALID_WARRIOR", "ERROR"]
+# Per-house result of each claimed entry: last answer right or wrong.
+RIGHT, WRONG = 1, 2
+
+# Set in every worker by init_worker.
+index = None
+
+class HashIndex:
+    """Calculated hashes in compact form.
+
+    Each (house, tarball) gets a position; its status is one byte and a real
+    hash is kept as a 32-byte digest. The rare values that are not a sha256
+    hex digest are kept as text in labels.
+    """
+    def __init__(self):
+        self.positions = {}
+        self.houses = []
+        self.tarfiles = []
+        self.status = bytearray()
+        self.digests = bytearray()
+        self.labels = {}
+
+    def __len__(self):
+        return len(self.houses)
+
+    def add(self, house, tarfile, value):
+        pos = self.positions.get((house, tarfile))
+        if pos is None:
+            pos = self.positions[(house, tarfile)] = len(self.houses)
+            self.houses.append(house)
+            self.tarfiles.append(tarfile)
+            self.status.append(BLANK)
+            self.digests.extend(bytes(32))
+        self.labels.pop(pos, None)
+        if value in NO_WARRIOR_STATUSES:
+            self.status[pos] = NO_WARRIOR
+            self.labels[pos] = value
+        elif not value:
+            self.status[pos] = BLANK
+        elif re.fullmatch(r'[0-9a-fA-F]{64}', value):
+            self.status[pos] = HASHED
+            self.digests[pos * 32:pos * 32 + 32] = bytes.fromhex(value)
+        else:
+            self.status[pos] = OTHER
+            self.labels[pos] = value.lower()
+
+    def matches(self, pos, submitted):
+        if self.status[pos] == OTHER:
+            return submitted.lower() == self.labels[pos]
+        return submitted.lower() == self.digests[pos * 32:pos * 32 + 32].hex()
+
+def load_index(path=CALCULATED_CSV):
+    """Build a HashIndex from calculated_sha256.csv."""
+    idx = HashIndex()
     try:
-        with open(CALCULATED_CSV, 'r') as f:
-            reader = csv.reader(f)
-            for row in reader:
+        with open(path, 'r') as f:
+            for row in csv.reader(f):
                 if len(row) >= 3:
-                    calculated[(row[0], row[1])] = row[2]
-        return calculated
+                    idx.add(row[0], row[1], row[2])
     except Exception as e:
         print(f"Error loading calculated hashes: {e}")
-        return {}
+    return idx
 
-def load_house_submissions(house_num):
-    """Load a house's submitted hashes."""
-    file_path = f'Part3_{house_num}.csv'
-    submissions = {}
+def load_index_from_store(store):
+    """Build a HashIndex from the warriors table of the results database."""
+    idx = HashIndex()
+    for house, tarfile, value in store.warriors():
+        idx.add(house, tarfile, value)
+    return idx
+
+def discover_houses(folder):
+    """Return {house: Part3 csv path} for every Part3_{house}.csv in folder."""
+    found = {}
+    for path in glob.glob(os.path.join(folder, 'Part3_*.csv')):
+        m = re.fullmatch(r'Part3_(.+)\.csv', os.path.basename(path))
+        if m:
+            found[m.group(1)] = path
+    return found
+
+def house_order(house):
+    return (0, int(house), house) if house.isdigit() else (1, 0, house)
+
+def init_worker(shared_index):
+    global index
+    index = shared_index
+
+def score_house(house_num, file_path, details_path):
+    """Stream one house's csv against the index.
+
+    Like reading the csv into a dict, a later row for the same entry
+    replaces an earlier one. Only the entries the house claimed are kept,
+    and detail lines go to the file as they are found. Returns (house,
+    points, error)."""
+    claimed = {}
+    unknown = set()
+    tmp = details_path + ".tmp"
     try:
-        with open(file_path, 'r') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if len(row) >= 3:
-                    submissions[(row[0], row[1])] = row[2]
-        return submissions
+        with open(tmp, 'w') as out:
+            out.write(f"Processing House {house_num} submissions:\n")
+            with open(file_path, 'r') as f:
+                for row in csv.reader(f):
+                    if len(row) < 3:
+                        continue
+                    pos = index.positions.get((row[0], row[1]))
+                    if pos is None:
+                        if (row[0], row[1]) not in unknown:
+                            unknown.add((row[0], row[1]))
+                            out.write(f"! {row[1]} has unknown status\n")
+                        continue
+                    claimed[pos] = RIGHT if index.matches(pos, row[2]) else WRONG
+
+            if not claimed and not unknown:
+                os.remove(tmp)
+                return house_num, 0, f"No submissions found for House {house_num}"
+
+            correct_count = 0
+            for pos in sorted(claimed):
+                name = index.tarfiles[pos]
+                if index.status[pos] == NO_WARRIOR:
+                    label, entry_house = index.labels[pos], index.houses[pos]
+                    if entry_house != str(house_num):
+                        out.write(f"+ Point for {name} ({label} from House {entry_house})\n")
+                        correct_count += 1
+                    else:
+                        out.write(f"- No point for own {label}: {name}\n")
+                elif index.status[pos] == BLANK:
+                    out.write(f"! {name} has unknown status\n")
+                elif claimed[pos] == RIGHT:
+                    out.write(f"✓ Correct hash for {name}\n")
+                    correct_count += 1
+                else:
+                    out.write(f"✗ Incorrect hash for {name}\n")
+            out.write(f"House {house_num} earned {correct_count} points\n")
     except Exception as e:
-        print(f"Error loading submissions for House {house_num}: {e}")
-        return {}
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return house_num, 0, f"Error loading submissions for House {house_num}: {e}"
+    os.replace(tmp, details_path)
+    return house_num, correct_count, None
 
-def update_points(house_points):
+def update_points(house_points, results_file=RESULTS_FILE):
     """Update the points file with current standings."""
     try:
-        with open(RESULTS_FILE, 'w') as f:
-            for house_num in sorted(house_points.keys()):
-                f.write(f"House {house_num} - {house_points[house_num]}\n")
-        print(f"Updated points in {RESULTS_FILE}")
+        with open(results_file, 'w') as f:
+            f.writelines(f"House {h} - {house_points[h]}\n" for h in sorted(house_points, key=house_order))
+        print(f"Updated points in {results_file}")
     except Exception as e:
         print(f"Error updating points file: {e}")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Score every house's Part3 csv against the calculated hashes.")
+    parser.add_argument('--calculated', default=None,
+                        help=f"calculated hashes csv (default: the hashes in --db, else {CALCULATED_CSV})")
+    parser.add_argument('--db', default=RESULTS_DB,
+                        help=f"results database to read hashes from and record points in (default: {RESULTS_DB})")
+    parser.add_argument('--dir', default=THIRD_DIR,
+                        help="folder holding the Part3_{house}.csv files (default: this script's folder)")
+    parser.add_argument('--results', default=RESULTS_FILE,
+                        help=f"points file to write (default: {RESULTS_FILE})")
+    parser.add_argument('--details', default=DETAILS_DIR,
+                        help=f"folder for each house's per-entry report (default: {DETAILS_DIR})")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="houses to score at the same time (default: number of CPUs)")
+    return parser.parse_args()
+
 def main():
-    house_points = {str(i): 0 for i in range(1, 5)}
-    
-    calculated = load_calculated_hashes()
-    if not calculated:
+    args = parse_args()
+    store = results_store.open_store(args.db) if os.path.exists(args.db) else None
+    if args.calculated is None and store and store.warriors():
+        calculated = load_index_from_store(store)
+    else:
+        calculated = load_index(args.calculated or CALCULATED_CSV)
+    if not len(calculated):
         print("No calculated hashes found. Exiting.")
         return
-    
-    for house_num in range(1, 5):
-        house_submissions = load_house_submissions(house_num)
-        if not house_submissions:
-            print(f"No submissions found for House {house_num}")
-            continue
-        
-        print(f"\nProcessing House {house_num} submissions:")
-        correct_count = 0
-        
-        for key, submitted_hash in house_submissions.items():
-            entry_house = key[0]
-            calculated_hash = calculated.get(key)
-            
-            if calculated_hash in ["FILE_NOT_FOUND", "NOT_A_VALID_WARRIOR", "ERROR"]:
-                if entry_house != str(house_num):
-                    print(f"+ Point for {key[1]} ({calculated_hash} from House {entry_house})")
-                    correct_count += 1
-                else:
-                    print(f"- No point for own {calculated_hash}: {key[1]}")
-            elif calculated_hash:
-                if submitted_hash.lower() == calculated_hash.lower():
-                    print(f"✓ Correct hash for {key[1]}")
-                    correct_count += 1
-                else:
-                    print(f"✗ Incorrect hash for {key[1]}")
-            else:
-                print(f"! {key[1]} has unknown status")
-        
-        house_points[str(house_num)] = correct_count
-        print(f"House {house_num} earned {correct_count} points")
-    
-    update_points(house_points)
-    
+
+    house_files = discover_houses(args.dir)
+    house_points = {str(i): 0 for i in range(1, 5)}
+    house_points.update({h: 0 for h in house_files})
+    os.makedirs(args.details, exist_ok=True)
+
+    houses = sorted(house_points, key=house_order)
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs), initializer=init_worker,
+                             initargs=(calculated,)) as pool:
+        futures = [pool.submit(score_house, h, house_files.get(h, os.path.join(args.dir, f'Part3_{h}.csv')),
+                               os.path.join(args.details, f'House_{h}.txt'))
+                   for h in houses]
+        for fut in futures:
+            house_num, points, error = fut.result()
+            if error:
+                print(error)
+                continue
+            house_points[house_num] = points
+            print(f"House {house_num} earned {points} points")
+
+    update_points(house_points, args.results)
+    if store:
+        store.set_house_points('part3', house_points)
+        store.close()
+
     print("\nFinal House Points:")
-    for house_num, points in sorted(house_points.items()):
-        print(f"House {house_num}: {points}")
+    for house_num in houses:
+        print(f"House {house_num}: {house_points[house_num]}")
 
 if __name__ == "__main__":
     main()
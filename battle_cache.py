@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+import os
+import hashlib
+
+CACHE_DIR = os.path.join('core', 'battle_cache')
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+stats = {'hits': 0, 'misses': 0}
+_cache_bytes = None
+
+def file_sha256(file_path):
+    """Calculate SHA256 hash of a file without reading it into memory at once."""
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def battle_key(warrior_paths, args):
+    """Key a battle by the contents and order of its warriors and the pmars arguments."""
+    h = hashlib.sha256()
+    try:
+        for pos, path in enumerate(warrior_paths):
+            h.update(f"{pos}:{file_sha256(path)}\n".encode())
+    except OSError:
+        return None
+    h.update("\0".join(args).encode())
+    return h.hexdigest()
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, key[:2], key)
+
+def lookup(key):
+    """Return the cached result line for key, or None on a miss."""
+    if key is None:
+        stats['misses'] += 1
+        return None
+    path = _entry_path(key)
+    try:
+        with open(path) as f:
+            line = f.read()
+        os.utime(path)
+    except OSError:
+        stats['misses'] += 1
+        return None
+    stats['hits'] += 1
+    return line
+
+def store(key, result_line):
+    """Remember a battle result line, evicting old entries if the cache is full."""
+    global _cache_bytes
+    if key is None or not result_line:
+        return
+    path = _entry_path(key)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'w') as f:
+            f.write(result_line)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Error writing battle cache entry {key[:8]}: {e}")
+        return
+    if _cache_bytes is None:
+        _cache_bytes = sum(size for _, size, _ in _entries())
+    else:
+        _cache_bytes += len(result_line.encode())
+    if _cache_bytes > CACHE_MAX_BYTES:
+        evict()
+
+def _entries():
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield path, st.st_size, st.st_mtime
+
+def evict(max_bytes=CACHE_MAX_BYTES):
+    """Drop least recently used entries until the cache is under 90% of max_bytes."""
+    global _cache_bytes
+    entries = sorted(_entries(), key=lambda e: e[2])
+    total = sum(size for _, size, _ in entries)
+    target = max_bytes * 9 // 10
+    for path, size, _ in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    _cache_bytes = total
+
+def report():
+    print(f"Battle cache: {stats['hits']} hits, {stats['misses']} misses")
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+import sys
+import argparse
+import functools
+import math
+import os
+import shutil
+import time
+from concurrent.futures import as_completed
+
+import battle_cache
+import battle_queue
+import battle_scheduler
+import grading_metrics
+import mars
+import stage_trace
+import warrior_cache
+
+ENGINES = ['pmars', 'python', 'numpy']
+EARLY_STOP_CHUNK = 50
+EARLY_STOP_SEED = mars.DEFAULT_SEED
+# Result line for a battle that ran past the scheduler's timeout.
+TIMEOUT_RESULT = "Timeout"
+
+def pmars_args(rounds):
+    return ['-r', str(rounds), '-f']
+
+def cache_args(rounds, engine, early_stop=None):
+    # The engine's identity is part of the key, so results of an older pmars
+    # binary or mars.py are not reused after it changes. mars and mars_numpy
+    # produce identical tallies, so they share entries.
+    args = pmars_args(rounds) + ['engine=' + _cached_identity('pmars' if engine == 'pmars' else 'python')]
+    if early_stop:
+        chunk, confidence = early_stop
+        # The starters alternate across chunks; results of the older chunks,
+        # which restarted the turns in every chunk, are not reused.
+        args = args + [f'early-stop={chunk},{confidence},per-round']
+    return args
+
+def parse_result_line(line):
+    p = line.split()
+    if not p or p[0].lower() not in ('result:', 'results:'):
+        return None
+    try:
+        return int(p[1]), int(p[2]), int(p[3])
+    except (IndexError, ValueError):
+        return None
+
+def _job_result_line(job):
+    if job.timed_out:
+        return TIMEOUT_RESULT
+    return job.lines[-1] if job.lines else ""
+
+def _pmars_battle(w1, w2, args):
+    try:
+        return _job_result_line(battle_scheduler.get().run(['pmars'] + args + [w1, w2]))
+    except Exception as e:
+        print(f"Error running pmars: {e}")
+        return ""
+
+def _mars_tally(w1, w2, rounds, engine, seed=mars.DEFAULT_SEED, first_round=0):
+    if engine == 'numpy':
+        try:
+            import mars_numpy
+        except ImportError as e:
+            print(f"The numpy engine needs numpy installed: {e}")
+            return None
+        battle = mars_numpy.battle
+    else:
+        battle = mars.battle
+    try:
+        # Each source is assembled once and then read from the warrior cache.
+        return battle(warrior_cache.load(w1, rounds), warrior_cache.load(w2, rounds), rounds, seed,
+                      first_round=first_round)
+    except (OSError, mars.RedcodeError) as e:
+        print(f"Error running mars: {e}")
+        return None
+
+def sign_test_p(wins, losses):
+    """Two-sided sign test p-value for wins vs losses under a fair coin."""
+    n = wins + losses
+    if n == 0:
+        return 1.0
+    k = max(wins, losses)
+    tail = sum(math.comb(n, i) for i in range(k, n + 1)) / 2 ** n
+    return min(1.0, 2 * tail)
+
+def outcome_decided(wins, losses, remaining, confidence=None):
+    """True once the comparison of wins and losses can no longer change, or
+    is settled at the requested confidence."""
+    if abs(wins - losses) > remaining:
+        return True
+    return bool(confidence) and wins != losses and sign_test_p(wins, losses) < 1 - confidence
+
+def _early_stop_battle(w1, w2, rounds, engine, chunk, confidence):
+    wins = losses = ties = played = 0
+    for k in range(0, rounds, chunk):
+        n = min(chunk, rounds - played)
+        tally = _mars_tally(w1, w2, n, engine, EARLY_STOP_SEED + k, played)
+        if tally is None or tally == TIMEOUT_RESULT:
+            return tally or ""
+        wins, losses, ties = wins + tally[0], losses + tally[1], ties + tally[2]
+        played += n
+        if outcome_decided(wins, losses, rounds - played, confidence):
+            break
+    return f"{mars.result_line(wins, losses, ties)} ({played}/{rounds} rounds)"
+
+def run_battle(w1, w2, rounds, engine='pmars', early_stop=None):
+    """Fight w1 against w2 and return the pmars-style 'Results: W L T' line.
+
+    early_stop=(chunk, confidence) plays seeded chunks of rounds and stops as
+    soon as the winner is decided; the line then ends with the rounds played.
+    """
+    with stage_trace.span('battle', warriors=[w1, w2], engine=engine) as trace:
+        t0 = time.perf_counter()
+        key = battle_cache.battle_key([w1, w2], cache_args(rounds, engine, early_stop))
+        cached = battle_cache.lookup(key)
+        if cached is not None:
+            trace['cached'] = True
+            grading_metrics.battle_finished(engine, 0.0, cached=True)
+            return cached
+        if early_stop:
+            result = _early_stop_battle(w1, w2, rounds, engine, *early_stop)
+        elif engine == 'pmars':
+            result = _pmars_battle(w1, w2, pmars_args(rounds))
+        else:
+            tally = _mars_tally(w1, w2, rounds, engine)
+            result = mars.result_line(*tally) if tally else ""
+        if result != TIMEOUT_RESULT:
+            battle_cache.store(key, result)
+        trace['rounds'] = stage_trace.result_rounds(result)
+        grading_metrics.battle_finished(engine, time.perf_counter() - t0, trace['rounds'],
+                                        timed_out=result == TIMEOUT_RESULT)
+        return result
+
+def battles_as_completed(jobs):
+    """Yield (index, result line) for each (w1, w2, rounds, engine, early_stop)
+    job, in the order they finish.
+
+    Plain pmars battles run side by side on the scheduler; cached results
+    and in-process or early-stop battles are produced here in turn.
+    """
+    pending, local = {}, []
+    for i, (w1, w2, rounds, engine, early_stop) in enumerate(jobs):
+        if engine != 'pmars' or early_stop:
+            local.append(i)
+            continue
+        key = battle_cache.battle_key([w1, w2], cache_args(rounds, engine))
+        cached = battle_cache.lookup(key)
+        if cached is not None:
+            stage_trace.record('battle', time.time(), 0.0, warriors=[w1, w2], engine=engine, cached=True)
+            grading_metrics.battle_finished(engine, 0.0, cached=True)
+            yield i, cached
+            continue
+        cmd = ['pmars'] + pmars_args(rounds) + [w1, w2]
+        pending[battle_scheduler.get().submit(cmd)] = (i, key, time.time(), time.perf_counter())
+    for i in local:
+        yield i, run_battle(*jobs[i])
+    for fut in as_completed(pending):
+        i, key, start, t0 = pending[fut]
+        try:
+            result = _job_result_line(fut.result())
+        except Exception as e:
+            print(f"Error running pmars: {e}")
+            result = ""
+        if result != TIMEOUT_RESULT:
+            battle_cache.store(key, result)
+        # Timed from submission, so this includes any wait for a free slot.
+        rounds = stage_trace.result_rounds(result)
+        stage_trace.record('battle', start, time.perf_counter() - t0, warriors=list(jobs[i][:2]),
+                           engine='pmars', rounds=rounds)
+        grading_metrics.battle_finished('pmars', time.perf_counter() - t0, rounds,
+                                        timed_out=result == TIMEOUT_RESULT)
+        yield i, result
+
+def cache_stats():
+    """Snapshot of the battle and warrior cache counters, for cache_stats_since."""
+    return {'battle': dict(battle_cache.stats), 'warrior': dict(warrior_cache.stats)}
+
+def cache_stats_since(before):
+    """What this process added to the cache counters since before; a worker
+    returns it and the parent passes it to add_cache_stats."""
+    now = cache_stats()
+    return {c: {k: now[c][k] - v for k, v in counts.items()} for c, counts in before.items()}
+
+def add_cache_stats(delta):
+    for counts, stats in ((delta['battle'], battle_cache.stats), (delta['warrior'], warrior_cache.stats)):
+        for k, v in counts.items():
+            stats[k] += v
+
+def _positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
+def add_battle_args(parser):
+    parser.add_argument('--battle-timeout', type=float, default=battle_scheduler.BATTLE_TIMEOUT,
+                        help=f"seconds before a pmars run is killed and recorded as a timeout "
+                             f"(default: {battle_scheduler.BATTLE_TIMEOUT})")
+    parser.add_argument('--coordinator', metavar='[HOST:]PORT',
+                        help="serve pmars runs to battle_queue.py workers on this address (or Unix socket "
+                             "path) instead of running them here; a bare PORT listens on 127.0.0.1 only")
+    parser.add_argument('--early-stop', action='store_true',
+                        help="play rounds in seeded chunks and stop once the winner is decided")
+    parser.add_argument('--chunk', type=_positive_int, default=EARLY_STOP_CHUNK,
+                        help=f"rounds per early-stop chunk (default: {EARLY_STOP_CHUNK})")
+    parser.add_argument('--confidence', type=float, default=None,
+                        help="also stop once a sign test settles the winner at this confidence, e.g. 0.99")
+
+def early_stop_setting(args):
+    if not args.early_stop:
+        return None
+    if args.engine == 'pmars':
+        # pmars cannot be reseeded: a chunk would either replay the same
+        # positions every time or need a pmars run per round, which is
+        # slower than the whole battle.
+        sys.exit("--early-stop needs --engine python or numpy")
+    return args.chunk, args.confidence
+
+def worker_jobs(args):
+    """--jobs, capped at the number of cores unless the battles go to a
+    coordinator: every process gets at least one pmars slot, so more
+    processes than cores would run more pmars at once than there are cores."""
+    if args.jobs > battle_scheduler.MAX_CONCURRENT and not args.coordinator:
+        print(f"Using --jobs {battle_scheduler.MAX_CONCURRENT} instead of {args.jobs}, one process per core")
+        return battle_scheduler.MAX_CONCURRENT
+    return args.jobs
+
+def scheduler_setting(args, jobs=1):
+    """(concurrent pmars runs, timeout, coordinator) per process, so that jobs
+    processes together stay within the number of cores. With --coordinator
+    this starts the coordinator, and the runs of every process go to it."""
+    queue = battle_queue.serve(args.coordinator, args.battle_timeout) if args.coordinator else None
+    return max(1, battle_scheduler.MAX_CONCURRENT // max(1, jobs)), args.battle_timeout, queue
+
+def engine_identity(engine):
+    """Describe the MARS that would fight battles, so stored results can be
+    told apart from ones a different binary or engine version would give."""
+    if engine == 'pmars':
+        path = shutil.which('pmars')
+        return f"pmars:{battle_cache.file_sha256(path)}" if path else "pmars:missing"
+    here = os.path.dirname(os.path.abspath(__file__))
+    files = ['mars.py'] + (['mars_numpy.py'] if engine == 'numpy' else [])
+    return engine + ":" + ",".join(battle_cache.file_sha256(os.path.join(here, f)) for f in files)
+
+@functools.lru_cache(maxsize=None)
+def _cached_identity(engine):
+    return engine_identity(engine)
+
+def validate(warrior_path, engine='pmars'):
+    """Return (valid, output lines) for a single warrior, from the warrior
+    cache if this source was validated before."""
+    if engine in ('python', 'numpy'):
+        return warrior_cache.validate(warrior_path)
+    key = warrior_cache.validation_key(warrior_path, _cached_identity(engine))
+    cached = warrior_cache.lookup_validation(key, warrior_path)
+    if cached is not None:
+        return cached
+    try:
+        job = battle_scheduler.get().run(['pmars', warrior_path])
+        if job.timed_out:
+            return False, ["Validation timed out"]
+        output = job.lines
+    except Exception as e:
+        print(f"Error running pmars for validation: {e}")
+        return False, []
+
+    valid = bool(output and "scores" in output[-1].lower())
+    if output:
+        warrior_cache.store_validation(key, warrior_path, valid, output)
+    return valid, output
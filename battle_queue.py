@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""Run pmars battles on other machines.
+
+An evaluation started with --coordinator [HOST:]PORT (or a Unix socket
+path) does not run pmars itself: it serves every pmars run as a job on
+that address, and any number of workers, on this host or others, pull
+jobs, run them and send the output back:
+
+    BATTLE_QUEUE_TOKEN=... python3 battle_queue.py worker HOST:PORT [--slots N]
+
+A bare PORT listens on 127.0.0.1 only; give 0.0.0.0:PORT (or the host's
+address) to take workers from other machines. Every connection has to
+present the shared secret in BATTLE_QUEUE_TOKEN (the coordinator makes
+one up and prints it if it is not set) before it gets a job or can send
+a result, since a stranger posing as a worker could otherwise report any
+result for any battle. The connection is not encrypted, so only use
+addresses other hosts can reach on a network you trust.
+
+A job carries the warrior files' contents and the pmars arguments, so
+workers need pmars but no copy of the submissions. The protocol is one
+JSON object per line:
+
+    client -> coordinator   {"op": "client", "token": t}, then {"id": n, "job": job} per run
+    coordinator -> client   {"id": n, "result": result}
+    worker -> coordinator   {"op": "worker", "slots": N, "token": t}, then {"op": "done", "job": k, "result": result}
+    coordinator -> worker   {"op": "welcome", "timeout": seconds}, then {"job": k, "run": job}
+    coordinator -> either   {"op": "refused", "reason": "token" or "slots"}, then it closes
+
+Each worker gets at most --slots jobs at a time and runs them through its
+own battle_scheduler, with the coordinator's --battle-timeout. Jobs of a
+worker that disconnects, or that holds a job GRACE seconds past the
+timeout, go back to the front of the queue; a job that was handed out
+MAX_ASSIGNMENTS times without coming back is reported as failed.
+
+The evaluation's own processes (including --jobs workers) submit through
+RemoteScheduler, which has the same submit()/run() interface as
+battle_scheduler.Scheduler, so the battle cache and the scoring do not
+change. Workers exit when the coordinator goes away.
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import asyncio
+import secrets
+import argparse
+import tempfile
+import threading
+from collections import deque
+
+import battle_scheduler
+import grading_metrics
+
+DEFAULT_PORT = 5480
+GRACE = 60
+MAX_ASSIGNMENTS = 3
+CONNECT_WAIT = 60
+# Stands for the i-th warrior file in returned output, so messages that
+# name a worker's temporary file name the coordinator's file instead.
+FILE_MARK = '\0file{}\0'
+# Only this program is ever run for a job.
+PROGRAM = 'pmars'
+# Shared secret every client and worker has to send in its hello.
+TOKEN_ENV = 'BATTLE_QUEUE_TOKEN'
+
+def parse_address(text):
+    """('unix', path) for anything with a '/', else ('tcp', host, port)."""
+    if '/' in text:
+        return 'unix', text
+    host, _, port = text.rpartition(':')
+    return 'tcp', host or '127.0.0.1', int(port or DEFAULT_PORT)
+
+def client_address(text):
+    """Where this host reaches a coordinator listening on text."""
+    kind, *where = parse_address(text)
+    if kind == 'unix':
+        return text
+    host, port = where
+    return f"{'127.0.0.1' if host in ('0.0.0.0', '::', '') else host}:{port}"
+
+async def _connect(address):
+    kind, *where = parse_address(address)
+    if kind == 'unix':
+        return await asyncio.open_unix_connection(where[0], limit=2 ** 24)
+    return await asyncio.open_connection(*where, limit=2 ** 24)
+
+def _token():
+    return os.environ.get(TOKEN_ENV, '')
+
+def _send(writer, message):
+    writer.write((json.dumps(message) + "\n").encode())
+
+def job_from_command(cmd):
+    """Split a pmars command into a job and the paths of its warrior files,
+    which are the trailing arguments that name files."""
+    if cmd[0] != PROGRAM:
+        raise ValueError(f"Only {PROGRAM} runs can be queued, not {cmd[0]}")
+    args = list(cmd[1:])
+    n = 0
+    while n < len(args) and os.path.isfile(args[len(args) - 1 - n]):
+        n += 1
+    paths = args[len(args) - n:]
+    files = []
+    for p in paths:
+        with open(p, 'rb') as f:
+            # latin-1 maps bytes to code points one to one, so the worker
+            # writes back exactly these bytes.
+            files.append(f.read().decode('latin-1'))
+    return {'args': args[:len(args) - n], 'files': files}, paths
+
+def failed_result(message):
+    return {'error': message}
+
+def worker_slots(hello):
+    """The slots a worker's hello asks for, or None unless it is a whole number of at least 1."""
+    slots = hello.get('slots', 1)
+    if isinstance(slots, bool) or not isinstance(slots, int) or slots < 1:
+        return None
+    return slots
+
+class _Job:
+    def __init__(self, run, client, client_id):
+        self.run, self.client, self.client_id = run, client, client_id
+        self.assignments = 0
+        self.deadline = None
+
+class Coordinator:
+    """Job queue served on address from a background thread."""
+    def __init__(self, address, timeout=battle_scheduler.BATTLE_TIMEOUT):
+        self.address, self.timeout = address, timeout
+        if not _token():
+            # Set in the environment so that --jobs processes, which
+            # connect as clients, send it too.
+            os.environ[TOKEN_ENV] = secrets.token_hex(16)
+            self.generated = True
+        else:
+            self.generated = False
+        self.token = _token()
+        self.queue = deque()
+        self.jobs = {}
+        self.workers = {}
+        self.next_id = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    async def _start(self):
+        kind, *where = parse_address(self.address)
+        if kind == 'unix':
+            if os.path.exists(where[0]):
+                os.remove(where[0])
+            self.server = await asyncio.start_unix_server(self._handle, where[0], limit=2 ** 24)
+        else:
+            self.server = await asyncio.start_server(self._handle, *where, limit=2 ** 24)
+        self.loop.create_task(self._watchdog())
+        token = self.token if self.generated else f"${TOKEN_ENV}"
+        print(f"Serving pmars runs on {self.address}; start workers with "
+              f"{TOKEN_ENV}={token} python3 battle_queue.py worker {client_address(self.address)}")
+
+    async def _handle(self, reader, writer):
+        try:
+            hello = json.loads(await reader.readline() or b'null')
+        except ValueError:
+            hello = None
+        op = hello.get('op') if isinstance(hello, dict) else None
+        refused = None
+        if op in ('client', 'worker') and not hmac.compare_digest(str(hello.get('token', '')).encode(),
+                                                                   self.token.encode()):
+            refused = 'token'
+        elif op == 'worker' and worker_slots(hello) is None:
+            refused = 'slots'
+        if refused:
+            print(f"Refused a battle {op} from {writer.get_extra_info('peername') or 'local socket'}: "
+                  f"bad {refused}")
+            _send(writer, {'op': 'refused', 'reason': refused})
+            op = None
+        if op == 'client':
+            await self._serve_client(reader, writer)
+        elif op == 'worker':
+            await self._serve_worker(reader, writer, worker_slots(hello))
+        writer.close()
+
+    async def _serve_client(self, reader, writer):
+        mine = set()
+        try:
+            async for line in reader:
+                msg = json.loads(line)
+                k = self.next_id
+                self.next_id += 1
+                self.jobs[k] = _Job(msg['job'], writer, msg['id'])
+                mine.add(k)
+                self.queue.append(k)
+                self._dispatch()
+        except (ConnectionError, ValueError):
+            pass
+        # Nobody is waiting for what this client still had queued.
+        for k in mine:
+            self.jobs.pop(k, None)
+
+    async def _serve_worker(self, reader, writer, slots):
+        name = writer.get_extra_info('peername') or 'local socket'
+        worker = {'writer': writer, 'slots': slots, 'jobs': set()}
+        self.workers[writer] = worker
+        print(f"Battle worker {name} joined with {slots} slots ({len(self.workers)} workers)")
+        _send(writer, {'op': 'welcome', 'timeout': self.timeout})
+        self._dispatch()
+        try:
+            async for line in reader:
+                msg = json.loads(line)
+                worker['jobs'].discard(msg['job'])
+                self._finish(msg['job'], msg['result'])
+                self._dispatch()
+        except (ConnectionError, ValueError):
+            pass
+        del self.workers[writer]
+        if worker['jobs']:
+            print(f"Battle worker {name} left with {len(worker['jobs'])} runs, handing them to others")
+        else:
+            print(f"Battle worker {name} left ({len(self.workers)} workers)")
+        for k in sorted(worker['jobs'], reverse=True):
+            job = self.jobs.get(k)
+            if job is None:
+                continue
+            if job.assignments >= MAX_ASSIGNMENTS:
+                self._finish(k, failed_result(f"run lost by {MAX_ASSIGNMENTS} workers"))
+            else:
+                self.queue.appendleft(k)
+        self._dispatch()
+
+    def _finish(self, k, result):
+        job = self.jobs.pop(k, None)
+        if job is None:
+            return
+        try:
+            _send(job.client, {'id': job.client_id, 'result': result})
+        except (ConnectionError, RuntimeError):
+            pass
+
+    def _dispatch(self):
+        while self.queue:
+            free = [w for w in self.workers.values() if len(w['jobs']) < w['slots']]
+            if not free:
+                break
+            k = self.queue.popleft()
+            job = self.jobs.get(k)
+            if job is None:
+                continue
+            worker = max(free, key=lambda w: w['slots'] - len(w['jobs']))
+            worker['jobs'].add(k)
+            job.assignments += 1
+            job.deadline = time.monotonic() + self.timeout + GRACE
+            _send(worker['writer'], {'job': k, 'run': job.run})
+        grading_metrics.set_gauge('grading_coordinator_queue', len(self.queue))
+
+    async def _watchdog(self):
+        # A worker kills pmars at the timeout itself, so one that still holds
+        # a job GRACE seconds later is hung; dropping its connection hands
+        # its jobs to the others.
+        while True:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            for writer, worker in list(self.workers.items()):
+                if any(k in self.jobs and self.jobs[k].deadline < now for k in worker['jobs']):
+                    print(f"Battle worker {writer.get_extra_info('peername')} stopped answering, dropping it")
+                    writer.transport.abort()
+
+class RemoteScheduler:
+    """battle_scheduler.Scheduler look-alike whose runs go to a coordinator."""
+    def __init__(self, address):
+        self.address = address
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.writer = None
+        self.connecting = None
+        self.reading = None
+        self.pending = {}
+        self.next_id = 0
+
+    async def _ensure_connected(self):
+        # Runs submitted together wait for the same connection.
+        if self.connecting is None:
+            self.connecting = asyncio.Lock()
+        async with self.connecting:
+            if self.writer is None:
+                reader, self.writer = await _connect(self.address)
+                _send(self.writer, {'op': 'client', 'token': _token()})
+                self.reading = self.loop.create_task(self._read(reader))
+
+    async def _read(self, reader):
+        async for line in reader:
+            msg = json.loads(line)
+            fut = self.pending.pop(msg['id'], None)
+            if fut is not None and not fut.done():
+                fut.set_result(msg['result'])
+        self.writer = None
+        for fut in self.pending.values():
+            fut.set_exception(ConnectionError(f"coordinator {self.address} went away"))
+        self.pending.clear()
+
+    async def _run(self, job, paths):
+        await self._ensure_connected()
+        k = self.next_id
+        self.next_id += 1
+        fut = self.pending[k] = self.loop.create_future()
+        _send(self.writer, {'id': k, 'job': job})
+        await self.writer.drain()
+        result = await fut
+        if 'error' in result:
+            raise OSError(f"{result['error']}")
+        lines = result['lines']
+        for i, p in enumerate(paths):
+            lines = [line.replace(FILE_MARK.format(i), p) for line in lines]
+        return battle_scheduler.JobResult(lines, result['returncode'], result['timed_out'], result['attempts'])
+
+    def submit(self, cmd):
+        """Queue cmd on the coordinator; return a Future that resolves to a JobResult."""
+        job, paths = job_from_command(cmd)
+        return asyncio.run_coroutine_threadsafe(self._run(job, paths), self.loop)
+
+    def run(self, cmd):
+        return self.submit(cmd).result()
+
+_coordinator = None
+
+def serve(address, timeout):
+    """Start this process's coordinator on address; return the address its
+    clients connect to."""
+    global _coordinator
+    if _coordinator is None:
+        _coordinator = Coordinator(address, timeout)
+    return client_address(address)
+
+async def _run_job(writer, scheduler, k, run):
+    try:
+        with tempfile.TemporaryDirectory(prefix='battle_queue') as d:
+            paths = []
+            for i, text in enumerate(run['files']):
+                paths.append(os.path.join(d, f"warrior{i}.red"))
+                with open(paths[-1], 'wb') as f:
+                    f.write(text.encode('latin-1'))
+            res = await asyncio.wrap_future(scheduler.submit([PROGRAM] + run['args'] + paths))
+        lines = res.lines
+        for i, p in enumerate(paths):
+            lines = [line.replace(p, FILE_MARK.format(i)) for line in lines]
+        result = {'lines': lines, 'returncode': res.returncode, 'timed_out': res.timed_out,
+                  'attempts': res.attempts}
+    except Exception as e:
+        result = failed_result(f"{type(e).__name__}: {e}")
+    _send(writer, {'op': 'done', 'job': k, 'result': result})
+    await writer.drain()
+
+async def work(address, slots):
+    """Run jobs from the coordinator at address until it goes away."""
+    deadline = time.monotonic() + CONNECT_WAIT
+    while True:
+        try:
+            reader, writer = await _connect(address)
+            break
+        except OSError as e:
+            if time.monotonic() > deadline:
+                print(f"Could not reach coordinator {address}: {e}")
+                return 1
+            await asyncio.sleep(1)
+    _send(writer, {'op': 'worker', 'slots': slots, 'token': _token()})
+    welcome = json.loads(await reader.readline() or b'{}')
+    if welcome.get('op') == 'refused':
+        if welcome.get('reason') == 'slots':
+            print(f"{address} refused --slots {slots}")
+        else:
+            print(f"{address} refused the token; set {TOKEN_ENV} to the one the coordinator printed")
+        return 1
+    if welcome.get('op') != 'welcome':
+        print(f"{address} is not a battle coordinator")
+        return 1
+    print(f"Connected to {address}, running up to {slots} battles at a time")
+    scheduler = battle_scheduler.Scheduler(slots, welcome['timeout'])
+    tasks, done = set(), 0
+    async for line in reader:
+        msg = json.loads(line)
+        task = asyncio.ensure_future(_run_job(writer, scheduler, msg['job'], msg['run']))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        done += 1
+    print(f"Coordinator closed the connection after {done} runs")
+    for task in tasks:
+        task.cancel()
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Run pmars battles for a coordinator.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    w = sub.add_parser('worker', help="pull battles from a coordinator and run them")
+    w.add_argument('address', help="coordinator as HOST:PORT or a Unix socket path")
+    w.add_argument('--slots', type=int, default=battle_scheduler.MAX_CONCURRENT,
+                   help=f"battles to run at the same time (default: {battle_scheduler.MAX_CONCURRENT})")
+    args = parser.parse_args()
+    try:
+        return asyncio.run(work(args.address, max(1, args.slots)))
+    except KeyboardInterrupt:
+        return 130
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Shared asyncio scheduler for pmars runs.
+
+Every pmars process started by the evaluation scripts goes through one
+event loop running in a background thread. A semaphore keeps at most
+`limit` of them running at once, each run is killed after `timeout`
+seconds and reported as timed out, and runs that fail for transient
+reasons (the process could not be started, or died from a signal without
+printing anything) are retried. submit() returns a concurrent.futures
+Future, so callers can block on one run or use as_completed() to handle
+results as they finish.
+"""
+import os
+import errno
+import signal
+import asyncio
+import threading
+from collections import namedtuple
+
+import grading_metrics
+
+MAX_CONCURRENT = os.cpu_count() or 1
+BATTLE_TIMEOUT = 300
+RETRIES = 2
+RETRY_DELAY = 0.5
+TRANSIENT_ERRNOS = {errno.EAGAIN, errno.ENOMEM, errno.EMFILE, errno.ENFILE}
+
+# lines: stdout lines of the last attempt; timed_out: killed after the timeout.
+JobResult = namedtuple('JobResult', 'lines returncode timed_out attempts')
+
+class Scheduler:
+    def __init__(self, limit=MAX_CONCURRENT, timeout=BATTLE_TIMEOUT, retries=RETRIES):
+        self.limit, self.timeout, self.retries = limit, timeout, retries
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = asyncio.Semaphore(limit)
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    async def _run_once(self, cmd):
+        proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                    stderr=asyncio.subprocess.DEVNULL,
+                                                    start_new_session=True)
+        try:
+            out, _ = await asyncio.wait_for(proc.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            # Kill the whole session: anything left holding stdout would
+            # otherwise keep the run alive.
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+            return None, [], True
+        return proc.returncode, out.decode(errors='replace').strip().splitlines(), False
+
+    async def _run(self, cmd):
+        grading_metrics.gauge_add('grading_pmars_queued', 1)
+        async with self.semaphore:
+            grading_metrics.gauge_add('grading_pmars_queued', -1)
+            grading_metrics.gauge_add('grading_pmars_running', 1)
+            try:
+                return await self._run_attempts(cmd)
+            finally:
+                grading_metrics.gauge_add('grading_pmars_running', -1)
+
+    async def _run_attempts(self, cmd):
+        for attempt in range(1, self.retries + 2):
+            try:
+                returncode, lines, timed_out = await self._run_once(cmd)
+            except OSError as e:
+                if e.errno not in TRANSIENT_ERRNOS or attempt > self.retries:
+                    raise
+            else:
+                killed = returncode is not None and returncode < 0 and not lines
+                if timed_out or not killed or attempt > self.retries:
+                    return JobResult(lines, returncode, timed_out, attempt)
+            await asyncio.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+
+    def submit(self, cmd):
+        """Queue cmd; return a Future that resolves to a JobResult."""
+        return asyncio.run_coroutine_threadsafe(self._run(cmd), self.loop)
+
+    def run(self, cmd):
+        """Run cmd and wait for its JobResult."""
+        return self.submit(cmd).result()
+
+_settings = {'limit': MAX_CONCURRENT, 'timeout': BATTLE_TIMEOUT, 'queue': None}
+_scheduler = None
+_scheduler_pid = None
+
+def configure(limit=None, timeout=None, queue=None):
+    """Change the settings used by the next get(); call before any battle.
+    With queue (a coordinator address) runs go to battle_queue workers."""
+    global _scheduler
+    if limit is not None:
+        _settings['limit'] = max(1, limit)
+    if timeout is not None:
+        _settings['timeout'] = timeout
+    _settings['queue'] = queue
+    _scheduler = None
+
+def get():
+    """Return this process's scheduler, starting it on first use.
+
+    The loop thread does not survive a fork, so a worker process started
+    from a parent that already had a scheduler gets its own.
+    """
+    global _scheduler, _scheduler_pid
+    if _scheduler is None or _scheduler_pid != os.getpid():
+        if _settings['queue']:
+            import battle_queue
+            _scheduler = battle_queue.RemoteScheduler(_settings['queue'])
+        else:
+            _scheduler = Scheduler(_settings['limit'], _settings['timeout'])
+        _scheduler_pid = os.getpid()
+    return _scheduler
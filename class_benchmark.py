@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""End-to-end throughput benchmark on synthetic classes.
+
+For every size, a class of N students spread over the houses is generated
+in a scratch folder: one tarball per student whose Makefile decrypts a
+basic warrior, or the advanced one when the student's variable is set, and
+the matching Env_variables.csv rows. Some students get a slow build, a
+broken advanced warrior or a build that runs past --build-timeout. Then
+First_evaluation, Hash_calculator, Second_evaluation and Third_evaluation
+run there one after the other and each is timed:
+
+    python3 class_benchmark.py [--sizes 8,32,128] [--jobs N] [--output bench.json]
+    python3 class_benchmark.py --compare bench.json
+
+reports students/sec, battles/sec and peak memory (of the script and
+everything it ran) per stage. --compare exits non-zero when a stage got
+slower than the given run by more than --tolerance.
+
+    python3 class_benchmark.py --generate DIR --students 40
+
+only writes a class to DIR.
+"""
+import io
+import os
+import re
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import tarfile
+import tempfile
+import subprocess
+
+import battle_engine
+import mars
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASIC_DIR = os.path.join(HERE, 'basic_warriors')
+# Same alphabet as make_rand_env.py.
+KEY_ALPHABET = "QWERTYUIOPLKJHGF"
+SIZES = [8, 32, 128]
+HOUSES = 4
+SLOW, BROKEN, TIMEOUT = 0.05, 0.05, 0.02
+SLOW_SECONDS = 1
+BUILD_TIMEOUT = 3
+TOLERANCE = 0.25
+
+MAKEFILE = """default:
+\t{extra}python3 decrypt.py
+"""
+
+# Picks the advanced warrior when one of the grader's 9-letter variables
+# is set, like the sample tarballs; the variable name is the key.
+DECRYPT_PY = """import os, re, hashlib
+names = [k for k in os.environ if re.fullmatch('[%s]{9}', k)]
+src = 'advanced.bin' if names else 'basic.bin'
+key = hashlib.sha256((names[0] if names else '').encode()).digest()
+data = open(src, 'rb').read()
+with open('chooseyourfighter.red', 'wb') as f:
+    f.write(bytes(b ^ key[i %% 32] for i, b in enumerate(data)))
+""" % KEY_ALPHABET
+
+WARRIOR_BODIES = [
+    # imp
+    "start mov.i #{a}, 1\n",
+    # dwarf
+    "start add.ab #{step}, bomb\n mov.i bomb, @bomb\n jmp start\nbomb dat #0, #0\n",
+    # stone with a core clear
+    "start spl 0\nloop mov.i bomb, @ptr\n add.ab #{step}, ptr\n djn.f loop, <{b}\nptr dat #0, #{a}\nbomb dat #0, #0\n",
+    # replicator
+    "start spl 1\n spl 1\nsrc mov.i #{a}, #0\n mov.i <src, <dst\n jmn.b -1, src\n spl @dst\n mov.ab #{b}, dst\ndst jmz.b -5, #{step}\n",
+    # scanner
+    "start add.f step, scan\nscan sne.i {a}, {b}\n djn.f start, <-{step}\n mov.i bomb, >scan\n jmp start\nstep dat #{step}, #{step}\nbomb dat #0, #0\n",
+]
+
+def random_key(rng):
+    return "".join(rng.choice(KEY_ALPHABET) for _ in range(9))
+
+def random_warrior(rng, name):
+    body = rng.choice(WARRIOR_BODIES).format(a=rng.randrange(1, 4000), b=rng.randrange(1, 4000),
+                                             step=rng.randrange(2, 3000))
+    text = f";redcode-94\n;name {name}\n;author class_benchmark\n{body} end start\n"
+    mars.assemble(text)
+    return text
+
+def encrypt(text, key_name):
+    key = hashlib.sha256(key_name.encode()).digest()
+    return bytes(b ^ key[i % 32] for i, b in enumerate(text.encode()))
+
+def make_tarball(path, files):
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size, info.mode, info.mtime = len(data), 0o644, 0
+            tar.addfile(info, fileobj=io.BytesIO(data))
+
+def generate_class(dest, students, houses=HOUSES, seed=0, slow=SLOW, broken=BROKEN, timeouts=TIMEOUT,
+                   build_timeout=BUILD_TIMEOUT):
+    """Write tarballs/, basic_warriors/ and Env_variables.csv for a synthetic
+    class to dest; return {variant: count}."""
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(dest, 'tarballs'), exist_ok=True)
+    shutil.copytree(BASIC_DIR, os.path.join(dest, 'basic_warriors'), dirs_exist_ok=True)
+    counts = {'normal': 0, 'slow': 0, 'broken': 0, 'timeout': 0, 'identical': 0}
+    rows = []
+    for i in range(students):
+        name = f"student{i:05d}"
+        key = random_key(rng)
+        basic = random_warrior(rng, f"{name} basic")
+        advanced = random_warrior(rng, f"{name} advanced")
+        extra = ""
+        r = rng.random()
+        if r < timeouts:
+            variant, extra = 'timeout', f"sleep {build_timeout + 2}; "
+        elif r < timeouts + broken:
+            variant, advanced = 'broken', "this is not redcode\n"
+        elif r < timeouts + broken + slow:
+            variant, extra = 'slow', f"sleep {SLOW_SECONDS}; "
+        elif r < timeouts + broken + slow + 0.05:
+            variant, advanced = 'identical', basic
+        else:
+            variant = 'normal'
+        counts[variant] += 1
+        make_tarball(os.path.join(dest, 'tarballs', f"{name}.tgz"), {
+            'Makefile': MAKEFILE.format(extra=extra).encode(),
+            'decrypt.py': DECRYPT_PY.encode(),
+            'basic.bin': encrypt(basic, ''),
+            'advanced.bin': encrypt(advanced, key),
+        })
+        rows.append([str(i % houses + 1), f"{name}.tgz", key])
+    with open(os.path.join(dest, 'Env_variables.csv'), 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+    return counts
+
+def write_part3(dest, houses=HOUSES, seed=0, correct=0.7):
+    """Each house's Part3 csv: a guess for every other house's warrior,
+    right about `correct` of the time."""
+    rng = random.Random(seed)
+    third = os.path.join(dest, 'Third_evaluation')
+    os.makedirs(third, exist_ok=True)
+    with open(os.path.join(dest, 'calculated_sha256.csv')) as f:
+        calculated = [r for r in csv.reader(f) if len(r) >= 3]
+    for h in range(1, houses + 1):
+        with open(os.path.join(third, f"Part3_{h}.csv"), 'w', newline='') as f:
+            w = csv.writer(f)
+            for house, tb, value in calculated:
+                if house != str(h):
+                    guess = value if rng.random() < correct else "%064x" % rng.getrandbits(256)
+                    w.writerow([house, tb, guess])
+
+def run_stage(cmd, cwd):
+    """Run one script; return (seconds, peak RSS in KiB, output)."""
+    start = time.perf_counter()
+    with tempfile.TemporaryFile() as out:
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=out, stderr=subprocess.STDOUT)
+        _, status, ru = os.wait4(proc.pid, 0)
+        seconds = time.perf_counter() - start
+        out.seek(0)
+        text = out.read().decode(errors='replace')
+    if os.waitstatus_to_exitcode(status) != 0:
+        print(f"{' '.join(cmd)} failed:\n{text[-2000:]}")
+    return seconds, ru.ru_maxrss, text
+
+def battles_played(output):
+    """Battles actually fought, from the 'Battle cache: H hits, M misses' line."""
+    m = re.search(r'Battle cache: (\d+) hits, (\d+) misses', output)
+    return int(m.group(2)) if m else 0
+
+def benchmark_size(dest, students, args):
+    counts = generate_class(dest, students, args.houses, args.seed, args.slow, args.broken, args.timeouts,
+                            args.build_timeout)
+    py = sys.executable
+    engine = ['--engine', args.engine]
+    stages = [
+        ('First_evaluation', [py, os.path.join(HERE, 'First_evaluation.py'), '--jobs', str(args.jobs),
+                              '--build-timeout', str(args.build_timeout)] + engine, dest),
+        ('Hash_calculator', [py, os.path.join(HERE, 'Hash_calculator.py')], dest),
+        ('Second_evaluation', [py, os.path.join(HERE, 'Second_evaluation.py'), '--jobs', str(args.jobs),
+                               '--seed', str(args.seed)] + engine, dest),
+        ('Third_evaluation', [py, os.path.join(HERE, 'Third_evaluation', 'Third_evaluation.py'),
+                              '--jobs', str(args.jobs), '--db', os.path.join(dest, 'core', 'results.db'),
+                              '--dir', '.', '--results', 'Part3_Points.txt', '--details', 'Part3_Details'],
+         os.path.join(dest, 'Third_evaluation')),
+    ]
+    results = []
+    for name, cmd, cwd in stages:
+        if name == 'Third_evaluation':
+            write_part3(dest, args.houses, args.seed)
+        seconds, peak_kb, output = run_stage(cmd, cwd)
+        results.append({'students': students, 'stage': name, 'seconds': seconds,
+                        'battles': battles_played(output), 'peak_kb': peak_kb})
+    return counts, results
+
+def print_results(results):
+    print(f"{'students':>8}  {'stage':<18}{'seconds':>9}{'students/s':>12}{'battles':>9}{'battles/s':>11}{'peak MiB':>10}")
+    for r in results:
+        bps = f"{r['battles'] / r['seconds']:.1f}" if r['battles'] else "-"
+        print(f"{r['students']:>8}  {r['stage']:<18}{r['seconds']:>9.2f}{r['students'] / r['seconds']:>12.2f}"
+              f"{r['battles']:>9}{bps:>11}{r['peak_kb'] / 1024:>10.1f}")
+
+def compare(results, baseline_path, tolerance):
+    """Print how each stage changed against an earlier --output file; return
+    False if any got slower by more than tolerance."""
+    with open(baseline_path) as f:
+        baseline = {(r['students'], r['stage']): r for r in json.load(f)['results']}
+    ok, compared = True, 0
+    print(f"\nAgainst {baseline_path}:")
+    for r in results:
+        old = baseline.get((r['students'], r['stage']))
+        if not old:
+            continue
+        compared += 1
+        ratio = r['seconds'] / old['seconds'] if old['seconds'] else 1.0
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag, ok = "  SLOWER", False
+        print(f"{r['students']:>8}  {r['stage']:<18}{old['seconds']:>9.2f} -> {r['seconds']:.2f}s ({ratio:.2f}x){flag}")
+    if not compared:
+        print("No class sizes in common.")
+    return ok
+
+def default_engine():
+    if shutil.which('pmars'):
+        return 'pmars'
+    try:
+        import numpy
+        return 'numpy'
+    except ImportError:
+        return 'python'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the grading pipeline on synthetic classes.")
+    parser.add_argument('--sizes', default=",".join(map(str, SIZES)),
+                        help=f"comma-separated class sizes (default: {','.join(map(str, SIZES))})")
+    parser.add_argument('--houses', type=int, default=HOUSES, choices=range(1, HOUSES + 1),
+                        help=f"houses to spread students over; the evaluations grade houses 1-{HOUSES} "
+                             f"(default: {HOUSES})")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="--jobs passed to the evaluations (default: number of CPUs)")
+    parser.add_argument('--engine', choices=battle_engine.ENGINES, default=default_engine(),
+                        help="--engine passed to the evaluations (default: pmars if installed, else numpy "
+                             "if importable, else python)")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the class and the draws (default: 0)")
+    parser.add_argument('--slow', type=float, default=SLOW,
+                        help=f"fraction of builds that sleep {SLOW_SECONDS}s (default: {SLOW})")
+    parser.add_argument('--broken', type=float, default=BROKEN,
+                        help=f"fraction of advanced warriors that are not valid Redcode (default: {BROKEN})")
+    parser.add_argument('--timeouts', type=float, default=TIMEOUT,
+                        help=f"fraction of builds that run past --build-timeout (default: {TIMEOUT})")
+    parser.add_argument('--build-timeout', type=int, default=BUILD_TIMEOUT,
+                        help=f"--build-timeout passed to First_evaluation (default: {BUILD_TIMEOUT})")
+    parser.add_argument('--output', help="write the results as JSON here")
+    parser.add_argument('--compare', help="compare against the JSON written by an earlier --output")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help=f"slowdown allowed by --compare (default: {TOLERANCE})")
+    parser.add_argument('--keep', action='store_true', help="keep the generated classes")
+    parser.add_argument('--generate', metavar='DIR', help="only write a class to DIR")
+    parser.add_argument('--students', type=int, default=SIZES[0], help="class size for --generate")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.generate:
+        counts = generate_class(args.generate, args.students, args.houses, args.seed, args.slow, args.broken,
+                                args.timeouts, args.build_timeout)
+        print(f"Wrote {args.students} students to {args.generate}: "
+              + ", ".join(f"{v} {k}" for k, v in counts.items()))
+        return 0
+
+    results = []
+    for n in [int(s) for s in args.sizes.split(',') if s]:
+        dest = tempfile.mkdtemp(prefix=f'class_{n}_')
+        try:
+            counts, rs = benchmark_size(dest, n, args)
+        finally:
+            if not args.keep:
+                shutil.rmtree(dest, ignore_errors=True)
+        print(f"{n} students ({', '.join(f'{v} {k}' for k, v in counts.items())})"
+              + (f" in {dest}" if args.keep else ""))
+        results += rs
+    print()
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'engine': args.engine, 'jobs': args.jobs, 'results': results}, f, indent=1)
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""Live counters for long grading runs.
+
+With --metrics-port PORT, the evaluation scripts serve Prometheus text
+format on http://127.0.0.1:PORT/metrics. With --status SECONDS they print
+a one-line summary to stderr that often:
+
+    [status 12:03:44] 37/120 students (31%), 2 builds running, 4.1 battles/s,
+    cache 38% hits, 0 timeouts, 3 queued, ETA 21m40s
+
+Counters and histograms are kept per process. Worker processes inherit
+the setting through the environment (like stage_trace) and write a
+snapshot to METRICS_DIR/<pid>.json every FLUSH_INTERVAL seconds; the
+main process adds them to its own when it serves or prints them.
+
+The ETA divides the work still to do (students, matches) by the rate
+over the last RATE_WINDOW seconds, so students reused from an earlier
+run do not make it look too good for long.
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_DIR = os.path.join('core', 'metrics')
+ENV_VAR = 'GRADING_METRICS'
+FLUSH_INTERVAL = 1.0
+RATE_WINDOW = 60.0
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+ROUND_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+
+HELP = {
+    'grading_work_units': "Work this run has to do (students or matches)",
+    'grading_work_done_total': "Work finished so far",
+    'grading_builds_in_flight': "make runs going on now",
+    'grading_build_seconds': "Wall time of each make",
+    'grading_build_timeouts_total': "Builds killed at the build timeout",
+    'grading_battles_total': "Battles finished, cached ones included",
+    'grading_battle_cache_hits_total': "Battles answered from the battle cache",
+    'grading_battle_seconds': "Wall time of each battle that was fought",
+    'grading_round_seconds': "Wall time per round of each battle that was fought",
+    'grading_battle_timeouts_total': "Battles killed at the battle timeout",
+    'grading_pmars_queued': "pmars runs waiting for a free slot",
+    'grading_pmars_running': "pmars runs going on now",
+    'grading_coordinator_queue': "Jobs waiting for a battle_queue worker",
+}
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = defaultdict(float)
+_histograms = {}
+_dirty = False
+_flusher_pid = None
+_work = {'unit': 'students'}
+_history = deque()
+
+def _forget_parent():
+    # A forked worker starts from copies of the parent's numbers, which the
+    # parent reports itself, and of a lock another thread may have held.
+    global _lock, _dirty
+    _lock = threading.Lock()
+    for table in (_counters, _gauges, _histograms):
+        table.clear()
+    _dirty = False
+
+os.register_at_fork(after_in_child=_forget_parent)
+
+def configure(port=None, status=None):
+    """Start collecting metrics here and in every process started from now
+    on; serve them on port and print a status line every status seconds."""
+    if not port and not status:
+        os.environ.pop(ENV_VAR, None)
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    for name in os.listdir(METRICS_DIR):
+        if name.endswith('.json'):
+            os.remove(os.path.join(METRICS_DIR, name))
+    os.environ[ENV_VAR] = METRICS_DIR
+    global _flusher_pid
+    _flusher_pid = os.getpid()
+    if port:
+        server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Metrics on http://127.0.0.1:{port}/metrics")
+    if status:
+        _history.append((time.monotonic(), 0, 0))
+        threading.Thread(target=_status_loop, args=(status,), daemon=True).start()
+
+def enabled():
+    return bool(os.environ.get(ENV_VAR))
+
+def add_metrics_args(parser):
+    parser.add_argument('--metrics-port', type=int, default=None, metavar='PORT',
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument('--status', type=float, default=None, metavar='SECONDS',
+                        help="print progress, throughput and an ETA to stderr this often")
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+def _changed():
+    global _dirty, _flusher_pid
+    _dirty = True
+    if _flusher_pid != os.getpid():
+        # First update in a worker process: write snapshots from here on.
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, daemon=True).start()
+
+def inc(name, value=1, **labels):
+    if not enabled():
+        return
+    with _lock:
+        _counters[_key(name, labels)] += value
+        _changed()
+
+def gauge_add(name, value, **labels):
+    if not enabled():
+        return
+    with _lock:
+        _gauges[_key(name, labels)] += value
+        _changed()
+
+def set_gauge(name, value, **labels):
+    if not enabled():
+        return
+    with _lock:
+        _gauges[_key(name, labels)] = value
+        _changed()
+
+def observe(name, value, buckets=SECONDS_BUCKETS, **labels):
+    if not enabled():
+        return
+    with _lock:
+        key = _key(name, labels)
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1), 'sum': 0.0}
+        h['counts'][bisect.bisect_left(h['buckets'], value)] += 1
+        h['sum'] += value
+        _changed()
+
+def set_work(total, unit):
+    """The run has total units (e.g. 'students', 'matches') of work to do."""
+    _work['unit'] = unit
+    set_gauge('grading_work_units', total)
+
+def work_done(n=1):
+    inc('grading_work_done_total', n)
+
+def battle_finished(engine, seconds, rounds=None, cached=False, timed_out=False):
+    inc('grading_battles_total', engine=engine)
+    if cached:
+        inc('grading_battle_cache_hits_total', engine=engine)
+        return
+    if timed_out:
+        inc('grading_battle_timeouts_total', engine=engine)
+    observe('grading_battle_seconds', seconds, engine=engine)
+    if rounds:
+        observe('grading_round_seconds', seconds / rounds, ROUND_BUCKETS, engine=engine)
+
+def build_finished(seconds, timed_out):
+    observe('grading_build_seconds', seconds)
+    if timed_out:
+        inc('grading_build_timeouts_total')
+
+def _snapshot():
+    with _lock:
+        return {'counters': [[n, l, v] for (n, l), v in _counters.items()],
+                'gauges': [[n, l, v] for (n, l), v in _gauges.items()],
+                'histograms': [[n, l, h] for (n, l), h in _histograms.items()]}
+
+def _flush_loop():
+    global _dirty
+    path = os.path.join(os.environ[ENV_VAR], f"{os.getpid()}.json")
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        if not _dirty:
+            continue
+        _dirty = False
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(_snapshot(), f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+def collect():
+    """This process's metrics plus every worker's latest snapshot, as
+    (counters, gauges, histograms) keyed by (name, labels)."""
+    snapshots = [_snapshot()]
+    directory = os.environ.get(ENV_VAR)
+    for name in os.listdir(directory) if directory and os.path.isdir(directory) else []:
+        if name.endswith('.json') and name != f"{os.getpid()}.json":
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                pass
+    counters, gauges, histograms = defaultdict(float), defaultdict(float), {}
+    for snap in snapshots:
+        for n, l, v in snap['counters']:
+            counters[(n, tuple(map(tuple, l)))] += v
+        for n, l, v in snap['gauges']:
+            gauges[(n, tuple(map(tuple, l)))] += v
+        for n, l, h in snap['histograms']:
+            key = (n, tuple(map(tuple, l)))
+            if key not in histograms:
+                histograms[key] = {'buckets': h['buckets'], 'counts': list(h['counts']), 'sum': h['sum']}
+            else:
+                histograms[key]['counts'] = [a + b for a, b in zip(histograms[key]['counts'], h['counts'])]
+                histograms[key]['sum'] += h['sum']
+    return counters, gauges, histograms
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}" if items else ""
+
+def exposition():
+    """All metrics in the Prometheus text format."""
+    counters, gauges, histograms = collect()
+    lines, typed = [], set()
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+    for (name, labels), v in sorted(counters.items()):
+        header(name, 'counter')
+        lines.append(f"{name}{_labels(labels)} {v:g}")
+    for (name, labels), v in sorted(gauges.items()):
+        header(name, 'gauge')
+        lines.append(f"{name}{_labels(labels)} {v:g}")
+    for (name, labels), h in sorted(histograms.items()):
+        header(name, 'histogram')
+        total = 0
+        for bound, count in zip(h['buckets'] + ['+Inf'], h['counts']):
+            total += count
+            lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {total}")
+        lines.append(f"{name}_sum{_labels(labels)} {h['sum']:g}")
+        lines.append(f"{name}_count{_labels(labels)} {total}")
+    return "\n".join(lines) + "\n"
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = exposition().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def _total(table, name):
+    return sum(v for (n, _), v in table.items() if n == name)
+
+def _duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+def status_line():
+    counters, gauges, _ = collect()
+    now = time.monotonic()
+    done = _total(counters, 'grading_work_done_total')
+    battles = _total(counters, 'grading_battles_total')
+    _history.append((now, done, battles))
+    while len(_history) > 2 and now - _history[1][0] >= RATE_WINDOW:
+        _history.popleft()
+    t0, done0, battles0 = _history[0]
+    elapsed = now - t0
+    total = _total(gauges, 'grading_work_units')
+    hits = _total(counters, 'grading_battle_cache_hits_total')
+    timeouts = (_total(counters, 'grading_battle_timeouts_total') + _total(counters, 'grading_build_timeouts_total'))
+    queued = _total(gauges, 'grading_pmars_queued') + _total(gauges, 'grading_coordinator_queue')
+    parts = [f"{done:.0f}/{total:.0f} {_work['unit']}" + (f" ({100 * done / total:.0f}%)" if total else ""),
+             f"{_total(gauges, 'grading_builds_in_flight'):.0f} builds running",
+             f"{(battles - battles0) / elapsed if elapsed else 0:.1f} battles/s",
+             f"cache {100 * hits / battles if battles else 0:.0f}% hits",
+             f"{timeouts:.0f} timeouts", f"{queued:.0f} queued"]
+    rate = (done - done0) / elapsed if elapsed else 0
+    if total and done >= total:
+        parts.append("done")
+    elif rate > 0:
+        parts.append(f"ETA {_duration((total - done) / rate)}")
+    else:
+        parts.append("ETA unknown")
+    return f"[status {time.strftime('%H:%M:%S')}] " + ", ".join(parts)
+
+def _status_loop(interval):
+    while True:
+        time.sleep(interval)
+        print(status_line(), file=sys.stderr, flush=True)
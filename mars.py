@@ -0,0 +1,720 @@
+#!/usr/bin/env python3
+"""Pure-Python Redcode-94 MARS.
+
+Assembles warriors the way pmars does by default (EQU text substitution,
+FOR/ROF with &counter concatenation, ORG/END, ;assert) and runs battles with
+the pmars default parameters, so it can stand in for spawning the pmars
+binary. Usage mirrors pmars:
+
+    python3 mars.py [-r rounds] [-F pos] [-s seed] warrior1.red [warrior2.red]
+"""
+import re
+import sys
+import random
+import argparse
+from collections import deque, namedtuple
+
+CORESIZE = 8000
+MAXCYCLES = 80000
+MAXPROCESSES = 8000
+MAXLENGTH = 100
+MINDISTANCE = 100
+PSPACESIZE = CORESIZE // 16
+VERSION = 96
+DEFAULT_SEED = 548
+
+OPCODES = ['DAT', 'MOV', 'ADD', 'SUB', 'MUL', 'DIV', 'MOD', 'JMP', 'JMZ', 'JMN',
+           'DJN', 'SPL', 'SLT', 'SEQ', 'SNE', 'NOP', 'LDP', 'STP']
+(DAT, MOV, ADD, SUB, MUL, DIV, MOD, JMP, JMZ, JMN,
+ DJN, SPL, SLT, SEQ, SNE, NOP, LDP, STP) = range(len(OPCODES))
+OPCODE_ALIASES = {'CMP': 'SEQ'}
+
+MODIFIERS = ['A', 'B', 'AB', 'BA', 'F', 'X', 'I']
+M_A, M_B, M_AB, M_BA, M_F, M_X, M_I = range(len(MODIFIERS))
+
+MODES = '#$*@{<}>'
+IMM, DIR, AIND, BIND, APRE, BPRE, APOST, BPOST = range(len(MODES))
+
+PSEUDO_OPS = {'EQU', 'FOR', 'ROF', 'ORG', 'END', 'PIN'}
+
+Warrior = namedtuple('Warrior', 'name author instructions start')
+
+class RedcodeError(Exception):
+    pass
+
+
+def result_line(wins, losses, ties):
+    """Format a battle outcome the way pmars prints its last line."""
+    return f"Results: {wins} {losses} {ties}"
+
+
+# ---------------------------------------------------------------------------
+# Expressions
+
+_TOKEN_RE = re.compile(r"\s*(?:(\d+)|([A-Za-z_]\w*)|(&&|\|\||==|!=|<=|>=|[-+*/%()<>!]))")
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN_RE.match(text, pos)
+        if not m:
+            raise RedcodeError(f"Bad character in expression: {text[pos:].strip()!r}")
+        if m.group(1):
+            tokens.append(('num', int(m.group(1))))
+        elif m.group(2):
+            tokens.append(('id', m.group(2)))
+        else:
+            tokens.append(('op', m.group(3)))
+        pos = m.end()
+    return tokens
+
+
+def _cdiv(a, b, op):
+    if b == 0:
+        raise RedcodeError("Division by zero in expression")
+    q = abs(a) // abs(b)
+    if (a < 0) != (b < 0):
+        q = -q
+    return q if op == '/' else a - q * b
+
+
+_BINARY = [
+    ('||',),
+    ('&&',),
+    ('==', '!='),
+    ('<', '>', '<=', '>='),
+    ('+', '-'),
+    ('*', '/', '%'),
+]
+
+
+def evaluate(text, resolve):
+    """Evaluate a C-style integer expression; resolve maps identifiers to values."""
+    tokens = _tokenize(text)
+    if not tokens:
+        raise RedcodeError("Missing expression")
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else (None, None)
+
+    def unary():
+        nonlocal pos
+        kind, val = peek()
+        if kind == 'op' and val in ('-', '+', '!'):
+            pos += 1
+            v = unary()
+            return -v if val == '-' else (int(not v) if val == '!' else v)
+        if kind == 'op' and val == '(':
+            pos += 1
+            v = binary(0)
+            if peek() != ('op', ')'):
+                raise RedcodeError("Missing ')' in expression")
+            pos += 1
+            return v
+        if kind == 'num':
+            pos += 1
+            return val
+        if kind == 'id':
+            pos += 1
+            return resolve(val)
+        raise RedcodeError(f"Bad expression: {text.strip()!r}")
+
+    def binary(level):
+        nonlocal pos
+        if level == len(_BINARY):
+            return unary()
+        left = binary(level + 1)
+        while True:
+            kind, val = peek()
+            if kind != 'op' or val not in _BINARY[level]:
+                return left
+            pos += 1
+            right = binary(level + 1)
+            if val == '||':
+                left = int(bool(left) or bool(right))
+            elif val == '&&':
+                left = int(bool(left) and bool(right))
+            elif val in ('/', '%'):
+                left = _cdiv(left, right, val)
+            else:
+                left = {
+                    '==': lambda: int(left == right), '!=': lambda: int(left != right),
+                    '<': lambda: int(left < right), '>': lambda: int(left > right),
+                    '<=': lambda: int(left <= right), '>=': lambda: int(left >= right),
+                    '+': lambda: left + right, '-': lambda: left - right,
+                    '*': lambda: left * right,
+                }[val]()
+
+    value = binary(0)
+    if pos != len(tokens):
+        raise RedcodeError(f"Bad expression: {text.strip()!r}")
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Assembler
+
+_IDENT_RE = re.compile(r"[A-Za-z_]\w*")
+_CONCAT_RE = re.compile(r"&([A-Za-z_]\w*)")
+_OPCODE_RE = re.compile(r"^([A-Za-z]+)(?:\.([A-Za-z]+))?$")
+
+
+def _concat(text, counters):
+    return _CONCAT_RE.sub(
+        lambda m: f"{counters[m.group(1)]:02d}" if m.group(1) in counters else m.group(0), text)
+
+
+def _keyword(token):
+    m = _OPCODE_RE.match(token)
+    if not m:
+        return None
+    op = m.group(1).upper()
+    op = OPCODE_ALIASES.get(op, op)
+    if op in PSEUDO_OPS and not m.group(2):
+        return op, None
+    if op in OPCODES:
+        mod = m.group(2).upper() if m.group(2) else None
+        if mod is not None and mod not in MODIFIERS:
+            raise RedcodeError(f"Unknown modifier: {token}")
+        return op, mod
+    return None
+
+
+def _split_statement(text):
+    """Split a comment-free line into (labels, opcode, modifier, operand text)."""
+    labels = []
+    rest = text.strip()
+    while rest:
+        m = re.match(r"(\S+)\s*(.*)$", rest)
+        token, tail = m.group(1), m.group(2)
+        kw = _keyword(token)
+        if kw:
+            return labels, kw[0], kw[1], tail
+        name = token.rstrip(':')
+        if not re.fullmatch(r"[A-Za-z_][\w&]*", name):
+            raise RedcodeError(f"Expected label or opcode, found {token!r}")
+        labels.append(name)
+        rest = tail
+    return labels, None, None, ''
+
+
+def _split_operands(text):
+    parts, depth, cur = [], 0, ''
+    for ch in text:
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        if ch == ',' and depth == 0:
+            parts.append(cur)
+            cur = ''
+        else:
+            cur += ch
+    if cur.strip() or parts:
+        parts.append(cur)
+    return [p.strip() for p in parts]
+
+
+def _parse_operand(text):
+    if not text:
+        raise RedcodeError("Missing operand")
+    if text[0] in MODES:
+        return MODES.index(text[0]), text[1:].strip()
+    return DIR, text
+
+
+def _default_modifier(op, amode, bmode):
+    if op in ('DAT', 'NOP'):
+        return M_F
+    if op in ('MOV', 'SEQ', 'SNE'):
+        return M_AB if amode == IMM else (M_B if bmode == IMM else M_I)
+    if op in ('ADD', 'SUB', 'MUL', 'DIV', 'MOD'):
+        return M_AB if amode == IMM else (M_B if bmode == IMM else M_F)
+    if op in ('SLT', 'LDP', 'STP'):
+        return M_AB if amode == IMM else M_B
+    return M_B
+
+
+def _source_lines(text):
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if re.match(r"\s*;redcode", line, re.IGNORECASE):
+            return list(enumerate(lines, 1))[i + 1:]
+    return list(enumerate(lines, 1))
+
+
+def assemble(text, rounds=1, warriors=2):
+    """Assemble Redcode source into a Warrior, raising RedcodeError on failure."""
+    name, author, asserts = 'Unknown', 'Anonymous', []
+    body = []
+    for lineno, line in _source_lines(text):
+        stripped = line.strip()
+        if stripped.startswith(';'):
+            meta = re.match(r";\s*(name|author|assert)\b\s?(.*)$", stripped, re.IGNORECASE)
+            if meta:
+                key, value = meta.group(1).lower(), meta.group(2).strip()
+                if key == 'name':
+                    name = value
+                elif key == 'author':
+                    author = value
+                else:
+                    asserts.append((lineno, value))
+            continue
+        body.append((lineno, line.split(';', 1)[0]))
+
+    equs = {}
+    statements = []
+    pending = []
+    start_expr = [None]
+
+    def expand(lines, counters):
+        i = 0
+        while i < len(lines):
+            lineno, raw = lines[i]
+            i += 1
+            try:
+                labels, op, mod, rest = _split_statement(_concat(raw, counters))
+            except RedcodeError as e:
+                raise RedcodeError(f"Error in line {lineno}: {e}")
+            if op == 'FOR':
+                depth, j = 1, i
+                while j < len(lines):
+                    kw = _split_statement(_concat(lines[j][1], counters))[1]
+                    if kw == 'FOR':
+                        depth += 1
+                    elif kw == 'ROF':
+                        depth -= 1
+                        if depth == 0:
+                            break
+                    j += 1
+                if depth:
+                    raise RedcodeError(f"Error in line {lineno}: FOR without ROF")
+                loop_body = lines[i:j]
+                i = j + 1
+                counter = labels[-1] if labels else None
+                pending.extend(labels[:-1])
+                count = _eval_text(rest, counters, {}, 0, lineno)
+                for k in range(1, count + 1):
+                    inner = dict(counters)
+                    if counter:
+                        inner[counter] = k
+                    if expand(loop_body, inner):
+                        return True
+                continue
+            if op == 'ROF':
+                raise RedcodeError(f"Error in line {lineno}: ROF without FOR")
+            if op == 'EQU':
+                for label in labels:
+                    equs[label] = rest.strip()
+                continue
+            if op in ('ORG', 'END'):
+                pending.extend(labels)
+                if rest.strip():
+                    start_expr[0] = (rest.strip(), counters, lineno)
+                if op == 'END':
+                    return True
+                continue
+            if op == 'PIN':
+                continue
+            pending.extend(labels)
+            if op is None:
+                continue
+            statements.append((list(pending), op, mod, rest, counters, lineno))
+            pending.clear()
+        return False
+
+    def _eval_text(expr, counters, labels, addr, lineno):
+        seen = 0
+        while True:
+            expanded = _IDENT_RE.sub(
+                lambda m: equs[m.group(0)] if m.group(0) in equs and m.group(0) not in counters
+                else m.group(0), _concat(expr, counters))
+            if expanded == expr:
+                break
+            expr = expanded
+            seen += 1
+            if seen > 100:
+                raise RedcodeError(f"Error in line {lineno}: recursive EQU")
+
+        predefined = {
+            'CORESIZE': CORESIZE, 'MAXPROCESSES': MAXPROCESSES, 'MAXCYCLES': MAXCYCLES,
+            'MAXLENGTH': MAXLENGTH, 'MINDISTANCE': MINDISTANCE, 'PSPACESIZE': PSPACESIZE,
+            'VERSION': VERSION, 'ROUNDS': rounds, 'WARRIORS': warriors, 'CURLINE': addr,
+        }
+
+        def resolve(ident):
+            if ident in counters:
+                return counters[ident]
+            if ident in labels:
+                return labels[ident] - addr
+            if ident in predefined:
+                return predefined[ident]
+            raise RedcodeError(f"Undefined symbol: {ident}")
+
+        try:
+            return evaluate(expr, resolve)
+        except RedcodeError as e:
+            raise RedcodeError(f"Error in line {lineno}: {e}")
+
+    expand(body, {})
+
+    if not statements:
+        raise RedcodeError("No instructions")
+    if len(statements) > MAXLENGTH:
+        raise RedcodeError(f"Too many instructions: {len(statements)} > {MAXLENGTH}")
+
+    labels = {}
+    for addr, (names, *_rest) in enumerate(statements):
+        for label in names:
+            labels.setdefault(label, addr)
+    for label in pending:
+        labels.setdefault(label, len(statements))
+
+    instructions = []
+    for addr, (_, op, mod, rest, counters, lineno) in enumerate(statements):
+        operands = _split_operands(rest)
+        if len(operands) > 2:
+            raise RedcodeError(f"Error in line {lineno}: too many operands")
+        if not operands:
+            if op != 'NOP':
+                raise RedcodeError(f"Error in line {lineno}: missing operand")
+            operands = ['$0', '$0']
+        try:
+            parsed = [_parse_operand(o) for o in operands]
+        except RedcodeError as e:
+            raise RedcodeError(f"Error in line {lineno}: {e}")
+        if len(parsed) == 1:
+            parsed = [(IMM, '0'), parsed[0]] if op == 'DAT' else [parsed[0], (DIR, '0')]
+        (amode, atext), (bmode, btext) = parsed
+        aval = _eval_text(atext, counters, labels, addr, lineno)
+        bval = _eval_text(btext, counters, labels, addr, lineno)
+        modifier = MODIFIERS.index(mod) if mod else _default_modifier(op, amode, bmode)
+        instructions.append((OPCODES.index(op), modifier, amode, aval % CORESIZE,
+                             bmode, bval % CORESIZE))
+
+    start = 0
+    if start_expr[0]:
+        expr, counters, lineno = start_expr[0]
+        start = _eval_text(expr, counters, labels, 0, lineno)
+    if not 0 <= start < len(instructions):
+        raise RedcodeError(f"Start position {start} is outside the warrior")
+
+    for lineno, expr in asserts:
+        if expr and not _eval_text(expr, {}, labels, 0, lineno):
+            raise RedcodeError(f"Error in line {lineno}: Assertion failed")
+
+    return Warrior(name, author, instructions, start)
+
+
+def load_warrior(path, rounds=1, warriors=2):
+    with open(path, errors='replace') as f:
+        return assemble(f.read(), rounds, warriors)
+
+
+def validate(path):
+    """Return (valid, output lines) in the same shape as running `pmars path`."""
+    try:
+        w = load_warrior(path, warriors=1)
+    except (OSError, RedcodeError) as e:
+        return False, [str(e)]
+    return True, [f"{w.name} by {w.author} scores 0"]
+
+
+def disassemble(instr):
+    op, mod, am, a, bm, b = instr
+    return f"{OPCODES[op]}.{MODIFIERS[mod]} {MODES[am]}{a}, {MODES[bm]}{b}"
+
+
+# ---------------------------------------------------------------------------
+# Simulator
+
+def run_round(warriors, positions, starter, pspaces, cycles=MAXCYCLES,
+              maxprocs=MAXPROCESSES, coresize=CORESIZE):
+    """Run one round; return the index of the winning warrior or None for a tie."""
+    M = coresize
+    # The empty core is DAT.F $0, $0, as in pmars.
+    OP = [DAT] * M
+    MD = [M_F] * M
+    AM = [DIR] * M
+    AV = [0] * M
+    BM = [DIR] * M
+    BV = [0] * M
+    queues = []
+    for w, pos in zip(warriors, positions):
+        for i, (op, mod, am, a, bm, b) in enumerate(w.instructions):
+            p = (pos + i) % M
+            OP[p], MD[p], AM[p], AV[p], BM[p], BV[p] = op, mod, am, a, bm, b
+        queues.append(deque([(pos + w.start) % M]))
+
+    n = len(warriors)
+    alive = n
+    turn = starter
+    steps = cycles * n
+    while steps > 0:
+        q = queues[turn]
+        if not q:
+            turn = (turn + 1) % n
+            continue
+        steps -= 1
+        pc = q.popleft()
+        op = OP[pc]
+        mod = MD[pc]
+        am = AM[pc]
+        bm = BM[pc]
+        ir_a = AV[pc]
+        ir_b = BV[pc]
+
+        # A operand
+        if am == IMM:
+            pa = pc
+            ra = (op, mod, am, ir_a, bm, ir_b)
+        else:
+            pa = (pc + ir_a) % M
+            if am != DIR:
+                ind = pa
+                if am == APRE:
+                    AV[ind] = (AV[ind] - 1) % M
+                elif am == BPRE:
+                    BV[ind] = (BV[ind] - 1) % M
+                if am == AIND or am == APRE or am == APOST:
+                    pa = (ind + AV[ind]) % M
+                else:
+                    pa = (ind + BV[ind]) % M
+            ra = (OP[pa], MD[pa], AM[pa], AV[pa], BM[pa], BV[pa])
+            if am == APOST:
+                AV[ind] = (AV[ind] + 1) % M
+            elif am == BPOST:
+                BV[ind] = (BV[ind] + 1) % M
+
+        # B operand
+        if bm == IMM:
+            pb = pc
+        else:
+            pb = (pc + ir_b) % M
+            if bm != DIR:
+                ind = pb
+                if bm == APRE:
+                    AV[ind] = (AV[ind] - 1) % M
+                elif bm == BPRE:
+                    BV[ind] = (BV[ind] - 1) % M
+                if bm == AIND or bm == APRE or bm == APOST:
+                    pb = (ind + AV[ind]) % M
+                else:
+                    pb = (ind + BV[ind]) % M
+        rb = (OP[pb], MD[pb], AM[pb], AV[pb], BM[pb], BV[pb])
+        if bm == APOST:
+            AV[ind] = (AV[ind] + 1) % M
+        elif bm == BPOST:
+            BV[ind] = (BV[ind] + 1) % M
+
+        nxt = (pc + 1) % M
+        if op == DAT:
+            pass
+        elif op == MOV:
+            if mod == M_I:
+                OP[pb], MD[pb], AM[pb], AV[pb], BM[pb], BV[pb] = ra
+            elif mod == M_A:
+                AV[pb] = ra[3]
+            elif mod == M_B:
+                BV[pb] = ra[5]
+            elif mod == M_AB:
+                BV[pb] = ra[3]
+            elif mod == M_BA:
+                AV[pb] = ra[5]
+            elif mod == M_F:
+                AV[pb] = ra[3]
+                BV[pb] = ra[5]
+            else:
+                AV[pb] = ra[5]
+                BV[pb] = ra[3]
+            q.append(nxt)
+        elif op <= MOD:
+            killed = False
+            if mod == M_A:
+                pairs = ((0, rb[3], ra[3]),)
+            elif mod == M_B:
+                pairs = ((1, rb[5], ra[5]),)
+            elif mod == M_AB:
+                pairs = ((1, rb[5], ra[3]),)
+            elif mod == M_BA:
+                pairs = ((0, rb[3], ra[5]),)
+            elif mod == M_X:
+                pairs = ((0, rb[3], ra[5]), (1, rb[5], ra[3]))
+            else:
+                pairs = ((0, rb[3], ra[3]), (1, rb[5], ra[5]))
+            for field, dst, src in pairs:
+                if op == ADD:
+                    v = (dst + src) % M
+                elif op == SUB:
+                    v = (dst - src) % M
+                elif op == MUL:
+                    v = (dst * src) % M
+                elif src == 0:
+                    killed = True
+                    continue
+                elif op == DIV:
+                    v = dst // src
+                else:
+                    v = dst % src
+                if field:
+                    BV[pb] = v
+                else:
+                    AV[pb] = v
+            if not killed:
+                q.append(nxt)
+        elif op == JMP:
+            q.append(pa)
+        elif op == JMZ or op == JMN or op == DJN:
+            if op == DJN:
+                if mod == M_A or mod == M_BA:
+                    AV[pb] = (AV[pb] - 1) % M
+                    rb = rb[:3] + ((rb[3] - 1) % M,) + rb[4:]
+                elif mod == M_B or mod == M_AB:
+                    BV[pb] = (BV[pb] - 1) % M
+                    rb = rb[:5] + ((rb[5] - 1) % M,)
+                else:
+                    AV[pb] = (AV[pb] - 1) % M
+                    BV[pb] = (BV[pb] - 1) % M
+                    rb = rb[:3] + ((rb[3] - 1) % M, rb[4], (rb[5] - 1) % M)
+            if mod == M_A or mod == M_BA:
+                zero = rb[3] == 0
+            elif mod == M_B or mod == M_AB:
+                zero = rb[5] == 0
+            else:
+                zero = rb[3] == 0 and rb[5] == 0
+            jump = zero if op == JMZ else not zero
+            q.append(pa if jump else nxt)
+        elif op == SPL:
+            q.append(nxt)
+            if len(q) < maxprocs:
+                q.append(pa)
+        elif op == SEQ or op == SNE:
+            if mod == M_A:
+                same = ra[3] == rb[3]
+            elif mod == M_B:
+                same = ra[5] == rb[5]
+            elif mod == M_AB:
+                same = ra[3] == rb[5]
+            elif mod == M_BA:
+                same = ra[5] == rb[3]
+            elif mod == M_F:
+                same = ra[3] == rb[3] and ra[5] == rb[5]
+            elif mod == M_X:
+                same = ra[3] == rb[5] and ra[5] == rb[3]
+            else:
+                same = ra == rb
+            skip = same if op == SEQ else not same
+            q.append((pc + 2) % M if skip else nxt)
+        elif op == SLT:
+            if mod == M_A:
+                less = ra[3] < rb[3]
+            elif mod == M_B:
+                less = ra[5] < rb[5]
+            elif mod == M_AB:
+                less = ra[3] < rb[5]
+            elif mod == M_BA:
+                less = ra[5] < rb[3]
+            elif mod == M_X:
+                less = ra[3] < rb[5] and ra[5] < rb[3]
+            else:
+                less = ra[3] < rb[3] and ra[5] < rb[5]
+            q.append((pc + 2) % M if less else nxt)
+        elif op == NOP:
+            q.append(nxt)
+        elif op == LDP:
+            ps = pspaces[turn]
+            if mod == M_A:
+                AV[pb] = ps[ra[3] % PSPACESIZE]
+            elif mod == M_BA:
+                AV[pb] = ps[ra[5] % PSPACESIZE]
+            elif mod == M_AB:
+                BV[pb] = ps[ra[3] % PSPACESIZE]
+            else:
+                BV[pb] = ps[ra[5] % PSPACESIZE]
+            q.append(nxt)
+        else:
+            ps = pspaces[turn]
+            if mod == M_A:
+                idx, val = rb[3], ra[3]
+            elif mod == M_BA:
+                idx, val = rb[3], ra[5]
+            elif mod == M_AB:
+                idx, val = rb[5], ra[3]
+            else:
+                idx, val = rb[5], ra[5]
+            ps[idx % PSPACESIZE] = val
+            q.append(nxt)
+
+        if not q:
+            alive -= 1
+            if alive <= 1 and n > 1:
+                break
+        turn = (turn + 1) % n
+
+    survivors = [i for i, q in enumerate(queues) if q]
+    if n > 1 and len(survivors) == 1:
+        return survivors[0]
+    return None
+
+
+def battle(warrior1, warrior2, rounds=1, seed=DEFAULT_SEED, fixed_position=None, first_round=0):
+    """Fight two warriors (paths or Warrior tuples); return (wins, losses, ties).
+
+    The warriors take turns to move first, starting as if first_round rounds
+    had already been played."""
+    warriors = [w if isinstance(w, Warrior) else load_warrior(w, rounds)
+                for w in (warrior1, warrior2)]
+    rng = random.Random(seed)
+    pspaces = [[0] * PSPACESIZE for _ in warriors]
+    for ps in pspaces:
+        ps[0] = CORESIZE - 1
+    wins = losses = ties = 0
+    for r in range(rounds):
+        if fixed_position is not None:
+            pos = fixed_position
+        else:
+            pos = rng.randrange(MINDISTANCE, CORESIZE - MINDISTANCE + 1)
+        winner = run_round(warriors, [0, pos], (first_round + r) % 2, pspaces)
+        if winner is None:
+            ties += 1
+        elif winner == 0:
+            wins += 1
+        else:
+            losses += 1
+        for i, ps in enumerate(pspaces):
+            ps[0] = 0 if winner is not None and winner != i else (1 if winner == i else 2)
+    return wins, losses, ties
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pure-Python Redcode-94 MARS.")
+    parser.add_argument('-r', type=int, default=1, dest='rounds', help="rounds to play")
+    parser.add_argument('-F', type=int, default=None, dest='position',
+                        help="fixed position of warrior 2")
+    parser.add_argument('-s', type=int, default=DEFAULT_SEED, dest='seed', help="random seed")
+    parser.add_argument('-f', action='store_true', help="fixed series (accepted for pmars compatibility)")
+    parser.add_argument('warriors', nargs='+')
+    args = parser.parse_args()
+
+    if len(args.warriors) == 1:
+        valid, output = validate(args.warriors[0])
+        print("\n".join(output))
+        return 0 if valid else 1
+    try:
+        w1, w2 = [load_warrior(p, args.rounds) for p in args.warriors[:2]]
+    except (OSError, RedcodeError) as e:
+        print(e)
+        return 1
+    wins, losses, ties = battle(w1, w2, args.rounds, args.seed, args.position)
+    print(f"{w1.name} by {w1.author} scores {3 * wins + ties}")
+    print(f"{w2.name} by {w2.author} scores {3 * losses + ties}")
+    print(result_line(wins, losses, ties))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Compare battle throughput (rounds/sec) of pmars and the in-process engines.
+
+Every pair of basic_warriors/*.red is fought once per engine:
+
+    python3 mars_benchmark.py [-r rounds] [--engines pmars,numpy,python]
+"""
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+import itertools
+import subprocess
+
+import mars
+
+BASIC_DIR = 'basic_warriors'
+
+def run_pmars(w1, w2, rounds):
+    out = subprocess.run(['pmars', '-r', str(rounds), '-f', w1, w2],
+                         capture_output=True, text=True).stdout.splitlines()
+    return out[-1] if out else ""
+
+def run_python(w1, w2, rounds):
+    return mars.result_line(*mars.battle(w1, w2, rounds))
+
+def run_numpy(w1, w2, rounds):
+    import mars_numpy
+    return mars.result_line(*mars_numpy.battle(w1, w2, rounds))
+
+RUNNERS = {'pmars': run_pmars, 'python': run_python, 'numpy': run_numpy}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MARS engines on the basic warriors.")
+    parser.add_argument('-r', type=int, default=500, dest='rounds', help="rounds per battle (default: 500)")
+    parser.add_argument('--engines', default='pmars,numpy',
+                        help="comma-separated engines to time (default: pmars,numpy)")
+    args = parser.parse_args()
+
+    engines = [e for e in args.engines.split(',') if e]
+    for e in engines:
+        if e not in RUNNERS:
+            print(f"Unknown engine {e}; choose from {', '.join(RUNNERS)}")
+            return 1
+    if 'pmars' in engines and not shutil.which('pmars'):
+        print("pmars is not installed, skipping it")
+        engines.remove('pmars')
+
+    warriors = sorted(glob.glob(os.path.join(BASIC_DIR, '*.red')))
+    totals = {e: 0.0 for e in engines}
+    print(f"{'battle':<24} {'engine':<8} {'result':<22} {'seconds':>8} {'rounds/sec':>11}")
+    for w1, w2 in itertools.combinations(warriors, 2):
+        name = f"{os.path.basename(w1)} vs {os.path.basename(w2)}"
+        for e in engines:
+            start = time.perf_counter()
+            result = RUNNERS[e](w1, w2, args.rounds)
+            elapsed = time.perf_counter() - start
+            totals[e] += elapsed
+            print(f"{name:<24} {e:<8} {result:<22} {elapsed:8.2f} {args.rounds / elapsed:11.1f}")
+
+    battles = len(warriors) * (len(warriors) - 1) // 2
+    print()
+    for e in engines:
+        print(f"{e:<8} {battles * args.rounds / totals[e]:11.1f} rounds/sec overall")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Check the pure-Python MARS against pmars.
+
+Every ordered pair of warriors (basic_warriors/*.red plus any extra files
+given on the command line) is fought for one round at a series of fixed
+positions with `pmars -r 1 -F pos`, and the outcome is compared with
+mars.battle() at the same position. Validation of each warrior is compared
+as well. Exits non-zero on the first run with any mismatch.
+
+    python3 mars_conformance.py [extra_warrior.red ...]
+"""
+import os
+import sys
+import glob
+import shutil
+import subprocess
+
+import mars
+
+BASIC_DIR = 'basic_warriors'
+POSITIONS = [100, 250, 1000, 2500, 3999, 4000, 5500, 7000, 7900]
+
+def pmars_lines(args):
+    proc = subprocess.run(['pmars'] + args, capture_output=True, text=True)
+    return proc.stdout.strip().splitlines()
+
+def check_validation(path):
+    lines = pmars_lines([path])
+    expected = bool(lines and "scores" in lines[-1].lower())
+    valid, output = mars.validate(path)
+    if valid != expected:
+        print(f"FAIL validate {path}: pmars={expected} mars={valid} ({output[-1]})")
+        return False
+    print(f"ok   validate {path}: {valid}")
+    return True
+
+def check_battle(w1, w2, pos):
+    lines = pmars_lines(['-r', '1', '-F', str(pos), w1, w2])
+    expected = lines[-1] if lines else ""
+    actual = mars.result_line(*mars.battle(w1, w2, 1, fixed_position=pos))
+    if expected.split() != actual.split():
+        print(f"FAIL {w1} vs {w2} @ {pos}: pmars={expected!r} mars={actual!r}")
+        return False
+    print(f"ok   {w1} vs {w2} @ {pos}: {actual}")
+    return True
+
+def main():
+    if not shutil.which('pmars'):
+        print("pmars is not installed; see install_pmars.py")
+        return 2
+    warriors = sorted(glob.glob(os.path.join(BASIC_DIR, '*.red'))) + sys.argv[1:]
+    failures = 0
+    for w in warriors:
+        failures += not check_validation(w)
+    for w1 in warriors:
+        for w2 in warriors:
+            if w1 == w2:
+                continue
+            for pos in POSITIONS:
+                failures += not check_battle(w1, w2, pos)
+    print(f"\n{failures} mismatch(es)")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
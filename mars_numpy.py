@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""NumPy-vectorized multi-round MARS.
+
+Rounds of a battle are independent apart from their starting positions, so
+this engine keeps the cores of all rounds in one (rounds * coresize, 6)
+array and steps every round's current process in lockstep. Semantics, starting
+positions and starting order match mars.battle() for the same seed, so
+both engines produce identical tallies. Warriors that use p-space (LDP/STP)
+carry state from round to round and are handed to mars.battle() instead.
+"""
+import random
+
+import numpy as np
+
+import mars
+from mars import (CORESIZE, MAXCYCLES, MAXPROCESSES, MINDISTANCE, DEFAULT_SEED,
+                  DAT, MOV, ADD, SUB, MUL, DIV, MOD, JMP, JMZ, JMN, DJN, SPL,
+                  SLT, SEQ, SNE, NOP, LDP, STP,
+                  M_A, M_B, M_AB, M_BA, M_F, M_X, M_I,
+                  IMM, DIR, AIND, BIND, APRE, BPRE, APOST, BPOST)
+
+BATCH_ROUNDS = 1000
+
+def _table(members, size):
+    t = np.zeros(size, dtype=bool)
+    t[list(members)] = True
+    return t
+
+A_INDIRECT = _table([AIND, APRE, APOST], 8)
+B_INDIRECT = _table([BIND, BPRE, BPOST], 8)
+# Which fields an instruction writes, and where the value for each comes from.
+WRITES_A = _table([M_A, M_BA, M_F, M_X, M_I], 7)
+WRITES_B = _table([M_B, M_AB, M_F, M_X, M_I], 7)
+A_FROM_A = _table([M_A, M_F, M_I], 7)
+B_FROM_B = _table([M_B, M_F, M_I], 7)
+TESTS_A_ONLY = _table([M_A, M_BA], 7)
+TESTS_B_ONLY = _table([M_B, M_AB], 7)
+
+
+def uses_pspace(warrior):
+    return any(instr[0] in (LDP, STP) for instr in warrior.instructions)
+
+
+def run_rounds(w1, w2, positions, starters, cycles=MAXCYCLES,
+               maxprocs=MAXPROCESSES, coresize=CORESIZE):
+    """Run len(positions) rounds at once; return an array of winners (0, 1, or 2 for a tie)."""
+    M, P = coresize, maxprocs
+    R = len(positions)
+    positions = np.asarray(positions, dtype=np.int64)
+
+    # MOV.I only ever copies instructions that are already in the core, so
+    # the opcodes, modifiers and modes that can occur are fixed at load time
+    # and whole sections of the step below can be skipped.
+    loaded = w1.instructions + w2.instructions + [(DAT, M_F, DIR, 0, DIR, 0)]
+    ops = {i[0] for i in loaded}
+    mods = {i[1] for i in loaded}
+    amodes = {i[2] for i in loaded}
+    bmodes = {i[4] for i in loaded}
+    full_copies = any(i[0] in (MOV, SEQ, SNE) and i[1] == M_I for i in loaded)
+
+    # One row per core cell: opcode, modifier, A mode, A value, B mode, B value.
+    core = np.zeros((R * M, 6), dtype=np.int16)
+    core[:, 0], core[:, 1], core[:, 2], core[:, 4] = DAT, M_F, DIR, DIR
+    rbase = np.arange(R, dtype=np.int32) * M
+    for w, pos in ((w1, np.zeros(R, dtype=np.int32)), (w2, positions.astype(np.int32))):
+        for i, instr in enumerate(w.instructions):
+            core[rbase + (pos + i) % M] = instr
+    AV = core[:, 3]
+    BV = core[:, 5]
+
+    Q = np.zeros(R * 2 * P, dtype=np.int16)
+    head = np.zeros(R * 2, dtype=np.int32)
+    count = np.ones(R * 2, dtype=np.int32)
+    Q[np.arange(R) * 2 * P] = w1.start % M
+    Q[(np.arange(R) * 2 + 1) * P] = (positions + w2.start) % M
+
+    turn = np.asarray(starters, dtype=np.int32).copy()
+    steps = np.full(R, cycles * 2, dtype=np.int32)
+    result = np.full(R, -1, dtype=np.int32)
+    active = np.arange(R, dtype=np.int32)
+
+    def operand(modes, mode, field, pc, base):
+        """Resolve one operand; return (pointer, core cell, instruction there)."""
+        ptr = pc + field
+        ptr -= M * (ptr >= M)
+        if IMM in modes:
+            ptr = np.where(mode == IMM, pc, ptr)
+        ind = base + ptr
+        for pre, V in ((APRE, AV), (BPRE, BV)):
+            if pre in modes:
+                t = ind[mode == pre]
+                V[t] = (V[t] + (M - 1)) % M
+        if modes & {AIND, APRE, APOST, BIND, BPRE, BPOST}:
+            ia, ib = A_INDIRECT[mode], B_INDIRECT[mode]
+            ptr = (ptr + np.where(ia, AV[ind], np.where(ib, BV[ind], 0))) % M
+        cell = base + ptr
+        instr = core[cell]
+        for post, V in ((APOST, AV), (BPOST, BV)):
+            if post in modes:
+                t = ind[mode == post]
+                V[t] = (V[t] + 1) % M
+        return ptr, cell, instr
+
+    while active.size:
+        ar = active
+        w = turn[ar]
+        qi = ar * 2 + w
+        h = head[qi]
+        pc = Q[qi * P + h].astype(np.int32)
+        h += 1
+        head[qi] = np.where(h == P, 0, h)
+        count[qi] -= 1
+        base = ar * M
+        ir = core[base + pc]
+        op, mod, am, bm = ir[:, 0], ir[:, 1], ir[:, 2], ir[:, 4]
+
+        pa, ca, ra = operand(amodes, am, ir[:, 3], pc, base)
+        pb, cb, rb = operand(bmodes, bm, ir[:, 5], pc, base)
+        rA, rB = ra[:, 3], ra[:, 5]
+        bA, bB = rb[:, 3], rb[:, 5]
+
+        push = pc + 1
+        push[push == M] = 0
+        alive = op != DAT
+
+        # MOV and arithmetic
+        if ops & {MOV, ADD, SUB, MUL, DIV, MOD}:
+            arith = (op >= MOV) & (op <= MOD)
+            srcA = np.where(A_FROM_A[mod], rA, rB)
+            srcB = np.where(B_FROM_B[mod], rB, rA)
+            wa, wb = WRITES_A[mod] & arith, WRITES_B[mod] & arith
+            valA, valB = srcA.copy(), srcB.copy()
+            for code, fn in ((ADD, np.add), (SUB, np.subtract), (MUL, np.multiply)):
+                if code in ops:
+                    m = op == code
+                    valA[m] = fn(bA[m].astype(np.int32), srcA[m]) % M
+                    valB[m] = fn(bB[m].astype(np.int32), srcB[m]) % M
+            for code in (DIV, MOD):
+                if code in ops:
+                    m = op == code
+                    sa = np.where(srcA == 0, 1, srcA)
+                    sb = np.where(srcB == 0, 1, srcB)
+                    fn = np.floor_divide if code == DIV else np.remainder
+                    valA[m] = fn(bA[m], sa[m])
+                    valB[m] = fn(bB[m], sb[m])
+                    kill_a = m & wa & (srcA == 0)
+                    kill_b = m & wb & (srcB == 0)
+                    wa &= ~kill_a
+                    wb &= ~kill_b
+                    alive &= ~(kill_a | kill_b)
+            if MOV in ops and M_I in mods:
+                movi = (op == MOV) & (mod == M_I)
+                wa &= ~movi
+                wb &= ~movi
+                core[cb[movi]] = ra[movi]
+            AV[cb[wa]] = valA[wa]
+            BV[cb[wb]] = valB[wb]
+
+        # Jumps
+        if JMP in ops:
+            push = np.where(op == JMP, pa, push)
+        if ops & {JMZ, JMN, DJN}:
+            cond = (op == JMZ) | (op == JMN) | (op == DJN)
+            ta, tb = TESTS_A_ONLY[mod], TESTS_B_ONLY[mod]
+            if DJN in ops:
+                djn = op == DJN
+                da = djn & ~tb
+                db = djn & ~ta
+                AV[cb[da]] = (AV[cb[da]] - 1) % M
+                BV[cb[db]] = (BV[cb[db]] - 1) % M
+                bA = np.where(da, (bA - 1) % M, bA)
+                bB = np.where(db, (bB - 1) % M, bB)
+            zero = np.where(ta, bA == 0, np.where(tb, bB == 0, (bA == 0) & (bB == 0)))
+            jump = np.where(op == JMZ, zero, ~zero)
+            push = np.where(cond & jump, pa, push)
+
+        # Skips
+        if ops & {SEQ, SNE, SLT}:
+            skipping = (op == SEQ) | (op == SNE) | (op == SLT)
+            same = np.select(
+                [mod == M_A, mod == M_B, mod == M_AB, mod == M_BA, mod == M_X],
+                [rA == bA, rB == bB, rA == bB, rB == bA, (rA == bB) & (rB == bA)],
+                default=(rA == bA) & (rB == bB))
+            if full_copies:
+                same &= (mod != M_I) | (ra == rb).all(axis=1)
+            less = np.select(
+                [mod == M_A, mod == M_B, mod == M_AB, mod == M_BA, mod == M_X],
+                [rA < bA, rB < bB, rA < bB, rB < bA, (rA < bB) & (rB < bA)],
+                default=(rA < bA) & (rB < bB))
+            skip = np.where(op == SEQ, same, np.where(op == SNE, ~same, less))
+            push = np.where(skipping & skip, (pc + 2) % M, push)
+
+        # Queue the next instruction, then the SPL target if there is room.
+        tail = (head[qi] + count[qi]) % P
+        Q[(qi * P + tail)[alive]] = push[alive]
+        count[qi] += alive
+        if SPL in ops:
+            spl = (op == SPL) & (count[qi] < P)
+            tail = (head[qi] + count[qi]) % P
+            Q[(qi * P + tail)[spl]] = pa[spl]
+            count[qi] += spl
+
+        steps[ar] -= 1
+        dead = count[qi] == 0
+        result[ar[dead]] = 1 - w[dead]
+        result[ar[~dead & (steps[ar] == 0)]] = 2
+        turn[ar] = 1 - w
+        active = ar[result[ar] == -1]
+
+    return result
+
+
+def battle(warrior1, warrior2, rounds=1, seed=DEFAULT_SEED, fixed_position=None,
+           batch=BATCH_ROUNDS, first_round=0):
+    """Fight two warriors (paths or Warrior tuples); return (wins, losses, ties),
+    like mars.battle."""
+    warriors = [w if isinstance(w, mars.Warrior) else mars.load_warrior(w, rounds)
+                for w in (warrior1, warrior2)]
+    if any(uses_pspace(w) for w in warriors):
+        return mars.battle(warriors[0], warriors[1], rounds, seed, fixed_position, first_round)
+    rng = random.Random(seed)
+    if fixed_position is not None:
+        positions = [fixed_position] * rounds
+    else:
+        positions = [rng.randrange(MINDISTANCE, CORESIZE - MINDISTANCE + 1) for _ in range(rounds)]
+    starters = [(first_round + r) % 2 for r in range(rounds)]
+    outcome = np.zeros(3, dtype=np.int64)
+    for lo in range(0, rounds, batch):
+        res = run_rounds(warriors[0], warriors[1], positions[lo:lo + batch], starters[lo:lo + batch])
+        outcome += np.bincount(res, minlength=3)
+    return int(outcome[0]), int(outcome[1]), int(outcome[2])
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""Run the grading stages in order, skipping the ones that are up to date.
+
+    first  - First_evaluation.py   tarballs, basic warriors, Env_variables.csv
+    hash   - Hash_calculator.py    the warriors First extracted
+    second - Second_evaluation.py  the warriors and each house's Part_2_tracker.txt
+    third  - Third_evaluation.py   calculated_sha256.csv and the Part3_*.csv files
+
+Each stage declares the files it reads and writes. After a stage succeeds,
+the sha256 of its inputs (with its script and arguments) and of its
+outputs are kept in core/pipeline_state.json. A stage runs again only if
+its inputs hash differently, its outputs were changed or removed since,
+or --force is given; a stage whose upstream stage changed nothing is
+skipped. File hashes are cached by size and mtime like Hash_calculator's.
+
+Second_evaluation adds to core/Round2_Results.txt and continues the
+draws in core/Round2_tracker.json, so running it again would count Round 2
+twice. When those files exist, an out-of-date second is held back unless
+--force is given; deleting them starts Round 2 over and lets it run. A
+stage whose last run failed is run again with --resume (first and second
+take it), which continues or undoes the interrupted run.
+
+A stage starts as soon as the stages it depends on are done, so hash and
+third run while second is still fighting. hash itself mostly has nothing
+left to read: First_evaluation hashes each student's warrior as soon as
+the student is graded.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shlex
+import hashlib
+import argparse
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import Hash_calculator
+
+STATE_FILE = os.path.join('core', 'pipeline_state.json')
+WARRIORS = ['submissions/House_*/*/chooseyourfighter.red', 'submissions/House_*/*/Invalid.txt']
+
+# 'accumulates': files the stage adds to, so a rerun on top of them is only
+# done with --force. 'resume': the script takes --resume.
+STAGES = [
+    {'name': 'first', 'script': 'First_evaluation.py', 'after': [], 'resume': True,
+     'inputs': ['tarballs/*', 'basic_warriors/*', 'Env_variables.csv'],
+     'outputs': ['final_results.csv', 'core/individual_scores/*',
+                 'submissions/House_*/submissions.txt', 'submissions/House_*/Part_2_tracker.txt'] + WARRIORS},
+    {'name': 'hash', 'script': 'Hash_calculator.py', 'after': ['first'],
+     'inputs': ['Env_variables.csv'] + WARRIORS,
+     'outputs': ['calculated_sha256.csv']},
+    {'name': 'second', 'script': 'Second_evaluation.py', 'after': ['first'], 'resume': True,
+     'inputs': ['Env_variables.csv', 'submissions/House_*/Part_2_tracker.txt'] + WARRIORS,
+     'outputs': ['core/Round2_Results.txt', 'core/Round2_Swiss_Results.txt', 'core/Round2_tracker.json',
+                 'Battle_Results/**'],
+     'accumulates': ['core/Round2_Results.txt', 'core/Round2_Swiss_Results.txt', 'core/Round2_tracker.json']},
+    {'name': 'third', 'script': os.path.join('Third_evaluation', 'Third_evaluation.py'), 'after': ['hash'],
+     'inputs': ['calculated_sha256.csv', 'Third_evaluation/Part3_*.csv'],
+     'outputs': ['Third_evaluation/Part3_Points.txt', 'Third_evaluation/Part3_Details/*']},
+]
+STAGE_NAMES = [s['name'] for s in STAGES]
+
+_print_lock = threading.Lock()
+
+def load_state():
+    """Return {'files': hash manifest, 'stages': {name: {'inputs', 'outputs'}}}."""
+    try:
+        with open(STATE_FILE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state.setdefault('files', {})
+    state.setdefault('stages', {})
+    return state
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, STATE_FILE)
+
+def expand(patterns):
+    """Every file matching one of the glob patterns, sorted."""
+    return sorted({p for pattern in patterns for p in glob.glob(pattern, recursive=True) if os.path.isfile(p)})
+
+def fingerprint(patterns, files, extra=()):
+    """sha256 over the names and contents of the files matching patterns."""
+    h = hashlib.sha256()
+    for part in extra:
+        h.update(part.encode() + b"\0")
+    for path in expand(patterns):
+        h.update(f"{path}\0{Hash_calculator.cached_sha256(path, files)}\0".encode())
+    return h.hexdigest()
+
+def stage_command(stage, stage_args, resume=False):
+    extra = stage_args.get(stage['name'], [])
+    if resume and '--resume' not in extra:
+        extra = extra + ['--resume']
+    return [sys.executable, stage['script']] + extra
+
+def input_fingerprint(stage, stage_args, files):
+    command = stage_command(stage, stage_args)[1:]
+    return fingerprint(stage['inputs'] + [stage['script']], files, command)
+
+def out_of_date(stage, stage_args, state):
+    """Return (why the stage has to run or None, its input fingerprint)."""
+    inputs = input_fingerprint(stage, stage_args, state['files'])
+    last = state['stages'].get(stage['name'])
+    if last is None:
+        return "never ran", inputs
+    if last.get('failed'):
+        return "last run failed", inputs
+    if last['inputs'] != inputs:
+        return "inputs changed", inputs
+    if last['outputs'] != fingerprint(stage['outputs'], state['files']):
+        return "outputs changed", inputs
+    return None, inputs
+
+def say(name, text):
+    with _print_lock:
+        print(f"[{name}] {text}", flush=True)
+
+def last_failed(stage, state):
+    return bool(state['stages'].get(stage['name'], {}).get('failed'))
+
+def accumulated(stage):
+    """The files the stage would add to that exist now."""
+    return [p for p in stage.get('accumulates', []) if os.path.exists(p)]
+
+def run_stage(stage, stage_args, resume=False):
+    """Run one stage's script, prefixing its output; return its exit code."""
+    command = stage_command(stage, stage_args, resume)
+    say(stage['name'], "$ " + " ".join(shlex.quote(c) for c in command))
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            text=True, errors='replace', env=env)
+    for line in proc.stdout:
+        say(stage['name'], line.rstrip('\n'))
+    return proc.wait()
+
+def run_pipeline(stages, stage_args, state, force=False, dry_run=False):
+    """Run the stages as their dependencies allow; return {name: outcome}."""
+    outcome = {}
+    pending = list(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(STAGES)) as pool:
+        while pending or running:
+            for stage in list(pending):
+                deps = [d for d in stage['after'] if any(s is not stage and s['name'] == d for s in stages)]
+                if any(d not in outcome for d in deps):
+                    continue
+                pending.remove(stage)
+                name = stage['name']
+                if any(outcome[d] in ('failed', 'blocked') for d in deps):
+                    outcome[name] = 'blocked'
+                    continue
+                if dry_run and any(outcome[d] == 'would run' for d in deps):
+                    outcome[name] = 'would run'
+                    if accumulated(stage) and not force:
+                        say(name, "would be held back if " + ", ".join(deps) + " changes its inputs")
+                    else:
+                        say(name, "would run after " + ", ".join(deps))
+                    continue
+                why, inputs = out_of_date(stage, stage_args, state)
+                if force:
+                    why = "forced"
+                if why is None:
+                    outcome[name] = 'up to date'
+                    say(name, "up to date")
+                    continue
+                resume = stage.get('resume', False) and last_failed(stage, state)
+                existing = accumulated(stage)
+                if existing and not force and not resume:
+                    outcome[name] = 'held back'
+                    say(name, f"out of date ({why}) but not run: {stage['script']} would add to "
+                              f"{', '.join(existing)}. Delete them to start over, or use --force {name} "
+                              f"to add to them")
+                    continue
+                if dry_run:
+                    outcome[name] = 'would run'
+                    say(name, f"would run ({why})")
+                    continue
+                say(name, f"running ({why})")
+                running[pool.submit(run_stage, stage, stage_args, resume)] = (stage, inputs, time.monotonic())
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                stage, inputs, started = running.pop(fut)
+                name = stage['name']
+                try:
+                    code = fut.result()
+                except OSError as e:
+                    say(name, f"Error starting {stage['script']}: {e}")
+                    code = -1
+                if code != 0:
+                    outcome[name] = 'failed'
+                    say(name, f"failed with exit code {code}")
+                    state['stages'][name] = {'failed': True}
+                else:
+                    outcome[name] = 'ran'
+                    state['stages'][name] = {'inputs': inputs,
+                                             'outputs': fingerprint(stage['outputs'], state['files'])}
+                    say(name, f"done in {time.monotonic() - started:.1f}s")
+                save_state(state)
+    return outcome
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run First_evaluation, Hash_calculator, Second_evaluation and "
+                                                 "Third_evaluation, skipping the stages that are up to date.")
+    parser.add_argument('stages', nargs='*', metavar='STAGE',
+                        help=f"run only these stages ({', '.join(STAGE_NAMES)}); default: all of them")
+    parser.add_argument('--force', action='store_true',
+                        help="run the chosen stages even if they are up to date")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="only show which stages would run")
+    parser.add_argument('--args', nargs=2, action='append', default=[], metavar=('STAGE', 'ARGS'),
+                        help="extra arguments for a stage's script, e.g. --args second '--seed 3 --jobs 4'; "
+                             "changing them makes the stage run again")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    for name in args.stages + [name for name, _ in args.args]:
+        if name not in STAGE_NAMES:
+            print(f"Unknown stage {name}; choose from {', '.join(STAGE_NAMES)}")
+            sys.exit(2)
+    stage_args = {}
+    for name, extra in args.args:
+        stage_args.setdefault(name, []).extend(shlex.split(extra))
+    stages = [s for s in STAGES if not args.stages or s['name'] in args.stages]
+
+    state = load_state()
+    outcome = run_pipeline(stages, stage_args, state, args.force, args.dry_run)
+    if not args.dry_run:
+        save_state(state)
+
+    print("\nPipeline:")
+    for stage in stages:
+        print(f"{stage['name']}: {outcome[stage['name']]}")
+    if any(o in ('failed', 'blocked') for o in outcome.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
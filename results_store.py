@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""SQLite store for everything the evaluations produce.
+
+All scripts write their results to core/results.db (WAL mode), next to
+the usual txt/csv files: students and their grades, each build, the
+warrior hashes, every battle, Round 2 groups and the house points of each
+round. Writes go into one transaction that is committed at the natural
+checkpoints of each script (a student recorded, a group finished) or
+every BATCH_SIZE rows.
+
+    python3 results_store.py leaderboard
+    python3 results_store.py student NAME
+    python3 results_store.py export [--dir DIR]
+
+answer from the database directly; export writes the legacy files
+(final_results.csv, core/individual_scores, Battle_Results/group_N.txt,
+core/Round2_Results.txt, calculated_sha256.csv and
+Third_evaluation/Part3_Points.txt) from it.
+"""
+import os
+import csv
+import sqlite3
+import argparse
+
+DB_FILE = os.path.join('core', 'results.db')
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    tarball TEXT PRIMARY KEY,
+    student TEXT NOT NULL,
+    house TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    details TEXT NOT NULL,
+    notes TEXT
+);
+CREATE INDEX IF NOT EXISTS students_student ON students (student);
+CREATE INDEX IF NOT EXISTS students_house ON students (house);
+
+CREATE TABLE IF NOT EXISTS builds (
+    tarball TEXT NOT NULL,
+    warrior INTEGER NOT NULL,
+    ok INTEGER NOT NULL,
+    cpu REAL,
+    maxrss_kb INTEGER,
+    PRIMARY KEY (tarball, warrior)
+);
+
+CREATE TABLE IF NOT EXISTS warriors (
+    house TEXT NOT NULL,
+    tarball TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (house, tarball)
+);
+
+CREATE TABLE IF NOT EXISTS battles (
+    round TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    pair INTEGER NOT NULL,
+    warrior1 TEXT NOT NULL,
+    warrior2 TEXT NOT NULL,
+    result TEXT,
+    winner TEXT,
+    log TEXT,
+    PRIMARY KEY (round, unit, pair)
+);
+CREATE INDEX IF NOT EXISTS battles_warrior1 ON battles (warrior1);
+CREATE INDEX IF NOT EXISTS battles_warrior2 ON battles (warrior2);
+
+CREATE TABLE IF NOT EXISTS group_members (
+    unit INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    member TEXT NOT NULL,
+    house TEXT NOT NULL,
+    PRIMARY KEY (unit, position)
+);
+
+CREATE TABLE IF NOT EXISTS house_points (
+    round TEXT NOT NULL,
+    house TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    PRIMARY KEY (round, house)
+);
+"""
+
+# Rounds of house points, in leaderboard order. 'round2' and 'swiss' are
+# alternative scorings of Round 2 (--mode groups or swiss), so there is no
+# single total across them.
+ROUNDS = ['round2', 'swiss', 'part3']
+
+def house_key(house):
+    house = str(house)
+    return (0, int(house), house) if house.isdigit() else (1, 0, house)
+
+class ResultsStore:
+    def __init__(self, path=DB_FILE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.pending = 0
+
+    def _write(self, sql, rows):
+        self.db.executemany(sql, rows)
+        self.pending += len(rows)
+        if self.pending >= BATCH_SIZE:
+            self.commit()
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+    # First evaluation
+
+    def record_student(self, tarball, student, house, total, details):
+        # An upsert keeps the row where it was, like compact_outputs.
+        self._write("INSERT INTO students (tarball, student, house, total, details) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (tarball) DO UPDATE SET student = excluded.student, house = excluded.house, "
+                    "total = excluded.total, details = excluded.details, notes = NULL",
+                    [(tarball, student, str(house), total, details)])
+
+    def record_notes(self, student, notes):
+        self._write("UPDATE students SET notes = ? WHERE student = ?", [("\n".join(notes), student)])
+
+    def record_grading(self, tarball, student, facts):
+        """Store the builds and basic-warrior battles of one grading, from
+        the facts First_evaluation collects: {'builds': [(warrior, ok, usage)],
+        'battles': [(warrior, basic, result)]}."""
+        self.db.execute("DELETE FROM builds WHERE tarball = ?", (tarball,))
+        self.db.execute("DELETE FROM battles WHERE round = 'first' AND unit = ?", (tarball,))
+        self._write("INSERT INTO builds VALUES (?, ?, ?, ?, ?)",
+                    [(tarball, w, int(ok), (usage or {}).get('cpu'), (usage or {}).get('maxrss_kb'))
+                     for w, ok, usage in facts.get('builds', [])])
+        self._write("INSERT INTO battles VALUES ('first', ?, ?, ?, ?, ?, NULL, NULL)",
+                    [(tarball, i, f"{student}/warrior{w}", basic, result)
+                     for i, (w, basic, result) in enumerate(facts.get('battles', []))])
+
+    # Hash calculator
+
+    def record_warriors(self, rows):
+        """Replace the warrior hashes with calculated_sha256.csv's rows."""
+        self.db.execute("DELETE FROM warriors")
+        self._write("INSERT OR REPLACE INTO warriors VALUES (?, ?, ?)", [tuple(map(str, r[:3])) for r in rows])
+        self.commit()
+
+    def warriors(self):
+        return self.db.execute("SELECT house, tarball, value FROM warriors ORDER BY rowid").fetchall()
+
+    # Second evaluation
+
+    def record_group(self, round_name, unit, members, matches):
+        """members: [(id, house)]; matches: [(A id, B id, log text, winner id or None)]."""
+        unit = str(unit)
+        self.db.execute("DELETE FROM battles WHERE round = ? AND unit = ?", (round_name, unit))
+        if round_name == 'groups':
+            self.db.execute("DELETE FROM group_members WHERE unit = ?", (int(unit),))
+            self._write("INSERT INTO group_members VALUES (?, ?, ?, ?)",
+                        [(int(unit), i, m, str(h)) for i, (m, h) in enumerate(members)])
+        self._write("INSERT INTO battles VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(round_name, unit, i, a, b, result_of(text), winner, text)
+                     for i, (a, b, text, winner) in enumerate(matches)])
+
+    def set_house_points(self, round_name, points):
+        """points: {house: points} for one round ('round2', 'swiss' or 'part3')."""
+        self.db.execute("DELETE FROM house_points WHERE round = ?", (round_name,))
+        self._write("INSERT INTO house_points VALUES (?, ?, ?)",
+                    [(round_name, str(h), p) for h, p in points.items()])
+        self.commit()
+
+    # Queries
+
+    def house_points(self, round_name):
+        rows = self.db.execute("SELECT house, points FROM house_points WHERE round = ?", (round_name,))
+        return dict(sorted(rows, key=lambda r: house_key(r[0])))
+
+    def leaderboard(self):
+        """[(house, {round: points})] for every house with points in any round."""
+        table = {}
+        for rnd, house, pts in self.db.execute("SELECT round, house, points FROM house_points"):
+            table.setdefault(house, {})[rnd] = pts
+        return sorted(table.items(), key=lambda r: house_key(r[0]))
+
+    def student(self, name):
+        """Everything stored about one student, or None. A student only seen
+        in Round 2 has just its battles."""
+        row = self.db.execute("SELECT tarball, house, total, details, notes FROM students WHERE student = ?",
+                              (name,)).fetchone()
+        tarball, house, total, details, notes = row or (None, None, None, None, None)
+        # Round 2 names players "{student}_{house}": a range over the index
+        # finds them without knowing the house.
+        lo, hi = name + "_", name + "`"
+        battles = self.db.execute(
+            "SELECT round, unit, warrior1, warrior2, result, winner FROM battles "
+            "WHERE (round = 'first' AND unit = ?) "
+            "OR (round != 'first' AND ((warrior1 >= ? AND warrior1 < ?) OR (warrior2 >= ? AND warrior2 < ?))) "
+            "ORDER BY round, CAST(unit AS INTEGER), unit, pair", (tarball, lo, hi, lo, hi)).fetchall()
+        battles = [b for b in battles if b[0] == 'first' or name in
+                   (b[2].rsplit('_', 1)[0], b[3].rsplit('_', 1)[0])]
+        if row is None and not battles:
+            return None
+        warrior = self.db.execute("SELECT value FROM warriors WHERE tarball = ?", (tarball,)).fetchone()
+        return {
+            'tarball': tarball, 'house': house, 'total': total, 'details': details, 'notes': notes,
+            'builds': self.db.execute("SELECT warrior, ok, cpu, maxrss_kb FROM builds WHERE tarball = ? "
+                                      "ORDER BY warrior", (tarball,)).fetchall(),
+            'warrior2': warrior[0] if warrior else None,
+            'battles': battles,
+        }
+
+    # Legacy files
+
+    def export(self, root='.'):
+        """Write the legacy result files under root; return the paths written."""
+        written = []
+        def path(*parts):
+            p = os.path.join(root, *parts)
+            os.makedirs(os.path.dirname(p), exist_ok=True)
+            written.append(p)
+            return p
+
+        students = self.db.execute("SELECT tarball, student, house, total, details, notes FROM students "
+                                   "ORDER BY rowid").fetchall()
+        if students:
+            with open(path('final_results.csv'), 'w', newline='') as f:
+                w = csv.writer(f)
+                w.writerow(['House number', 'tarfilename', 'Total Score'])
+                w.writerows((house, tarball, total) for tarball, _, house, total, _, _ in students)
+            for _, student, _, total, details, notes in students:
+                with open(path('core', 'individual_scores', f"{student}_Score.txt"), 'w') as f:
+                    f.write(f"{student} - Total Score: {total}\n")
+                    if details:
+                        f.write("Details:\n")
+                        f.write(details)
+                    if notes:
+                        f.write("\nSimilar warriors:\n" + notes + "\n")
+
+        members = {}
+        for unit, member, house in self.db.execute("SELECT unit, member, house FROM group_members "
+                                                   "ORDER BY unit, position"):
+            members.setdefault(unit, []).append((member, house))
+        for unit, group in members.items():
+            houses = dict(group)
+            scores = {str(h): 0 for h in range(1, 5)}
+            with open(path('Battle_Results', f"group_{unit}.txt"), 'w') as f:
+                f.write("Group Members:\n")
+                f.writelines(m + "\n" for m, _ in group)
+                f.write("\nMatches (second warrior only):\n")
+                for log, winner in self.db.execute("SELECT log, winner FROM battles WHERE round = 'groups' "
+                                                   "AND unit = ? ORDER BY pair", (str(unit),)):
+                    f.write(log)
+                    if winner:
+                        scores[houses[winner]] = scores.get(houses[winner], 0) + 1
+                f.write("\nGroup Scores:\n")
+                f.writelines(f"House {h}: {scores[h]}\n" for h in sorted(scores, key=house_key))
+
+        for round_name, parts in [('round2', ('core', 'Round2_Results.txt')),
+                                  ('swiss', ('core', 'Round2_Swiss_Results.txt')),
+                                  ('part3', ('Third_evaluation', 'Part3_Points.txt'))]:
+            points = self.house_points(round_name)
+            if points:
+                # Round 2 files are sorted by their "House N" text, Part 3 by house number.
+                houses = sorted(points, key=(lambda h: f"House {h}") if round_name != 'part3' else house_key)
+                with open(path(*parts), 'w') as f:
+                    f.writelines(f"House {h} - {points[h]}\n" for h in houses)
+
+        warriors = self.warriors()
+        if warriors:
+            with open(path('calculated_sha256.csv'), 'w', newline='') as f:
+                csv.writer(f).writerows(warriors)
+        return written
+
+def result_of(log):
+    """The 'Results: W L T' line in a match log, if there is one."""
+    for line in (log or "").splitlines():
+        for word in ('results:', 'result:'):
+            at = line.lower().find(word)
+            if at >= 0:
+                return line[at:]
+    return None
+
+def open_store(path=DB_FILE):
+    """ResultsStore at path, or None (with a message) if it cannot be opened."""
+    try:
+        return ResultsStore(path)
+    except sqlite3.Error as e:
+        print(f"Not recording results in {path}: {e}")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or export the results database.")
+    parser.add_argument('--db', default=DB_FILE, help=f"database file (default: {DB_FILE})")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('leaderboard', help="house points of every round, one column per round")
+    st = sub.add_parser('student', help="everything stored about one student")
+    st.add_argument('name')
+    ex = sub.add_parser('export', help="write the legacy txt/csv result files")
+    ex.add_argument('--dir', default='.', help="folder to write them under (default: current folder)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"No results database at {args.db}")
+        return 1
+    store = ResultsStore(args.db)
+    if args.command == 'leaderboard':
+        rows = store.leaderboard()
+        rounds = [r for r in ROUNDS if any(r in pts for _, pts in rows)]
+        print(f"{'house':<8}" + "".join(f"{r:>12}" for r in rounds))
+        for house, pts in rows:
+            print(f"{house:<8}" + "".join(f"{pts.get(r, '-'):>12}" for r in rounds))
+    elif args.command == 'student':
+        info = store.student(args.name)
+        if info is None:
+            print(f"No student {args.name}")
+            return 1
+        if info['tarball']:
+            print(f"{args.name} (House {info['house']}, {info['tarball']}) - Total Score: {info['total']}")
+        else:
+            print(f"{args.name} has no First evaluation grade")
+        for w, ok, cpu, rss in info['builds']:
+            print(f"Warrior{w} build: {'ok' if ok else 'timed out'}, {cpu or 0:.2f}s CPU, {(rss or 0) // 1024} MiB")
+        print(f"Warrior2 sha256: {info['warrior2'] or 'not calculated'}")
+        for rnd, unit, w1, w2, result, winner in info['battles']:
+            where = "First evaluation" if rnd == 'first' else f"{rnd} {unit}"
+            print(f"{where}: {w1} vs {w2}: {result or 'no result'}" + (f" -> {winner}" if winner else ""))
+        if info['notes']:
+            print("Similar warriors:\n" + info['notes'])
+    else:
+        for p in store.export(args.dir):
+            print(f"Wrote {p}")
+    store.close()
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
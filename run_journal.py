@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Write-ahead journal of completed work, so an interrupted run can resume.
+
+A journal is a JSON-lines file. Its first line is a header describing the
+run (seed, inputs, settings); every later line records one finished unit
+of work and is written before that work's results are applied to the
+output files. A run given --resume reads the journal back with load(),
+checks the header still describes the same run and skips the units
+already done.
+
+Lines are flushed as they are written, so nothing is lost if the process
+dies, and fsynced every SYNC_EVERY lines and on close, so a reboot loses at
+most that much work. A line cut short by the crash is dropped on load.
+"""
+import os
+import json
+
+SYNC_EVERY = 16
+
+def load(path):
+    """Return (header, entries, size of the intact part) of the journal at
+    path, or (None, [], 0) if there is none."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None, [], 0
+    records, good = [], 0
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            break
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            break
+        good += len(line)
+    if not records:
+        return None, [], 0
+    return records[0], records[1:], good
+
+def same_run(old_header, header):
+    """True if old_header, as read by load(), is the header a journal for
+    this run would be started with."""
+    return old_header is not None and old_header == json.loads(json.dumps(header))
+
+class RunJournal:
+    def __init__(self, path, header, keep=None):
+        """Start a new journal at path, or with keep (the size returned by
+        load) append to the existing one after its intact part."""
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if keep:
+            self.f = open(path, 'r+b')
+            self.f.truncate(keep)
+            self.f.seek(keep)
+            self.pending = 0
+        else:
+            self.f = open(path, 'wb')
+            self.pending = 0
+            self.append(header)
+            self.sync()
+
+    def append(self, entry):
+        self.f.write((json.dumps(entry, sort_keys=True) + "\n").encode())
+        self.f.flush()
+        self.pending += 1
+        if self.pending >= SYNC_EVERY:
+            self.sync()
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.pending = 0
+
+    def close(self):
+        if not self.f.closed:
+            self.sync()
+            self.f.close()
+
+    def remove(self):
+        """Close and delete the journal once the run's outputs are complete."""
+        self.close()
+        os.remove(self.path)
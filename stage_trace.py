@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""Per-stage timing for grading runs.
+
+With tracing on (--trace in the evaluation scripts, or GRADING_TRACE=path
+in the environment), every traced stage appends one JSON line to the
+trace file: stage name, student, pid, thread, start time, wall seconds,
+CPU seconds of the process and its finished children, the children's
+peak RSS and, for battles, the rounds played and rounds per second.
+Worker processes inherit the setting through the environment and append
+to the same file.
+
+CPU time is per process, so stages that overlap inside one process (the
+two builds, battles running side by side) each see the CPU of both; make
+reports its own usage from wait4 instead.
+
+    python3 stage_trace.py [core/trace.jsonl] [--top 10] [--chrome trace.json]
+
+prints p50/p95 per stage and the slowest students, and --chrome writes a
+trace-event file that chrome://tracing or Perfetto shows as a flame chart.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+
+TRACE_FILE = os.path.join('core', 'trace.jsonl')
+ENV_VAR = 'GRADING_TRACE'
+# The stage that covers everything done for one student.
+STUDENT_STAGE = 'grade'
+
+_student = None
+
+def configure(path):
+    """Start a new trace at path (None turns tracing off), here and in every
+    process started from now on."""
+    if path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        open(path, 'w').close()
+        os.environ[ENV_VAR] = path
+    else:
+        os.environ.pop(ENV_VAR, None)
+
+def enabled():
+    return bool(os.environ.get(ENV_VAR))
+
+def set_student(name):
+    """Label the following events of this process with name."""
+    global _student
+    _student = name
+
+def _write(event):
+    line = (json.dumps(event, sort_keys=True) + "\n").encode()
+    # One write on an O_APPEND descriptor, so lines from several processes
+    # do not interleave.
+    fd = os.open(os.environ[ENV_VAR], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+def _cpu():
+    me = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return me.ru_utime + me.ru_stime + kids.ru_utime + kids.ru_stime, kids.ru_maxrss
+
+def record(stage, start, wall, student=None, **fields):
+    """Write one event for a stage that started at time.time() start and took
+    wall seconds. fields may set 'rounds', 'cpu', 'child_maxrss_kb' or
+    anything else worth keeping."""
+    if not enabled():
+        return
+    event = {'stage': stage, 'student': student or _student, 'pid': os.getpid(),
+             'tid': threading.get_ident(), 'start': start, 'wall': wall}
+    event.update(fields)
+    if event.get('rounds') and wall > 0:
+        event['rounds_per_sec'] = event['rounds'] / wall
+    _write(event)
+
+@contextmanager
+def span(stage, student=None, **fields):
+    """Time the enclosed block as one stage. The yielded dict can be filled
+    in with more fields (e.g. rounds) before the block ends."""
+    if not enabled():
+        yield fields
+        return
+    start, t0 = time.time(), time.perf_counter()
+    cpu0, _ = _cpu()
+    try:
+        yield fields
+    finally:
+        wall = time.perf_counter() - t0
+        cpu1, maxrss = _cpu()
+        measured = {'cpu': cpu1 - cpu0, 'child_maxrss_kb': maxrss}
+        measured.update(fields)
+        record(stage, start, wall, student, **measured)
+
+def add_trace_args(parser):
+    parser.add_argument('--trace', nargs='?', const=TRACE_FILE, default=None,
+                        help=f"write per-stage timings as JSON lines (default file: {TRACE_FILE}) "
+                             f"and print a summary at the end")
+
+def report(top=10):
+    """Print the summary of the current trace, if tracing is on."""
+    if enabled():
+        print("\nStage timings:")
+        print("\n".join(summary(load(os.environ[ENV_VAR]), top)))
+
+def result_rounds(line):
+    """Rounds played according to a 'Results: W L T' line, or None."""
+    parts = (line or "").split()
+    try:
+        return int(parts[1]) + int(parts[2]) + int(parts[3])
+    except (IndexError, ValueError):
+        return None
+
+def load(path):
+    events = []
+    with open(path) as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                pass
+    return events
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def summary(events, top=10):
+    """Return the report as a list of lines."""
+    by_stage = defaultdict(list)
+    for e in events:
+        by_stage[e['stage']].append(e)
+    lines = [f"{'stage':<16}{'count':>7}{'total s':>10}{'p50 s':>9}{'p95 s':>9}{'max s':>9}{'cpu s':>9}{'rounds/s':>10}"]
+    for stage in sorted(by_stage, key=lambda s: -sum(e['wall'] for e in by_stage[s])):
+        es = by_stage[stage]
+        walls = [e['wall'] for e in es]
+        rounds = sum(e.get('rounds') or 0 for e in es)
+        rate = f"{rounds / sum(walls):.0f}" if rounds and sum(walls) else "-"
+        lines.append(f"{stage:<16}{len(es):>7}{sum(walls):>10.2f}{percentile(walls, 0.5):>9.3f}"
+                     f"{percentile(walls, 0.95):>9.3f}{max(walls):>9.3f}"
+                     f"{sum(e.get('cpu') or 0 for e in es):>9.2f}{rate:>10}")
+
+    per_student = defaultdict(lambda: defaultdict(float))
+    for e in events:
+        if e.get('student'):
+            per_student[e['student']][e['stage']] += e['wall']
+    if per_student:
+        def total(s):
+            stages = per_student[s]
+            return stages.get(STUDENT_STAGE, sum(stages.values()))
+        lines.append("")
+        lines.append(f"Slowest {min(top, len(per_student))} students:")
+        for s in sorted(per_student, key=lambda s: -total(s))[:top]:
+            parts = ", ".join(f"{k} {v:.2f}s" for k, v in sorted(per_student[s].items(), key=lambda kv: -kv[1])
+                              if k != STUDENT_STAGE)
+            lines.append(f"{s:<24}{total(s):>9.2f}s  {parts}")
+    return lines
+
+def chrome_trace(events):
+    """Trace-event format: one complete ('X') event per stage."""
+    t0 = min((e['start'] for e in events), default=0)
+    out = []
+    for e in events:
+        args = {k: v for k, v in e.items() if k not in ('stage', 'pid', 'tid', 'start', 'wall')}
+        out.append({'name': e['stage'], 'cat': e['stage'], 'ph': 'X',
+                    'ts': (e['start'] - t0) * 1e6, 'dur': e['wall'] * 1e6,
+                    'pid': e['pid'], 'tid': e['tid'], 'args': args})
+    return {'traceEvents': out, 'displayTimeUnit': 'ms'}
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a grading trace.")
+    parser.add_argument('trace', nargs='?', default=TRACE_FILE,
+                        help=f"trace file (default: {TRACE_FILE})")
+    parser.add_argument('--top', type=int, default=10, help="slowest students to list (default: 10)")
+    parser.add_argument('--chrome', help="also write a Chrome trace-event file here")
+    args = parser.parse_args()
+
+    try:
+        events = load(args.trace)
+    except OSError as e:
+        print(f"Error reading trace {args.trace}: {e}")
+        sys.exit(1)
+    print("\n".join(summary(events, args.top)))
+    if args.chrome:
+        with open(args.chrome, 'w') as f:
+            json.dump(chrome_trace(events), f)
+        print(f"Wrote {len(events)} events to {args.chrome}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""mars.py against mars_numpy and, where it is installed, pmars."""
+import os
+import glob
+import shutil
+import itertools
+
+import pytest
+
+import mars
+import mars_conformance
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASIC = sorted(glob.glob(os.path.join(ROOT, mars_conformance.BASIC_DIR, '*.red')))
+PAIRS = list(itertools.permutations(BASIC, 2))
+# basic2 and basic3 tie every round at the cycle limit, which takes
+# mars_numpy's lockstep loop far longer than the other pairs.
+QUICK_PAIRS = [p for p in PAIRS if 'basic1.red' in map(os.path.basename, p)]
+ROUNDS = 10
+
+needs_pmars = pytest.mark.skipif(not shutil.which('pmars'), reason="pmars is not installed")
+
+def test_basic_warriors_found():
+    assert len(BASIC) == 3
+
+@pytest.mark.parametrize('path', BASIC, ids=os.path.basename)
+def test_basic_warriors_validate(path):
+    valid, output = mars.validate(path)
+    assert valid, output
+
+@pytest.mark.parametrize('w1, w2', PAIRS, ids=lambda p: os.path.basename(p))
+def test_battle_is_reproducible(w1, w2):
+    assert mars.battle(w1, w2, ROUNDS, seed=7) == mars.battle(w1, w2, ROUNDS, seed=7)
+
+@pytest.mark.parametrize('w1, w2', QUICK_PAIRS, ids=lambda p: os.path.basename(p))
+def test_numpy_matches_mars(w1, w2):
+    mars_numpy = pytest.importorskip('mars_numpy')
+    expected = mars.battle(w1, w2, ROUNDS, seed=mars.DEFAULT_SEED)
+    assert mars_numpy.battle(w1, w2, ROUNDS, seed=mars.DEFAULT_SEED) == expected
+    assert sum(expected) == ROUNDS
+
+@pytest.mark.parametrize('w1, w2', QUICK_PAIRS, ids=lambda p: os.path.basename(p))
+def test_numpy_matches_mars_from_odd_round(w1, w2):
+    # Early-stop chunks continue the turns to move first from first_round.
+    mars_numpy = pytest.importorskip('mars_numpy')
+    expected = mars.battle(w1, w2, 5, seed=3, first_round=1)
+    assert mars_numpy.battle(w1, w2, 5, seed=3, first_round=1) == expected
+
+@needs_pmars
+@pytest.mark.parametrize('path', BASIC, ids=os.path.basename)
+def test_validation_matches_pmars(path):
+    assert mars_conformance.check_validation(path)
+
+@needs_pmars
+@pytest.mark.parametrize('pos', mars_conformance.POSITIONS)
+@pytest.mark.parametrize('w1, w2', PAIRS, ids=lambda p: os.path.basename(p))
+def test_battle_matches_pmars(w1, w2, pos):
+    assert mars_conformance.check_battle(w1, w2, pos)
@@ -0,0 +1,81 @@
+"""results_store: upserts, house points and the legacy export."""
+import os
+import csv
+
+import pytest
+
+import results_store
+
+@pytest.fixture
+def store(tmp_path):
+    store = results_store.ResultsStore(str(tmp_path / 'results.db'))
+    yield store
+    store.close()
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.reader(f))
+
+def test_record_student_upsert_keeps_position(store):
+    store.record_student('alice.tar.gz', 'alice', 1, 10, "a\n")
+    store.record_student('bob.tar.gz', 'bob', 2, 20, "b\n")
+    store.record_notes('alice', ["alice and bob: 0.9"])
+    store.record_student('alice.tar.gz', 'alice', 3, 30, "a2\n")
+    rows = store.db.execute("SELECT tarball, house, total, details, notes FROM students "
+                            "ORDER BY rowid").fetchall()
+    assert rows == [('alice.tar.gz', '3', 30, "a2\n", None), ('bob.tar.gz', '2', 20, "b\n", None)]
+
+def test_student_query(store):
+    store.record_student('alice.tar.gz', 'alice', 1, 10, "a\n")
+    store.record_grading('alice.tar.gz', 'alice', {'builds': [(1, True, {'cpu': 0.5, 'maxrss_kb': 2048})],
+                                                   'battles': [(1, 'basic1', 'Results: 1 0 0')]})
+    store.record_group('groups', 0, [('alice_1', '1'), ('bob_2', '2')],
+                       [('alice_1', 'bob_2', "Results: 1 0 0\n", 'alice_1')])
+    info = store.student('alice')
+    assert info['total'] == 10
+    assert info['builds'] == [(1, 1, 0.5, 2048)]
+    assert [b[0] for b in info['battles']] == ['first', 'groups']
+    assert store.student('carol') is None
+
+def test_leaderboard_by_round(store):
+    store.set_house_points('round2', {1: 5, 2: 3})
+    store.set_house_points('part3', {2: 7, 10: 1})
+    store.set_house_points('round2', {1: 6, 2: 3})
+    assert store.leaderboard() == [('1', {'round2': 6}), ('2', {'round2': 3, 'part3': 7}),
+                                   ('10', {'part3': 1})]
+    assert store.house_points('part3') == {'2': 7, '10': 1}
+
+def test_export_round_trip(store, tmp_path):
+    store.record_student('alice.tar.gz', 'alice', 1, 10, "Warrior1 ok\n")
+    store.record_student('bob.tar.gz', 'bob', 2, 20, "")
+    store.record_notes('alice', ["alice and bob: 0.9"])
+    store.record_warriors([('1', 'alice.tar.gz', 'ab12'), ('2', 'bob.tar.gz', 'cd34')])
+    store.record_group('groups', 3, [('alice_1', '1'), ('bob_2', '2'), ('eve_x', 'x')],
+                       [('alice_1', 'bob_2', "Results: 1 0 0\n", 'alice_1'),
+                        ('bob_2', 'eve_x', "Results: 0 1 0\n", 'eve_x')])
+    store.set_house_points('round2', {1: 1, 2: 0})
+    store.set_house_points('part3', {2: 4, 1: 2})
+    out = str(tmp_path / 'out')
+    written = store.export(out)
+    assert all(p.startswith(out) and os.path.exists(p) for p in written)
+
+    assert read_csv(os.path.join(out, 'final_results.csv')) == [
+        ['House number', 'tarfilename', 'Total Score'], ['1', 'alice.tar.gz', '10'], ['2', 'bob.tar.gz', '20']]
+    with open(os.path.join(out, 'core', 'individual_scores', 'alice_Score.txt')) as f:
+        assert f.read() == ("alice - Total Score: 10\nDetails:\nWarrior1 ok\n"
+                            "\nSimilar warriors:\nalice and bob: 0.9\n")
+    assert read_csv(os.path.join(out, 'calculated_sha256.csv')) == [['1', 'alice.tar.gz', 'ab12'],
+                                                                    ['2', 'bob.tar.gz', 'cd34']]
+    with open(os.path.join(out, 'Battle_Results', 'group_3.txt')) as f:
+        group = f.read()
+    assert group.startswith("Group Members:\nalice_1\nbob_2\neve_x\n")
+    assert group.endswith("House 1: 1\nHouse 2: 0\nHouse 3: 0\nHouse 4: 0\nHouse x: 1\n")
+    with open(os.path.join(out, 'core', 'Round2_Results.txt')) as f:
+        assert f.read() == "House 1 - 1\nHouse 2 - 0\n"
+    with open(os.path.join(out, 'Third_evaluation', 'Part3_Points.txt')) as f:
+        assert f.read() == "House 1 - 2\nHouse 2 - 4\n"
+    assert not os.path.exists(os.path.join(out, 'core', 'Round2_Swiss_Results.txt'))
+
+def test_result_of():
+    assert results_store.result_of("pmars\nResults: 3 1 496\n") == "Results: 3 1 496"
+    assert results_store.result_of("no battle") is None
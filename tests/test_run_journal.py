@@ -0,0 +1,66 @@
+"""run_journal: replaying an interrupted run's journal."""
+import os
+
+import run_journal
+
+HEADER = {'run': 'test', 'seed': 3, 'limits': [(0, 30)], 'houses': {'1': None}}
+
+def test_missing_journal(tmp_path):
+    assert run_journal.load(str(tmp_path / 'none.journal')) == (None, [], 0)
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'core' / 'run.journal')
+    journal = run_journal.RunJournal(path, HEADER)
+    journal.append({'unit': 1})
+    journal.append({'unit': 2, 'facts': [('a', 1)]})
+    journal.close()
+    header, entries, size = run_journal.load(path)
+    assert run_journal.same_run(header, HEADER)
+    assert entries == [{'unit': 1}, {'unit': 2, 'facts': [['a', 1]]}]
+    assert size == os.path.getsize(path)
+
+def test_same_run_after_json_round_trip():
+    # Tuples come back as lists; the header still describes the same run.
+    header = {'run': 'test', 'seed': 3, 'limits': [[0, 30]], 'houses': {'1': None}}
+    assert run_journal.same_run(header, HEADER)
+    assert not run_journal.same_run(dict(header, seed=4), HEADER)
+    assert not run_journal.same_run(None, HEADER)
+
+def test_torn_last_line_is_dropped(tmp_path):
+    path = str(tmp_path / 'run.journal')
+    journal = run_journal.RunJournal(path, HEADER)
+    journal.append({'unit': 1})
+    journal.close()
+    intact = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(b'{"unit": 2, "resu')
+    header, entries, size = run_journal.load(path)
+    assert entries == [{'unit': 1}]
+    assert size == intact
+
+def test_resume_appends_after_intact_part(tmp_path):
+    path = str(tmp_path / 'run.journal')
+    journal = run_journal.RunJournal(path, HEADER)
+    journal.append({'unit': 1})
+    journal.close()
+    with open(path, 'ab') as f:
+        f.write(b'{"unit": 2, "resu')
+    header, entries, keep = run_journal.load(path)
+    journal = run_journal.RunJournal(path, HEADER, keep)
+    journal.append({'unit': 2})
+    journal.close()
+    assert run_journal.load(path)[1] == [{'unit': 1}, {'unit': 2}]
+
+def test_garbage_line_ends_replay(tmp_path):
+    path = str(tmp_path / 'run.journal')
+    journal = run_journal.RunJournal(path, HEADER)
+    journal.append({'unit': 1})
+    journal.close()
+    with open(path, 'ab') as f:
+        f.write(b'not json\n{"unit": 3}\n')
+    assert run_journal.load(path)[1] == [{'unit': 1}]
+
+def test_remove(tmp_path):
+    path = str(tmp_path / 'run.journal')
+    run_journal.RunJournal(path, HEADER).remove()
+    assert not os.path.exists(path)
@@ -0,0 +1,47 @@
+"""Second_evaluation.WeightedSampler and the tracker it is built from."""
+import os
+import random
+from collections import Counter
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def second(monkeypatch):
+    # Second_evaluation reads Env_variables.csv from the working folder on import.
+    monkeypatch.chdir(ROOT)
+    import Second_evaluation
+    return Second_evaluation
+
+ENTRIES = [('ann', 3), ('bob', 1), ('cat', 0), ('dan', 5), ('eve', 2)]
+
+def test_draws_every_copy_once(second):
+    sampler = second.WeightedSampler(ENTRIES)
+    assert sampler.total == 11
+    rng = random.Random(1)
+    drawn = [sampler.draw(rng) for _ in range(11)]
+    assert Counter(drawn) == Counter({n: c for n, c in ENTRIES if c})
+    assert sampler.total == 0
+    assert sampler.draw(rng) is None
+
+def test_matches_line_per_copy_tracker(second):
+    # The old tracker picked rng.randrange(len(lines)) and removed that line.
+    for seed in range(20):
+        lines = [n for n, c in ENTRIES for _ in range(c)]
+        old_rng, new_rng = random.Random(seed), random.Random(seed)
+        expected = [lines.pop(old_rng.randrange(len(lines))) for _ in range(len(lines))]
+        sampler = second.WeightedSampler(ENTRIES)
+        assert [sampler.draw(new_rng) for _ in expected] == expected
+
+def test_empty_sampler(second):
+    sampler = second.WeightedSampler([])
+    assert sampler.total == 0
+    assert sampler.draw(random.Random(0)) is None
+
+def test_read_tracker_groups_runs(second, tmp_path, monkeypatch):
+    monkeypatch.setattr(second, 'SUBMISSIONS_DIR', str(tmp_path))
+    (tmp_path / 'House_2').mkdir()
+    (tmp_path / 'House_2' / 'Part_2_tracker.txt').write_text("ann\nann\n\nbob\nann\n")
+    assert second.read_tracker(2) == [('ann', 2), ('bob', 1), ('ann', 1)]
+    assert second.read_tracker(3) == []
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Assembled warriors, cached by the hash of their source.
+
+A warrior is assembled with mars.py once: its load-file form (name,
+author, start and the fully resolved instructions), or the error that
+stopped it from assembling, is kept under core/warrior_cache keyed by the
+sha256 of the source, the ROUNDS/WARRIORS it was assembled for and the
+assembler itself. Every later battle, validation or similarity check of
+the same source, in any process and any later run, reads that instead of
+parsing the Redcode again.
+
+pmars assembles with its own parser, so for pmars only the validation
+output is cached (keyed by the pmars binary as well); its battles still
+get the source files.
+"""
+import os
+import json
+import hashlib
+import functools
+
+import mars
+
+CACHE_DIR = os.path.join('core', 'warrior_cache')
+# Stands for the warrior's path in cached validation output, so a copy of
+# the same source elsewhere gets messages naming its own file.
+PATH_MARK = '\0path\0'
+
+stats = {'hits': 0, 'misses': 0}
+_memory = {}
+
+@functools.lru_cache(maxsize=None)
+def assembler_identity():
+    with open(os.path.abspath(mars.__file__), 'rb') as f:
+        return "mars:" + hashlib.sha256(f.read()).hexdigest()
+
+def _read(path):
+    """Return the source text of the warrior at path and its sha256."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    return data.decode(errors='replace'), hashlib.sha256(data).hexdigest()
+
+def _key(source_sha, *parts):
+    return hashlib.sha256("\0".join((source_sha,) + tuple(map(str, parts))).encode()).hexdigest()
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, key[:2], key + ".json")
+
+def _lookup(key):
+    entry = _memory.get(key)
+    if entry is None:
+        try:
+            with open(_entry_path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            stats['misses'] += 1
+            return None
+        _memory[key] = entry
+    stats['hits'] += 1
+    return entry
+
+def _store(key, entry):
+    _memory[key] = entry
+    path = _entry_path(key)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Error writing warrior cache entry {key[:8]}: {e}")
+
+def assembled(path, rounds=1, warriors=2):
+    """Return (mars.Warrior, None), or (None, error message) if the source
+    does not assemble. Raises OSError if path cannot be read."""
+    text, sha = _read(path)
+    key = _key(sha, 'load', rounds, warriors, assembler_identity())
+    entry = _lookup(key)
+    if entry is None:
+        try:
+            w = mars.assemble(text, rounds, warriors)
+            entry = {'name': w.name, 'author': w.author, 'start': w.start,
+                     'instructions': w.instructions, 'error': None}
+        except mars.RedcodeError as e:
+            entry = {'error': str(e)}
+        _store(key, entry)
+    if entry['error'] is not None:
+        return None, entry['error']
+    return mars.Warrior(entry['name'], entry['author'],
+                        [tuple(i) for i in entry['instructions']], entry['start']), None
+
+def load(path, rounds=1, warriors=2):
+    """mars.load_warrior through the cache."""
+    warrior, error = assembled(path, rounds, warriors)
+    if warrior is None:
+        raise mars.RedcodeError(error)
+    return warrior
+
+def validate(path):
+    """mars.validate through the cache: (valid, output lines like pmars')."""
+    try:
+        w, error = assembled(path, warriors=1)
+    except OSError as e:
+        return False, [str(e)]
+    if w is None:
+        return False, [error]
+    return True, [f"{w.name} by {w.author} scores 0"]
+
+def validation_key(path, identity):
+    """Key for the validation of the warrior at path by identity (the engine
+    that validates it), or None if path cannot be read."""
+    try:
+        _, sha = _read(path)
+    except OSError:
+        return None
+    return _key(sha, 'validate', identity)
+
+def lookup_validation(key, path):
+    """Return the cached (valid, output lines) for key, or None on a miss."""
+    entry = _lookup(key) if key else None
+    if entry is None:
+        return None
+    return entry['valid'], [line.replace(PATH_MARK, path) for line in entry['output']]
+
+def store_validation(key, path, valid, output):
+    if key:
+        _store(key, {'valid': valid, 'output': [line.replace(path, PATH_MARK) for line in output]})
+
+def report():
+    print(f"Warrior cache: {stats['hits']} hits, {stats['misses']} misses")
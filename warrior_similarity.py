@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Find identical and near-identical warriors.
+
+Warriors are compared in canonical form: each file is assembled with the
+mars.py assembler, so comments, whitespace, label names, EQU constants and
+FOR/ROF loops no longer matter, and every instruction is written out with
+explicit modifier, modes and core-relative values. Files that do not
+assemble fall back to their source with comments and blank space removed.
+
+Similarity is the Jaccard index of the sets of SHINGLE consecutive
+canonical instructions, taken both with their values and without them so
+that an inserted instruction, which shifts every relative value pointing
+across it, still leaves the shape of the code to match. A MinHash
+signature per warrior and LSH banding turn the all-pairs comparison into
+roughly linear work: only warriors that share a band bucket are compared
+exactly.
+
+    python3 warrior_similarity.py [--threshold 0.8]
+
+scans every warrior1.red and chooseyourfighter.red under submissions/ and
+writes the matches to core/similarity_report.txt.
+"""
+import os
+import re
+import glob
+import random
+import hashlib
+import argparse
+from collections import defaultdict
+
+import mars
+import warrior_cache
+
+SUBMISSIONS_DIR = 'submissions'
+REPORT_FILE = os.path.join('core', 'similarity_report.txt')
+WARRIOR_FILES = ['warrior1.red', 'chooseyourfighter.red']
+SHINGLE = 3
+NUM_HASHES = 64
+BANDS = 16
+THRESHOLD = 0.8
+
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(mars.DEFAULT_SEED)
+_COEFFS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(_MERSENNE)) for _ in range(NUM_HASHES)]
+
+def _stripped_source(text):
+    lines = []
+    for line in text.splitlines():
+        line = line.split(';', 1)[0]
+        line = re.sub(r'\s+', ' ', line).strip().upper()
+        if line:
+            lines.append(line)
+    return lines
+
+def canonicalize(path):
+    """Return the warrior at path as a list of canonical instruction strings."""
+    try:
+        warrior, _ = warrior_cache.assembled(path)
+        if warrior is None:
+            with open(path, errors='replace') as f:
+                return _stripped_source(f.read())
+    except OSError:
+        return []
+    return [f"ORG {warrior.start}"] + [mars.disassemble(i) for i in warrior.instructions]
+
+def _shape(line):
+    # The instruction without its values: an inserted instruction shifts the
+    # relative values of everything that points across it, not the shapes.
+    return re.sub(r'-?\d+', '', line)
+
+def _hashed_runs(lines, tag):
+    width = min(SHINGLE, len(lines))
+    return {int.from_bytes(hashlib.blake2b((tag + "\n".join(lines[i:i + width])).encode(),
+                                           digest_size=8).digest(), 'big')
+            for i in range(len(lines) - width + 1)}
+
+def shingles(canonical):
+    """Hash every run of SHINGLE consecutive canonical lines, with and
+    without their values, to 64-bit ints."""
+    if not canonical:
+        return set()
+    return _hashed_runs(canonical, 'I:') | _hashed_runs([_shape(l) for l in canonical], 'S:')
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def similarity(path1, path2):
+    return jaccard(shingles(canonicalize(path1)), shingles(canonicalize(path2)))
+
+def minhash(shingle_set):
+    return tuple(min((a * s + b) % _MERSENNE for s in shingle_set) for a, b in _COEFFS)
+
+def find_similar(warriors, threshold=THRESHOLD):
+    """Return [(similarity, id1, id2)] for every pair of warriors ({id: path})
+    whose similarity is at least threshold, most similar first."""
+    canon = {wid: canonicalize(path) for wid, path in warriors.items()}
+    sets = {wid: shingles(c) for wid, c in canon.items() if c}
+    buckets = defaultdict(list)
+    rows = NUM_HASHES // BANDS
+    for wid, s in sets.items():
+        sig = minhash(s)
+        for band in range(BANDS):
+            buckets[(band, sig[band * rows:(band + 1) * rows])].append(wid)
+
+    candidates = set()
+    for members in buckets.values():
+        for i in range(len(members)):
+            for j in range(i + 1, len(members)):
+                candidates.add(tuple(sorted((members[i], members[j]))))
+
+    found = []
+    for a, b in candidates:
+        score = 1.0 if canon[a] == canon[b] else jaccard(sets[a], sets[b])
+        if score >= threshold:
+            found.append((score, a, b))
+    found.sort(key=lambda t: (-t[0], t[1], t[2]))
+    return found
+
+def submission_warriors(submissions_dir=SUBMISSIONS_DIR):
+    """Return {(student, warrior file): path} for every built warrior."""
+    warriors = {}
+    for folder in sorted(glob.glob(os.path.join(submissions_dir, 'House_*', '*'))):
+        student = os.path.basename(folder)
+        for name in WARRIOR_FILES:
+            path = os.path.join(folder, name)
+            if os.path.isfile(path) and os.path.getsize(path):
+                warriors[(student, name)] = path
+    return warriors
+
+def describe(pair):
+    score, (s1, f1), (s2, f2) = pair
+    kind = "identical" if score == 1.0 else "similar"
+    if s1 == s2:
+        return f"{s1}: {f1} and {f2} are {kind} ({score:.2f})"
+    return f"{s1}/{f1} and {s2}/{f2} are {kind} ({score:.2f})"
+
+def student_notes(pairs):
+    """{student: [line]} describing every match that involves the student."""
+    notes = defaultdict(list)
+    for pair in pairs:
+        _, (s1, _), (s2, _) = pair
+        for student in {s1, s2}:
+            notes[student].append(describe(pair))
+    return notes
+
+def main():
+    parser = argparse.ArgumentParser(description="Report identical and near-identical warriors.")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help=f"lowest similarity to report (default: {THRESHOLD})")
+    parser.add_argument('--report', default=REPORT_FILE,
+                        help=f"report file (default: {REPORT_FILE})")
+    args = parser.parse_args()
+
+    warriors = submission_warriors()
+    pairs = find_similar(warriors, args.threshold)
+    os.makedirs(os.path.dirname(args.report) or '.', exist_ok=True)
+    with open(args.report, 'w') as f:
+        f.write(f"{len(warriors)} warriors, {len(pairs)} pairs at similarity >= {args.threshold}\n")
+        for pair in pairs:
+            f.write(describe(pair) + "\n")
+    print(f"{len(pairs)} similar pairs among {len(warriors)} warriors → {args.report}")
+
+if __name__ == "__main__":
+    main()